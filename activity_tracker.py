@@ -0,0 +1,108 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))  # секунд между записями в БД
+ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", "500"))        # столько пользователей — пишем сразу
+
+
+@dataclass
+class ActivityStats:
+    touches: int = 0
+    coalesced: int = 0        # обновления, слившиеся с еще не записанными
+    flushes: int = 0
+    rows_flushed: int = 0
+    failures: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class ActivityTracker:
+    """
+    Write-behind для активности пользователей: touch() только обновляет словарь в памяти
+    (последняя запись на пользователя побеждает), фоновая задача раз в `interval` секунд
+    отдает накопленное одной пачкой в `flush_fn` (bulk upsert).
+    При ошибке записи строки возвращаются в очередь; stop() дописывает остаток.
+    """
+
+    def __init__(self, flush_fn: Callable[[List[Dict]], Awaitable[int]],
+                 interval: float = ACTIVITY_FLUSH_INTERVAL, max_pending: int = ACTIVITY_MAX_PENDING):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self.stats = ActivityStats()
+        self._pending: Dict[int, Dict] = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def touch(self, telegram_id: int, username: Optional[str], full_name: Optional[str]):
+        self.stats.touches += 1
+        if telegram_id in self._pending:
+            self.stats.coalesced += 1
+        self._pending[telegram_id] = {
+            "id": telegram_id,
+            "username": username,
+            "full_name": full_name,
+            "last_active": datetime.utcnow(),
+        }
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            try:
+                await self.flush_fn(list(batch.values()))
+            except BaseException:
+                # Ошибка или отмена посреди записи (stop()): возвращаем в очередь,
+                # не затирая более свежие touch() за время записи
+                self.stats.failures += 1
+                for telegram_id, row in batch.items():
+                    self._pending.setdefault(telegram_id, row)
+                raise
+            self.stats.flushes += 1
+            self.stats.rows_flushed += len(batch)
+            return len(batch)
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Activity flush failed, will retry: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Останавливает фоновую запись и дописывает все накопленное (graceful shutdown)."""
+        if self._task is not None:
+            # Не отменяем задачу: запись, идущая прямо сейчас, должна завершиться
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"Activity tracker stopped: {self.stats.as_dict()}")
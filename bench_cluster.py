@@ -0,0 +1,129 @@
+"""
+Нагрузочный тест кластера: пропускная способность (сообщений/сек) при 1, 2, 4... воркерах.
+
+Воркеры — настоящие процессы с WebhookServer и графом engine (LLM и поиск замоканы, как в
+bench_graph.py, чекпоинтер — MemorySaver), апдейты раскладывает ShardRouter по user id.
+Без --llm-latency каждое сообщение — чистый CPU графа, т.е. упираемся ровно в один event loop.
+
+    python bench_cluster.py --workers 1,2,4 --messages 2000 --users 200
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import aiohttp
+
+from cluster import WorkerPool
+from sharding import ShardRouter
+
+
+# --- WORKER (подпроцесс) ---
+
+async def run_worker(llm_latency: float):
+    os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+    from aiogram import Bot, Dispatcher, types
+    from langchain_core.messages import HumanMessage, AIMessage
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.checkpoint.memory import MemorySaver
+
+    import engine
+    from webhook import run_webhook
+
+    async def mock_llm_call(role, context, user_query=""):
+        if llm_latency:
+            await asyncio.sleep(llm_latency)
+        if role == "ORCHESTRATOR": return "SOLVER"
+        return f"{role} mock"
+
+    engine.call_llm_async = mock_llm_call
+    engine.search.invoke = lambda q: "Mock Search Results"
+    engine.llm = RunnableLambda(lambda x: AIMessage(content="**VERDICT**"))
+
+    memory = MemorySaver()
+    graph = engine.graph_registry.get(checkpointer=memory)
+    locks = {}
+    dp = Dispatcher()
+
+    @dp.message()
+    async def on_message(message: types.Message):
+        thread_id = str(message.from_user.id)
+        config = {"configurable": {"thread_id": thread_id}}
+        async with locks.setdefault(thread_id, asyncio.Lock()):
+            async for _ in graph.astream({"messages": [HumanMessage(content=message.text)],
+                                          "user_query": message.text}, config, stream_mode="values"):
+                pass
+
+    bot = Bot(token="123456:BENCH-TOKEN-NOT-USED")
+    await run_webhook(dp, bot)
+
+
+# --- DRIVER ---
+
+def make_update(i: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    return {"update_id": i, "message": {"message_id": i, "date": 1760000000, "text": f"Как монетизировать бота #{i}?",
+                                        "chat": {**user, "type": "private"}, "from": user}}
+
+
+async def processed(session: aiohttp.ClientSession, urls) -> int:
+    total = 0
+    for url in urls:
+        async with session.get(url.replace("/webhook", "/readyz")) as resp:
+            total += (await resp.json())["processed"]
+    return total
+
+
+async def run_load(workers: int, messages: int, users: int, concurrency: int, llm_latency: float) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--llm-latency", str(llm_latency)]
+    pool = WorkerPool(workers, command=command, secret="bench",
+                      env={"HISTORY_COMPACTION": "0", "WEBHOOK_QUEUE_SIZE": str(messages)})
+    await pool.start()
+    router = ShardRouter(pool.urls, worker_secret=pool.secret)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i: int):
+        async with semaphore:
+            while await router.forward(make_update(i, 1000 + i % users)) == 503:
+                await asyncio.sleep(0.05)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(send(i) for i in range(messages)))
+            while await processed(session, pool.urls) < messages:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - start
+    finally:
+        await router.aclose()
+        await pool.stop()
+    return {"workers": workers, "messages": messages, "users": users, "seconds": round(elapsed, 2),
+            "msgs_per_sec": round(messages / elapsed, 1), "per_worker": router.stats.per_worker}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput vs. number of bot workers")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных POST от роутера")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="имитация задержки LLM, секунд на вызов")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        await run_worker(args.llm_latency)
+        return
+
+    baseline = None
+    for n in (int(w) for w in args.workers.split(",")):
+        result = await run_load(n, args.messages, args.users, args.concurrency, args.llm_latency)
+        baseline = baseline or result["msgs_per_sec"]
+        result["scaling"] = round(result["msgs_per_sec"] / baseline, 2)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
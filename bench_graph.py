@@ -0,0 +1,65 @@
+"""
+Микро-бенчмарк: задержка на одно сообщение при сборке графа на каждый запрос
+(старое поведение bot.handle_message) и при использовании engine.graph_registry.
+
+LLM и поиск замоканы, поэтому измеряется только накладной расход самого графа.
+
+    python bench_graph.py [N]
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import engine
+
+
+async def mock_llm_call(role, context, user_query=""):
+    if role == "ORCHESTRATOR": return "SOLVER"
+    return f"{role} mock"
+
+engine.call_llm_async = mock_llm_call
+engine.search.invoke = lambda q: "Mock Search Results"
+engine.llm = RunnableLambda(lambda x: AIMessage(content="**VERDICT**"))
+
+
+async def run_messages(get_graph_fn, n: int):
+    memory = MemorySaver()
+    timings = []
+    for i in range(n):
+        query = f"Как монетизировать телеграм бота #{i}?"
+        start = time.perf_counter()
+        graph = get_graph_fn(memory)
+        config = {"configurable": {"thread_id": f"bench_{i % 10}"}}
+        async for _ in graph.astream({"messages": [HumanMessage(content=query)], "user_query": query},
+                                     config, stream_mode="values"):
+            pass
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<22} mean={statistics.mean(timings):7.2f}ms  p50={statistics.median(timings):7.2f}ms  p95={p95:7.2f}ms")
+
+
+async def main(n: int):
+    print(f"--- {n} сообщений на вариант ---")
+    before = await run_messages(lambda cp: engine.get_graph(checkpointer=cp), n)
+    engine.graph_registry.rebuild()
+    after = await run_messages(lambda cp: engine.graph_registry.get(checkpointer=cp), n)
+    report("get_graph (before)", before)
+    report("graph_registry (after)", after)
+    print(f"speedup: x{statistics.mean(before) / statistics.mean(after):.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,62 @@
+"""
+Бенчмарк роста чекпоинта: размер строки чекпоинта и время ее сериализации
+по ходам диалога одного пользователя — со сжатием истории (node_compact) и без.
+
+LLM и поиск замоканы; время сериализации — нижняя оценка записи в Postgres.
+
+    python bench_history.py [N]
+"""
+import os
+import sys
+import time
+import asyncio
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import engine
+
+
+async def mock_llm_call(role, context, user_query=""):
+    if role == "ORCHESTRATOR": return "SOLVER"
+    if role == "SUMMARIZER": return "Сводка: пользователь масштабирует продажи. " * 5
+    return f"{role}: " + "развернутый ответ солвера " * 10
+
+engine.call_llm_async = mock_llm_call
+engine.search.invoke = lambda q: "Mock Search Results " * 20
+engine.llm = RunnableLambda(lambda x: AIMessage(content="**VERDICT** " + "итоговое решение " * 30))
+
+
+def measure(memory: MemorySaver, config) -> tuple:
+    values = memory.get_tuple(config).checkpoint["channel_values"]
+    start = time.perf_counter()
+    size = sum(len(memory.serde.dumps_typed(v)[1]) for v in values.values())
+    return size, (time.perf_counter() - start) * 1000
+
+
+async def run(n: int, compact: bool):
+    memory = MemorySaver()
+    graph = engine.get_graph(checkpointer=memory, fast_path=False, cached=False, compact=compact)
+    config = {"configurable": {"thread_id": "bench"}}
+    rows = []
+    for i in range(n):
+        query = f"Ход {i}: как масштабировать продажи без потери качества?"
+        await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query}, config)
+        rows.append(measure(memory, config))
+    return rows
+
+
+async def main(n: int):
+    for compact in (False, True):
+        rows = await run(n, compact)
+        print(f"--- compact={compact} ---")
+        for turn in sorted({1, n // 4, n // 2, n}):
+            size, ms = rows[turn - 1]
+            print(f"turn {turn:>4}: checkpoint={size / 1024:8.1f}KB  serialize={ms:6.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
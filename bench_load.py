@@ -0,0 +1,222 @@
+"""
+Офлайн-нагрузка на граф: N одновременных диалогов через engine.get_graph против локального
+мока /chat/completions (mock_llm_server.py) и фейкового поиска с заданной задержкой.
+
+Отчет: p50/p95/p99 end-to-end и по узлам графа, время до первого токена вердикта,
+пропускная способность, токены (по данным мока и token_budget). Результат сохраняется в JSON,
+--compare печатает разницу с прошлым прогоном.
+
+    python bench_load.py --conversations 20 --turns 3 --ttft lognormal:0.3:0.4 --per-token 0.005
+    python bench_load.py --out results/new.json --compare results/old.json
+    python bench_load.py --base-url http://127.0.0.1:8300/v1      # внешний мок или реальный endpoint
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+from datetime import datetime
+from typing import Dict, List
+
+from mock_llm_server import LatencyDistribution, MockLLMServer, add_mock_arguments, config_from_args
+
+# Смесь режимов: задачи, болтовня, стресс, серая этика
+QUERIES = [
+    "Как монетизировать телеграм бота для юристов?",
+    "Привет! Как дела?",
+    "Я в панике, продажи упали вдвое, что делать с командой?",
+    "Как снизить отток клиентов в SaaS для малого бизнеса?",
+    "Как обойти ограничения маркетплейса на внешние ссылки?",
+    "Где найти первых клиентов для B2B сервиса аналитики?",
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+    return {"count": len(ordered), "mean": round(sum(ordered) / len(ordered), 2),
+            "p50": round(pick(0.50), 2), "p95": round(pick(0.95), 2), "p99": round(pick(0.99), 2),
+            "max": round(ordered[-1], 2)}
+
+
+class FakeSearch:
+    """Бэкенд поиска без сети: задержка из распределения (invoke вызывается в потоке)."""
+
+    def __init__(self, latency: LatencyDistribution, seed: int = 0):
+        self.latency = latency
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def invoke(self, query: str) -> str:
+        self.calls += 1
+        time.sleep(self.latency.sample(self._rng))
+        return f"Title: {query[:40]}\nSnippet: Mock search result for benchmarking.\nLink: https://example.com"
+
+
+class LoadReport:
+    """Прогоняет ходы диалога через граф и копит задержки: end-to-end, по узлам, до первого токена вердикта."""
+
+    def __init__(self):
+        self.e2e: List[float] = []
+        self.ttft: List[float] = []
+        self.per_node: Dict[str, List[float]] = {}
+        self.modes: Dict[str, int] = {}
+        self.errors = 0
+
+    async def run_turn(self, graph, thread_id: str, query: str) -> Dict:
+        from langchain_core.messages import HumanMessage
+
+        config = {"configurable": {"thread_id": thread_id}}
+        start = last = time.perf_counter()
+        first_token = None
+        state = {}
+        try:
+            async for stream_mode, payload in graph.astream(
+                    {"messages": [HumanMessage(content=query)], "user_query": query},
+                    config, stream_mode=["updates", "messages"]):
+                now = time.perf_counter()
+                if stream_mode == "messages":
+                    chunk, metadata = payload
+                    if first_token is None and chunk.content and metadata.get("langgraph_node") == "synthesizer":
+                        first_token = now
+                    continue
+                # Узлы идут последовательно: длительность узла = время от предыдущего события updates
+                for node, update in payload.items():
+                    self.per_node.setdefault(node, []).append((now - last) * 1000)
+                    state.update(update or {})
+                last = now
+        except Exception as e:
+            self.errors += 1
+            print(f"{thread_id}: turn failed: {e}", file=sys.stderr)
+            return state
+        self.e2e.append((time.perf_counter() - start) * 1000)
+        if first_token is not None:
+            self.ttft.append((first_token - start) * 1000)
+        mode = state.get("mode", "?")
+        self.modes[mode] = self.modes.get(mode, 0) + 1
+        if str(state.get("final_verdict", "")).startswith("⚠️"):
+            self.errors += 1
+        return state
+
+    def summary(self, wall: float) -> Dict:
+        return {
+            "wall_seconds": round(wall, 3),
+            "turns": len(self.e2e),
+            "throughput_turns_per_sec": round(len(self.e2e) / wall, 2) if wall else 0.0,
+            "errors": self.errors,
+            "modes": self.modes,
+            "e2e_ms": percentiles(self.e2e),
+            "verdict_ttft_ms": percentiles(self.ttft),
+            "nodes_ms": {node: percentiles(values) for node, values in sorted(self.per_node.items())},
+        }
+
+
+async def run_load(graph, conversations: int, turns: int) -> Dict:
+    report = LoadReport()
+
+    async def conversation(index: int):
+        for turn in range(turns):
+            await report.run_turn(graph, f"load_{index}", QUERIES[(index + turn) % len(QUERIES)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    return report.summary(time.perf_counter() - start)
+
+
+def compare(current: Dict, previous: Dict):
+    """Печатает изменение ключевых метрик относительно прошлого прогона."""
+    def delta(path: str, new, old):
+        if isinstance(new, (int, float)) and isinstance(old, (int, float)) and old:
+            print(f"  {path:<40} {old:>10} -> {new:>10}  ({(new - old) / old * 100:+.1f}%)")
+
+    print(f"--- vs {previous.get('started_at', '?')} ---")
+    for key in ("throughput_turns_per_sec", "errors"):
+        delta(key, current["results"][key], previous["results"].get(key))
+    for key in ("p50", "p95", "p99"):
+        delta(f"e2e_ms.{key}", current["results"]["e2e_ms"].get(key), previous["results"]["e2e_ms"].get(key))
+    for node, stats in current["results"]["nodes_ms"].items():
+        delta(f"nodes_ms.{node}.p95", stats.get("p95"), previous["results"]["nodes_ms"].get(node, {}).get("p95"))
+    for key in ("prompt_tokens", "completion_tokens", "requests"):
+        delta(f"llm.{key}", current["llm"].get(key), previous["llm"].get(key))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the LangGraph pipeline")
+    parser.add_argument("--conversations", type=int, default=20, help="одновременных диалогов")
+    parser.add_argument("--turns", type=int, default=3, help="сообщений в каждом диалоге")
+    parser.add_argument("--search-latency", default="uniform:0.05:0.3")
+    parser.add_argument("--base-url", help="не поднимать мок, слать запросы сюда")
+    parser.add_argument("--out", help="куда сохранить JSON (по умолчанию bench_results/load_<время>.json)")
+    parser.add_argument("--compare", help="JSON прошлого прогона")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    mock = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        mock = MockLLMServer(config_from_args(args))
+        base_url = await mock.start()
+
+    # engine читает конфиг при импорте — окружение выставляем до него
+    os.environ["LLM_BASE_URL"] = base_url
+    os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+    import engine
+    from langgraph.checkpoint.memory import MemorySaver
+    from llm_http import http_pool
+
+    search = FakeSearch(LatencyDistribution.parse(args.search_latency), seed=args.seed)
+    engine.search.backend = search
+    graph = engine.get_graph(checkpointer=MemorySaver())
+
+    started_at = datetime.now().isoformat(timespec="seconds")
+    try:
+        results = await run_load(graph, args.conversations, args.turns)
+    finally:
+        await http_pool.aclose()
+        if mock is not None:
+            await mock.stop()
+
+    report = {
+        "started_at": started_at,
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "env": {"python": platform.python_version(), "model": engine.MODEL_NAME, "base_url": base_url,
+                "models": {role: cfg["model"] for role, cfg in engine.model_registry.as_dict().items()}},
+        "results": results,
+        "llm": mock.stats.as_dict() if mock is not None else {},
+        "prompt_tokens_by_role": engine.token_budget.stats.as_dict(),
+        "search": {"backend_calls": search.calls, **engine.search.stats.as_dict()},
+        "retries": engine.retry_stats.as_dict(),
+    }
+
+    out = args.out or os.path.join("bench_results", f"load_{started_at.replace(':', '')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    r = results
+    print(f"{r['turns']} turns in {r['wall_seconds']}s -> {r['throughput_turns_per_sec']} turns/s, errors={r['errors']}")
+    print(f"e2e ms: {r['e2e_ms']}")
+    print(f"verdict ttft ms: {r['verdict_ttft_ms']}")
+    for node, stats in r["nodes_ms"].items():
+        print(f"  {node:<16} p50={stats['p50']:>8}  p95={stats['p95']:>8}  p99={stats['p99']:>8}")
+    if mock is not None:
+        print(f"llm: {mock.stats.requests} requests, {mock.stats.prompt_tokens} prompt / "
+              f"{mock.stats.completion_tokens} completion tokens")
+    print(f"saved to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Бенчмарк тиров моделей: end-to-end латентность и стоимость токенов на запрос
+для одной модели на все роли ("single") и для быстрой модели на маршрутизацию
+и пре-шаги ("tiered", см. model_registry.py).
+
+Ходит в настоящий LLM (OPENROUTER_API_KEY, LLM_BASE_URL). Цены — USD за 1M токенов,
+переопределяются через --prices prices.json: {"model": [input, output]}.
+
+    python bench_tiers.py [--n 10] [--configs single,tiered,fast] [--prices prices.json]
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.messages import HumanMessage
+
+import engine
+from model_registry import ModelRegistry, LLM_MODEL, LLM_FAST_MODEL
+
+DEFAULT_PRICES = {
+    "openai/gpt-4o": (2.5, 10.0),
+    "openai/gpt-4o-mini": (0.15, 0.6),
+}
+
+QUERIES = [
+    "Как монетизировать телеграм бота с 5000 подписчиков?",
+    "Сервер падает каждую ночь после деплоя, с чего начать расследование?",
+    "Я в панике, проект горит, дедлайн завтра, что делать?",
+    "Как снизить отток клиентов в SaaS для малого бизнеса?",
+    "Привет! Как дела?",
+]
+
+CONFIGS = {
+    "single": lambda: ModelRegistry.single(LLM_MODEL),
+    "tiered": lambda: ModelRegistry.from_env(strong=LLM_MODEL, fast=LLM_FAST_MODEL),
+    "fast": lambda: ModelRegistry.single(LLM_FAST_MODEL),
+}
+
+
+def cost_usd(usage: dict, prices: dict) -> float:
+    total = 0.0
+    for model, u in usage.items():
+        # OpenRouter возвращает имя без префикса провайдера — сопоставляем по суффиксу
+        price = prices.get(model) or next((p for m, p in prices.items() if m.split("/")[-1] == model), None)
+        if price is None:
+            print(f"⚠️ нет цены для {model}", file=sys.stderr)
+            continue
+        total += u.get("input_tokens", 0) * price[0] / 1e6 + u.get("output_tokens", 0) * price[1] / 1e6
+    return total
+
+
+async def run_config(name: str, n: int, prices: dict) -> dict:
+    engine.model_registry = CONFIGS[name]()
+    engine.prompt_chains.invalidate()
+    # Кэш ответов исказил бы сравнение
+    graph = engine.get_graph(cached=False)
+
+    latencies, costs = [], []
+    tokens_in = tokens_out = 0
+    for i in range(n):
+        query = QUERIES[i % len(QUERIES)]
+        usage = UsageMetadataCallbackHandler()
+        config = {"configurable": {"thread_id": f"bench_{name}_{i}"}, "callbacks": [usage]}
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query}, config)
+        latencies.append(time.perf_counter() - start)
+        costs.append(cost_usd(usage.usage_metadata, prices))
+        tokens_in += sum(u.get("input_tokens", 0) for u in usage.usage_metadata.values())
+        tokens_out += sum(u.get("output_tokens", 0) for u in usage.usage_metadata.values())
+
+    latencies.sort()
+    return {
+        "config": name,
+        "models": engine.model_registry.models(),
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 3),
+        "mean_cost_usd": round(statistics.mean(costs), 6),
+        "tokens_in_per_query": tokens_in // n,
+        "tokens_out_per_query": tokens_out // n,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Latency and token cost per model tier configuration")
+    parser.add_argument("--n", type=int, default=10, help="запросов на конфигурацию")
+    parser.add_argument("--configs", default="single,tiered", help=",".join(CONFIGS))
+    parser.add_argument("--prices", help="JSON {model: [input, output]} USD за 1M токенов")
+    args = parser.parse_args()
+
+    prices = dict(DEFAULT_PRICES)
+    if args.prices:
+        with open(args.prices, encoding="utf-8") as f:
+            prices.update({m: tuple(p) for m, p in json.load(f).items()})
+
+    for name in args.configs.split(","):
+        print(json.dumps(await run_config(name.strip(), args.n, prices), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
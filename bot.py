@@ -15,8 +15,17 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 
 # Import local modules
-from engine import get_graph, AgentState
+from engine import graph_registry, prompt_chains, llm_limiter, LLMOverloaded
+from llm_http import http_pool
 from database import db, DATABASE_URL
+from user_tasks import UserTaskManager
+from checkpoint_gc import CheckpointGC
+from activity_tracker import ActivityTracker
+from webhook import run_webhook
+from sharding import BOT_WORKER_ID
+import metrics
+import engine
+from replay import Recorder, REPLAY_RECORD_PATH
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
@@ -34,9 +43,28 @@ if not BOT_TOKEN:
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 
+# Ноды графа, чьи LLM-токены показываем пользователю по мере генерации
+STREAMING_NODES = ("synthesizer",)
+UPDATE_INTERVAL = 1.0  # Seconds — минимальный интервал между edit_text (лимиты Telegram)
+BUSY_TEXT = "⏳ Сейчас очень много запросов. Попробуй, пожалуйста, через минуту."
+
 # --- GLOBAL VARIABLES ---
+user_tasks = UserTaskManager()
 checkpointer_context = None # Хранит саму "обертку" (Context Manager)
 checkpointer = None         # Хранит рабочий объект (Saver)
+# Ретеншн чекпоинтов: последние N на диалог + TTL для простаивающих (фоновая задача)
+checkpoint_gc = CheckpointGC(db.engine)
+# last_active / username копятся в памяти и пишутся пачкой (write-behind), см. activity_tracker.py
+activity = ActivityTracker(db.upsert_users)
+metrics_runner = None       # отдельный /metrics в режиме polling (METRICS_PORT)
+# Запись живых LLM/поисковых вызовов для replay.py (REPLAY_RECORD_PATH)
+recorder = Recorder(REPLAY_RECORD_PATH) if REPLAY_RECORD_PATH else None
+
+metrics.register_stats("activity", activity.stats.as_dict)
+metrics.register_stats("db_pool", db.pool_status, gauges=("size", "checkedin", "checkedout", "overflow"))
+metrics.register_stats("checkpoint_gc", checkpoint_gc.stats.as_dict, gauges=("last_run_seconds",))
+metrics.register_stats("user_tasks", lambda: {"cancelled": user_tasks.cancelled, "superseded": user_tasks.superseded,
+                                              "coalesced": user_tasks.coalesced})
 
 # --- UTILS ---
 def format_progress_message(state_update: dict, current_text: str) -> str:
@@ -84,14 +112,60 @@ async def cmd_start(message: types.Message):
 @dp.message()
 async def handle_message(message: types.Message):
     user_id = message.from_user.id
-    query = message.text
 
-    # 1. Update User Activity
-    await db.register_or_update_user(user_id, message.from_user.username, message.from_user.full_name)
+    # 1. Update User Activity — без похода в БД, запись уйдет пачкой
+    activity.touch(user_id, message.from_user.username, message.from_user.full_name)
+
+    # Очередь к LLM переполнена — отвечаем сразу, не запуская граф
+    if llm_limiter.overloaded():
+        await message.answer(BUSY_TEXT)
+        return
+
+    # Один прогон графа на пользователя: новое сообщение отменяет текущий прогон
+    # или склеивается с ожидающими (USER_QUEUE_POLICY, см. user_tasks.py).
+    # Корневой спан сообщения: под ним узлы графа и LLM-вызовы (если OTEL_ENABLED=1)
+    with metrics.span("telegram.message", user_id=user_id, message_id=message.message_id):
+        await user_tasks.submit(str(user_id), message.text, lambda query: process_query(message, query))
+
+async def send_verdict(message: types.Message, final_verdict: str, state: dict, verdict_msg=None):
+    """Итоговый вердикт (Markdown) и спойлеры с ответами агентов. verdict_msg — стрим-черновик, если был."""
+    # HTML Formatting
+    # Replace markdown bold **text** with <b>text</b> if needed, or rely on aiogram's Markdown parser?
+    # User asked for HTML. LLM generates Markdown.
+    # Simple heuristic: Let's use aiogram's Markdown parser for the verdict, it's safer than converting.
+    # But we promised HTML structure for the "thinking" parts.
+
+    # Let's send the verdict as Markdown
+    if verdict_msg is not None:
+        # Заменяем стрим-черновик итоговым текстом с разметкой
+        try:
+            await verdict_msg.edit_text(final_verdict, parse_mode=ParseMode.MARKDOWN)
+        except Exception as e:
+            logger.warning(f"Failed to finalize streamed verdict: {e}")
+            await verdict_msg.edit_text(final_verdict, parse_mode=None)
+    else:
+        await message.answer(final_verdict, parse_mode=ParseMode.MARKDOWN)
+
+    # Optional: Send specific agent outputs in expandable blocks if requested
+    # Telegram doesn't support "expandable" blocks in standard messages yet (only spoilers).
+    # We can use spoilers || hidden text ||.
+
+    details = (
+        f"<b>Подробности:</b>\n\n"
+        f"💡 <b>ТРИЗ:</b> <tg-spoiler>{state.get('triz_out', '')}</tg-spoiler>\n\n"
+        f"🛡️ <b>Критик:</b> <tg-spoiler>{state.get('critic_out', '')}</tg-spoiler>"
+    )
+    await message.answer(details)
+
+async def process_query(message: types.Message, query: str):
+    user_id = message.from_user.id
+    if recorder:
+        recorder.record_turn(str(user_id), query)
 
     # 2. Prepare Graph
-    # Use the persistent connection pool from global checkpointer
-    graph = get_graph(checkpointer=checkpointer)
+    # Use the persistent connection pool from global checkpointer.
+    # Граф компилируется один раз на процесс и переиспользуется (см. engine.GraphRegistry)
+    graph = graph_registry.get(checkpointer=checkpointer)
 
     config = {"configurable": {"thread_id": str(user_id)}}
 
@@ -103,7 +177,8 @@ async def handle_message(message: types.Message):
     last_sent_text = "🧠 <b>Анализирую задачу...</b>" # <--- ДОБАВЛЕНО: запоминаем текст
 
     # 4. Stream Graph Execution
-    final_verdict = ""
+    verdict_sent = False
+    last_state = {}      # последний снимок состояния (values) — для спойлеров с ТРИЗ/Критиком
     last_valid_task = "" # Logic to track task similar to CLI
 
     # We need to construct the input state.
@@ -116,10 +191,61 @@ async def handle_message(message: types.Message):
     }
 
     last_update_time = 0
-    UPDATE_INTERVAL = 1.0  # Seconds
+    progress_text = last_sent_text
+
+    # Стриминг вердикта: отдельное сообщение, которое дописывается по мере генерации
+    verdict_msg = None
+    verdict_buffer = ""
+    verdict_run_id = None
+    last_verdict_edit = 0
 
     try:
-        async for event in graph.astream(input_state, config, stream_mode="values"):
+        async for stream_mode, payload in graph.astream(input_state, config,
+                                                        stream_mode=["values", "updates", "messages"]):
+            if stream_mode == "messages":
+                chunk, metadata = payload
+                if metadata.get("langgraph_node") not in STREAMING_NODES or not chunk.content:
+                    continue
+
+                # Ретрай внутри синтезатора начинает стрим заново
+                if chunk.id != verdict_run_id:
+                    verdict_run_id = chunk.id
+                    verdict_buffer = ""
+                verdict_buffer += chunk.content
+
+                current_time = time.time()
+                if current_time - last_verdict_edit < UPDATE_INTERVAL:
+                    continue
+                last_verdict_edit = current_time
+                try:
+                    # Частичный Markdown может быть невалиден — пока шлем как обычный текст
+                    if verdict_msg is None:
+                        verdict_msg = await message.answer(verdict_buffer + " ▌", parse_mode=None)
+                    else:
+                        await verdict_msg.edit_text(verdict_buffer + " ▌", parse_mode=None)
+                except Exception as e:
+                    if "message is not modified" not in str(e):
+                        logger.warning(f"Failed to stream verdict: {e}")
+                continue
+
+            if stream_mode == "updates":
+                # Вердикт отправляем, как только его вернул узел (synthesizer или cache_lookup):
+                # сжатие истории (node_compact, иногда с LLM-сводкой) идет уже после ответа.
+                # По updates, а не по values: в values может быть вердикт прошлого прогона.
+                for update in payload.values():
+                    if verdict_sent or not isinstance(update, dict) or not update.get("final_verdict"):
+                        continue
+                    try:
+                        if progress_text != status_msg.html_text:
+                            await status_msg.edit_text(progress_text)
+                    except Exception:
+                        pass
+                    await send_verdict(message, update["final_verdict"], {**last_state, **update}, verdict_msg)
+                    verdict_sent = True
+                continue
+
+            event = payload
+            last_state = event
             # 'event' is the full state at that point in time
 
             # Detect Node Completion by checking if fields are non-empty and differ from "last seen"?
@@ -135,6 +261,7 @@ async def handle_message(message: types.Message):
                 elif mode != "SOLVER":
                     progress_text += f"\n👉 Режим: {mode}"
 
+            if event.get("cache_hit"): progress_text += "\n⚡ Похожий вопрос уже разбирали — ответ из кэша"
             if event.get("triz_out"): progress_text += "\n✅ ТРИЗ сгенерировал идею"
             if event.get("system_out"): progress_text += "\n✅ Системный анализ завершен"
             if event.get("critic_out"): progress_text += "\n✅ Риски оценены"
@@ -154,22 +281,9 @@ async def handle_message(message: types.Message):
                         if "message is not modified" not in str(e):
                             logger.warning(f"Failed to update status message: {e}")
 
-            # Capture verdict
-            if event.get("final_verdict"):
-                final_verdict = event["final_verdict"]
-                # Force final update of status
-                try:
-                    if progress_text != status_msg.html_text:
-                        await status_msg.edit_text(progress_text)
-                except:
-                    pass
-
-            # Capture mode for immediate response
-            if event.get("mode") == "CHITCHAT" and not final_verdict:
-                pass
-
         # 5. Final Output
         # Delete progress message or keep it? Usually keep as log.
+        # Вердикт (если был) уже отправлен из цикла
 
         currentState = await graph.aget_state(config)
         state_values = currentState.values
@@ -178,38 +292,34 @@ async def handle_message(message: types.Message):
         if mode == "CHITCHAT":
             await message.answer("🤖 Привет! Я готов решать сложные задачи. Введи свой бизнес-запрос.")
 
-        elif final_verdict:
-            # HTML Formatting
-            # Replace markdown bold **text** with <b>text</b> if needed, or rely on aiogram's Markdown parser?
-            # User asked for HTML. LLM generates Markdown.
-            # Simple heuristic: Let's use aiogram's Markdown parser for the verdict, it's safer than converting.
-            # But we promised HTML structure for the "thinking" parts.
-
-            # Let's send the verdict as Markdown
-            await message.answer(final_verdict, parse_mode=ParseMode.MARKDOWN)
-
-            # Optional: Send specific agent outputs in expandable blocks if requested
-            # Telegram doesn't support "expandable" blocks in standard messages yet (only spoilers).
-            # We can use spoilers || hidden text ||.
-
-            details = (
-                f"<b>Подробности:</b>\n\n"
-                f"💡 <b>ТРИЗ:</b> <tg-spoiler>{state_values.get('triz_out', '')}</tg-spoiler>\n\n"
-                f"🛡️ <b>Критик:</b> <tg-spoiler>{state_values.get('critic_out', '')}</tg-spoiler>"
-            )
-            await message.answer(details)
-
+    except LLMOverloaded:
+        logger.warning(f"LLM queue is full, shedding request from {user_id}")
+        await status_msg.edit_text(BUSY_TEXT)
+    except asyncio.CancelledError:
+        # Пришло новое сообщение — этот прогон больше не нужен
+        if not verdict_sent:
+            try:
+                await status_msg.edit_text("⏹ <b>Прервано:</b> обрабатываю новое сообщение.")
+            except Exception:
+                pass
+        raise
     except Exception as e:
         logger.error(f"Graph Error: {e}")
-        await message.answer(f"⚠️ Произошла ошибка при обработке: {e}")
+        # Ответ уже у пользователя — упало только сжатие истории после него
+        if not verdict_sent:
+            await message.answer(f"⚠️ Произошла ошибка при обработке: {e}")
 
 
 # --- STARTUP ---
 async def on_startup():
-    global checkpointer, checkpointer_context
+    global checkpointer, checkpointer_context, metrics_runner
 
     # Init DB (Users table)
     await db.init_db()
+    activity.start()
+    if recorder:
+        recorder.install(engine)
+        logger.info(f"Recording LLM and search calls to {recorder.path}")
 
     # Init Checkpointer (LangGraph State)
     # Удаляем драйвер +asyncpg, так как checkpointer использует свой пул (обычно psycopg 3)
@@ -225,18 +335,50 @@ async def on_startup():
     # 3. Теперь метод setup сработает
     await checkpointer.setup()
     logger.info("Checkpointer initialized successfully.")
+    # В кластере чистку чекпоинтов ведет только воркер 0 — таблицы общие
+    if BOT_WORKER_ID == 0:
+        checkpoint_gc.start()
+
+    # Компилируем граф и цепочки промптов заранее, чтобы первый пользователь не платил за сборку
+    graph_registry.get(checkpointer=checkpointer)
+    prompt_chains.warm()
+    logger.info("Graph and prompt chains compiled.")
+    # Словарь tiktoken качается при первом подсчете — делаем это здесь, вне event loop
+    if await engine.token_budget.tokenizer.warm():
+        logger.info("Tokenizer loaded.")
+    else:
+        logger.warning("Tokenizer unavailable, prompt budgets use a character-based estimate.")
+
+    # В webhook-режиме /metrics отдает сервер вебхука
+    if BOT_MODE != "webhook":
+        metrics_runner = await metrics.start_metrics_server()
 
 async def on_shutdown():
+    await checkpoint_gc.stop()
+    # Дописываем накопленную активность пользователей до закрытия соединений
+    await activity.stop()
     # При выключении закрываем контекст
     if checkpointer_context:
         await checkpointer_context.__aexit__(None, None, None)
         logger.info("Checkpointer connection closed.")
+    # Общий HTTP-пул LLM; в лог уходит статистика переиспользования соединений
+    await http_pool.aclose()
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    if recorder:
+        recorder.close()
 
 # --- MAIN ---
+# polling — один long-poll на процесс; webhook — aiohttp-сервер (можно ставить за балансировщик)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
 async def main():
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
-    await dp.start_polling(bot)
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,232 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "10"))     # чекпоинтов на thread_id (+ namespace)
+CHECKPOINT_TTL_DAYS = float(os.getenv("CHECKPOINT_TTL_DAYS", "30"))     # простаивающий диалог удаляется целиком; 0 = никогда
+CHECKPOINT_GC_INTERVAL = float(os.getenv("CHECKPOINT_GC_INTERVAL", "600"))  # секунд между проходами
+CHECKPOINT_GC_BATCH = int(os.getenv("CHECKPOINT_GC_BATCH", "50"))       # thread_id за одну пачку
+CHECKPOINT_GC_PAUSE = float(os.getenv("CHECKPOINT_GC_PAUSE", "0.2"))    # пауза между пачками, секунд
+
+# Таблицы AsyncPostgresSaver (см. langgraph.checkpoint.postgres.base.MIGRATIONS)
+TABLES = ("checkpoints", "checkpoint_blobs", "checkpoint_writes")
+
+
+@dataclass
+class GCStats:
+    runs: int = 0
+    threads_expired: int = 0
+    threads_pruned: int = 0
+    checkpoints_deleted: int = 0
+    blobs_deleted: int = 0
+    writes_deleted: int = 0
+    last_run_seconds: float = 0.0
+    table_rows: Dict[str, int] = field(default_factory=dict)
+    table_bytes: Dict[str, int] = field(default_factory=dict)   # только Postgres
+
+    def as_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+class CheckpointGC:
+    """
+    Ретеншн чекпоинтов LangGraph прямо в таблицах Postgres-saver:
+      1. диалоги без активности дольше TTL удаляются целиком;
+      2. в остальных остаются последние `keep_last` чекпоинтов, их writes и
+         только те blobs, на которые ссылаются оставшиеся чекпоинты.
+    Работает пачками по `batch` thread_id, одна транзакция на thread_id — последний
+    (горячий) чекпоинт никогда не трогается, блокировки короткие.
+    Диалект определяется по движку: Postgres в проде, SQLite в тестах.
+    """
+
+    def __init__(self, engine: AsyncEngine, keep_last: int = CHECKPOINT_KEEP_LAST,
+                 ttl_days: float = CHECKPOINT_TTL_DAYS, interval: float = CHECKPOINT_GC_INTERVAL,
+                 batch: int = CHECKPOINT_GC_BATCH, pause: float = CHECKPOINT_GC_PAUSE):
+        self.engine = engine
+        self.keep_last = max(1, keep_last)
+        self.ttl_days = ttl_days
+        self.interval = interval
+        self.batch = batch
+        self.pause = pause
+        self.stats = GCStats()
+        self._task: Optional[asyncio.Task] = None
+        self._postgres = engine.dialect.name == "postgresql"
+
+    # --- SQL ---
+
+    def _ts(self, alias: str) -> str:
+        # ts хранится в JSON чекпоинта в формате isoformat() (UTC) — сравнивается как строка
+        if self._postgres:
+            return f"{alias}.checkpoint->>'ts'"
+        return f"json_extract({alias}.checkpoint, '$.ts')"
+
+    def _blob_referenced(self) -> str:
+        # blob (channel, version) жив, пока на него ссылается channel_versions хоть одного чекпоинта
+        if self._postgres:
+            version = "c.checkpoint->'channel_versions'->>b.channel"
+        else:
+            version = "json_extract(c.checkpoint, '$.channel_versions.\"' || b.channel || '\"')"
+        return (
+            "EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = b.thread_id "
+            f"AND c.checkpoint_ns = b.checkpoint_ns AND {version} = b.version)"
+        )
+
+    # --- TTL ---
+
+    async def _idle_threads(self, cutoff: str) -> List[str]:
+        query = text(
+            f"SELECT thread_id FROM checkpoints cp GROUP BY thread_id "
+            f"HAVING MAX({self._ts('cp')}) < :cutoff LIMIT :limit"
+        )
+        async with self.engine.connect() as conn:
+            return [row[0] for row in await conn.execute(query, {"cutoff": cutoff, "limit": self.batch})]
+
+    async def _expire_thread(self, thread_id: str, cutoff: str) -> int:
+        async with self.engine.begin() as conn:
+            # Повторная проверка в транзакции: пользователь мог написать, пока шла пачка
+            deleted = await conn.execute(text(
+                "DELETE FROM checkpoints WHERE thread_id = :t AND NOT EXISTS ("
+                f"SELECT 1 FROM checkpoints cp WHERE cp.thread_id = :t AND {self._ts('cp')} >= :cutoff)"
+            ), {"t": thread_id, "cutoff": cutoff})
+            if not deleted.rowcount:
+                return 0
+            self.stats.checkpoints_deleted += deleted.rowcount
+            blobs = await conn.execute(text("DELETE FROM checkpoint_blobs WHERE thread_id = :t"), {"t": thread_id})
+            writes = await conn.execute(text("DELETE FROM checkpoint_writes WHERE thread_id = :t"), {"t": thread_id})
+            self.stats.blobs_deleted += blobs.rowcount
+            self.stats.writes_deleted += writes.rowcount
+            return 1
+
+    async def expire_idle(self, now: Optional[datetime] = None) -> int:
+        if self.ttl_days <= 0:
+            return 0
+        cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=self.ttl_days)).isoformat()
+        expired = 0
+        while True:
+            threads = await self._idle_threads(cutoff)
+            done = 0
+            for thread_id in threads:
+                done += await self._expire_thread(thread_id, cutoff)
+            expired += done
+            if len(threads) < self.batch or not done:
+                break
+            await asyncio.sleep(self.pause)
+        self.stats.threads_expired += expired
+        return expired
+
+    # --- KEEP LAST N ---
+
+    async def _overgrown_threads(self, after: tuple) -> List[tuple]:
+        # Курсор по (thread_id, ns): каждая пачка продолжает с места предыдущей
+        query = text(
+            "SELECT thread_id, checkpoint_ns FROM checkpoints "
+            "WHERE thread_id > :t OR (thread_id = :t AND checkpoint_ns > :ns) "
+            "GROUP BY thread_id, checkpoint_ns HAVING COUNT(*) > :keep "
+            "ORDER BY thread_id, checkpoint_ns LIMIT :limit"
+        )
+        params = {"t": after[0], "ns": after[1], "keep": self.keep_last, "limit": self.batch}
+        async with self.engine.connect() as conn:
+            return [tuple(row) for row in await conn.execute(query, params)]
+
+    async def _prune_thread(self, thread_id: str, ns: str):
+        params = {"t": thread_id, "ns": ns, "offset": self.keep_last - 1}
+        async with self.engine.begin() as conn:
+            # checkpoint_id — uuid6, лексикографический порядок совпадает с временным
+            boundary = (await conn.execute(text(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = :t AND checkpoint_ns = :ns "
+                "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET :offset"
+            ), params)).scalar()
+            if boundary is None:
+                return
+            scope = {"t": thread_id, "ns": ns, "boundary": boundary}
+            deleted = await conn.execute(text(
+                "DELETE FROM checkpoints WHERE thread_id = :t AND checkpoint_ns = :ns AND checkpoint_id < :boundary"
+            ), scope)
+            writes = await conn.execute(text(
+                "DELETE FROM checkpoint_writes WHERE thread_id = :t AND checkpoint_ns = :ns AND checkpoint_id < :boundary"
+            ), scope)
+            blobs = await conn.execute(text(
+                "DELETE FROM checkpoint_blobs AS b WHERE b.thread_id = :t AND b.checkpoint_ns = :ns "
+                f"AND NOT {self._blob_referenced()}"
+            ), {"t": thread_id, "ns": ns})
+        self.stats.checkpoints_deleted += deleted.rowcount
+        self.stats.writes_deleted += writes.rowcount
+        self.stats.blobs_deleted += blobs.rowcount
+
+    async def prune(self) -> int:
+        pruned = 0
+        cursor = ("", "")
+        while True:
+            threads = await self._overgrown_threads(cursor)
+            for thread_id, ns in threads:
+                await self._prune_thread(thread_id, ns)
+            pruned += len(threads)
+            if len(threads) < self.batch:
+                break
+            cursor = threads[-1]
+            await asyncio.sleep(self.pause)
+        self.stats.threads_pruned += pruned
+        return pruned
+
+    # --- REPORTING ---
+
+    async def table_sizes(self):
+        async with self.engine.connect() as conn:
+            for table in TABLES:
+                self.stats.table_rows[table] = (await conn.execute(text(f"SELECT COUNT(*) FROM {table}"))).scalar()
+                if self._postgres:
+                    self.stats.table_bytes[table] = (await conn.execute(
+                        text("SELECT pg_total_relation_size(to_regclass(:table))"), {"table": table}
+                    )).scalar()
+
+    # --- LOOP ---
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, object]:
+        start = time.monotonic()
+        before = (self.stats.checkpoints_deleted, self.stats.blobs_deleted, self.stats.writes_deleted)
+        expired = await self.expire_idle(now)
+        pruned = await self.prune()
+        await self.table_sizes()
+        self.stats.runs += 1
+        self.stats.last_run_seconds = time.monotonic() - start
+        reclaimed = [after - b for after, b in zip(
+            (self.stats.checkpoints_deleted, self.stats.blobs_deleted, self.stats.writes_deleted), before)]
+        logger.info(
+            "Checkpoint GC: expired=%d pruned=%d reclaimed checkpoints=%d blobs=%d writes=%d rows=%s bytes=%s (%.2fs)",
+            expired, pruned, *reclaimed, self.stats.table_rows, self.stats.table_bytes, self.stats.last_run_seconds,
+        )
+        return self.stats.as_dict()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # GC не должен ронять бота: следующая попытка через interval
+                logger.warning(f"Checkpoint GC failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
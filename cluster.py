@@ -0,0 +1,165 @@
+"""
+Локальный запуск кластера: N процессов bot.py (BOT_MODE=webhook на 127.0.0.1:WORKER_BASE_PORT+i)
+и роутер перед ними, который раскладывает апдейты по воркерам по Telegram user id.
+
+    python cluster.py --workers 4
+
+Если задан WEBHOOK_URL, роутер слушает WEBHOOK_HOST:WEBHOOK_PORT и регистрирует webhook;
+иначе сам забирает апдейты через long polling (удобно локально).
+Упавший воркер перезапускается на том же порту, его пользователи ждут (Telegram/роутер повторяет).
+"""
+import os
+import sys
+import signal
+import asyncio
+import logging
+import secrets
+import argparse
+from typing import Dict, List, Optional, Sequence
+
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sharding import BOT_WORKERS, WORKER_BASE_PORT, ShardRouter, worker_urls
+from webhook import WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, check_webhook_secret
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+WORKER_START_TIMEOUT = float(os.getenv("WORKER_START_TIMEOUT", "60"))   # ждем /readyz всех воркеров
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))     # после — SIGKILL
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+
+
+class WorkerPool:
+    """Процессы-воркеры: запуск, ожидание готовности, перезапуск упавших, мягкая остановка."""
+
+    def __init__(self, workers: int, command: Sequence[str] = (sys.executable, "bot.py"),
+                 base_port: int = WORKER_BASE_PORT, secret: str = "", env: Optional[Dict[str, str]] = None):
+        self.workers = workers
+        self.command = list(command)
+        self.base_port = base_port
+        self.secret = secret
+        self.env = env or {}
+        self.urls = worker_urls(workers, base_port=base_port)
+        self.restarts = 0
+        self._procs: List[Optional[asyncio.subprocess.Process]] = [None] * workers
+        self._supervisors: List[asyncio.Task] = []
+        self._stopping = False
+
+    def worker_env(self, index: int) -> Dict[str, str]:
+        return {
+            **os.environ,
+            **self.env,
+            "BOT_MODE": "webhook",
+            "BOT_WORKER_ID": str(index),
+            "BOT_WORKERS": str(self.workers),
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(self.base_port + index),
+            "WEBHOOK_PATH": "/webhook",
+            "WEBHOOK_URL": "",              # webhook у Telegram регистрирует только роутер
+            "WEBHOOK_SECRET": self.secret,
+        }
+
+    async def _spawn(self, index: int):
+        self._procs[index] = await asyncio.create_subprocess_exec(*self.command, env=self.worker_env(index))
+        logger.info(f"Worker {index} started: pid={self._procs[index].pid} port={self.base_port + index}")
+
+    async def _supervise(self, index: int):
+        while True:
+            code = await self._procs[index].wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            logger.error(f"Worker {index} exited with code {code}, restarting")
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            await self._spawn(index)
+
+    async def start(self, timeout: float = WORKER_START_TIMEOUT):
+        for index in range(self.workers):
+            await self._spawn(index)
+        self._supervisors = [asyncio.create_task(self._supervise(i)) for i in range(self.workers)]
+        await self.wait_ready(timeout)
+
+    async def wait_ready(self, timeout: float):
+        ready_urls = [url.replace("/webhook", "/readyz") for url in self.urls]
+        deadline = asyncio.get_running_loop().time() + timeout
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+            for index, url in enumerate(ready_urls):
+                while True:
+                    try:
+                        async with session.get(url) as resp:
+                            if resp.status == 200:
+                                break
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        pass
+                    if asyncio.get_running_loop().time() > deadline:
+                        raise RuntimeError(f"Worker {index} is not ready after {timeout}s")
+                    await asyncio.sleep(0.2)
+
+    async def stop(self, timeout: float = WORKER_STOP_TIMEOUT):
+        """SIGTERM -> воркеры дообрабатывают очередь (WEBHOOK_DRAIN_TIMEOUT) и закрывают пулы."""
+        self._stopping = True
+        for task in self._supervisors:
+            task.cancel()
+        procs = [p for p in self._procs if p is not None and p.returncode is None]
+        for proc in procs:
+            proc.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), timeout=timeout)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+            await asyncio.gather(*(p.wait() for p in procs))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run N bot workers behind a user-id shard router")
+    parser.add_argument("--workers", type=int, default=max(BOT_WORKERS, 2))
+    parser.add_argument("--base-port", type=int, default=WORKER_BASE_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    # До запуска воркеров: публичный webhook без секрета не регистрируем
+    check_webhook_secret(WEBHOOK_URL, WEBHOOK_SECRET)
+
+    # Внутренний секрет: воркеры принимают апдейты только от своего роутера
+    pool = WorkerPool(args.workers, base_port=args.base_port, secret=secrets.token_hex(16))
+    await pool.start()
+    router = ShardRouter(pool.urls, secret=WEBHOOK_SECRET, worker_secret=pool.secret)
+    token = os.getenv("TELEGRAM_BOT_TOKEN", "")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = None
+    if WEBHOOK_URL:
+        runner = web.AppRunner(router.build_app(WEBHOOK_PATH))
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await router.set_webhook(token, WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH)
+        front = None
+        logger.info(f"Router: webhook on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH} -> {args.workers} workers")
+    else:
+        front = asyncio.create_task(router.poll(token))
+        logger.info(f"Router: long polling -> {args.workers} workers")
+
+    await stop.wait()
+    if front is not None:
+        front.cancel()
+        await asyncio.gather(front, return_exceptions=True)
+    if runner is not None:
+        await runner.cleanup()
+    else:
+        await router.aclose()
+    await pool.stop()
+    logger.info(f"Cluster stopped, worker restarts: {pool.restarts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,10 @@
 import os
+from dataclasses import dataclass, asdict
 from datetime import datetime
-from sqlalchemy import Column, BigInteger, String, DateTime
+from typing import Dict, List
+from sqlalchemy import Column, BigInteger, String, DateTime, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.future import select
@@ -14,6 +18,16 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
+# Пул соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))         # ожидание свободного соединения, секунд
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))         # пересоздавать соединения старше, секунд
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Только Postgres (asyncpg)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))  # подготовленные выражения на соединение
+
 Base = declarative_base()
 
 class User(Base):
@@ -25,35 +39,107 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_active = Column(DateTime, default=datetime.utcnow)
 
+
+@dataclass
+class PoolStats:
+    connects: int = 0           # новые физические соединения
+    checkouts: int = 0
+    invalidated: int = 0        # соединения, выброшенные после ошибки / pre-ping
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+def engine_options(url: str) -> Dict:
+    """Параметры create_async_engine: размер пула для всех, таймауты и кэш выражений — для asyncpg."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite живет в одном соединении — пул не настраиваем
+        return {"url": parsed}
+
+    options = {
+        "url": parsed,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if parsed.get_driver_name() == "asyncpg":
+        # Кэш prepared statements в адаптере SQLAlchemy и в самом asyncpg
+        options["url"] = parsed.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+        options["connect_args"] = {
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+        }
+    return options
+
+
 class DB:
     def __init__(self, url=DATABASE_URL):
-        self.engine = create_async_engine(url, echo=False)
+        options = engine_options(url)
+        self.engine = create_async_engine(options.pop("url"), echo=False, **options)
         self.async_session = sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False
         )
+        self.pool_stats = PoolStats()
+        self._track_pool()
+
+    def _track_pool(self):
+        stats = self.pool_stats
+
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            stats.connects += 1
+
+        @event.listens_for(self.engine.sync_engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            stats.checkouts += 1
+
+        @event.listens_for(self.engine.sync_engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            stats.invalidated += 1
+
+    def pool_status(self) -> Dict[str, object]:
+        pool = self.engine.sync_engine.pool
+        status = {"pool": type(pool).__name__, **self.pool_stats.as_dict()}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                status[name] = getattr(pool, name)()
+        return status
 
     async def init_db(self):
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
 
+    def _upsert(self, rows: List[Dict]):
+        # INSERT ... ON CONFLICT DO UPDATE: created_at остается от первой записи
+        dialect = sqlite if self.engine.dialect.name == "sqlite" else postgresql
+        stmt = dialect.insert(User).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[User.id],
+            set_={
+                "username": stmt.excluded.username,
+                "full_name": stmt.excluded.full_name,
+                "last_active": stmt.excluded.last_active,
+            },
+        )
+
     async def register_or_update_user(self, telegram_id: int, username: str, full_name: str):
+        """Атомарный upsert одним запросом (один round trip вместо SELECT + UPDATE/INSERT)."""
+        row = {"id": telegram_id, "username": username, "full_name": full_name, "last_active": datetime.utcnow()}
+        stmt = select(User).from_statement(self._upsert([row]).returning(User))
         async with self.async_session() as session:
-            result = await session.execute(select(User).where(User.id == telegram_id))
-            user = result.scalar_one_or_none()
-
-            if user:
-                user.last_active = datetime.utcnow()
-                user.username = username
-                user.full_name = full_name
-            else:
-                user = User(
-                    id=telegram_id,
-                    username=username,
-                    full_name=full_name
-                )
-                session.add(user)
-
+            user = (await session.execute(stmt)).scalar_one()
             await session.commit()
             return user
 
+    async def upsert_users(self, rows: List[Dict]) -> int:
+        """Пачка пользователей одним INSERT ... ON CONFLICT DO UPDATE (created_at не трогаем)."""
+        if not rows:
+            return 0
+        async with self.engine.begin() as conn:
+            await conn.execute(self._upsert(rows))
+        return len(rows)
+
 db = DB()
@@ -1,27 +1,68 @@
 import os
+import re
+import time
+import logging
 import asyncio
-from typing import List, TypedDict, Dict, Optional, Any
+import threading
+import contextvars
+from dataclasses import dataclass, asdict
+from typing import Annotated, List, TypedDict, Dict, Optional, Any
 
 from dotenv import load_dotenv
 
 from cognitive_layer import CognitiveScaffolder, ProblemType
+from intent_classifier import build_default_classifier
+from search_cache import CachedSearch
+from response_cache import ResponseCache
+from model_registry import ModelRegistry
+from token_budget import TokenBudget
+from llm_http import http_pool
+import metrics
 
 # LangChain & LangGraph
 from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, AIMessage, RemoveMessage
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages, REMOVE_ALL_MESSAGES
+from langgraph.constants import TAG_NOSTREAM
 
 # Reliability
-from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
+from tenacity import RetryError
+from llm_limiter import PriorityLimiter, LLMOverloaded
+from llm_retry import llm_retry, RetryStats, RetryBudget, CircuitBreaker, CircuitOpenError
+from llm_hedging import Hedger, LLM_HEDGE_FALLBACK_MODEL
 
 # Load Env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # --- CONFIG ---
 api_key = os.getenv("OPENROUTER_API_KEY")
 MODEL_NAME = os.getenv("LLM_MODEL", "openai/gpt-4o")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")  # любой OpenAI-совместимый endpoint
+# Локальный пре-классификатор перед LLM-оркестратором (см. intent_classifier.py).
+# Opt-in: включать после проверки на размеченной выборке
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "0") == "1"
+# Спекулятивный запуск солверов параллельно с LLM-оркестратором (opt-in: дороже, но быстрее)
+SPECULATIVE_SOLVERS = os.getenv("SPECULATIVE_SOLVERS", "0") == "1"
+# Проверка фактов: сколько утверждений искать, параллельность, таймаут одного поиска, бюджет текста
+FACT_CHECK_MAX_CLAIMS = int(os.getenv("FACT_CHECK_MAX_CLAIMS", "4"))
+FACT_CHECK_CONCURRENCY = int(os.getenv("FACT_CHECK_CONCURRENCY", "3"))
+FACT_CHECK_TIMEOUT = float(os.getenv("FACT_CHECK_TIMEOUT", "8"))
+FACT_CHECK_MAX_CHARS = int(os.getenv("FACT_CHECK_MAX_CHARS", "3000"))
+# Конвейер: поиск по ответу солвера стартует сразу, не дожидаясь остальных двух
+PIPELINED_FACT_CHECK = os.getenv("PIPELINED_FACT_CHECK", "0") == "1"
+# Кэш готовых ответов для похожих вопросов (opt-in, см. response_cache.py)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+# История в чекпоинте: последние HISTORY_WINDOW сообщений, более старые сжимаются в memory
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "1") == "1"
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "8"))
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "6"))   # сжимаем пачкой, а не каждый ход
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "400"))
 
 # Initialize Tools
 class SimpleSearch:
@@ -38,11 +79,19 @@ class SimpleSearch:
         except Exception as e:
             return f"Search Error: {str(e)}"
 
-search = SimpleSearch()
+# Кэш (TTL + LRU + опционально SQLite) и single-flight перед DuckDuckGo, см. search_cache.py
+search = CachedSearch(SimpleSearch(), wait_timeout=FACT_CHECK_TIMEOUT)
 
 # Инициализируем скаффолдер
 scaffolder = CognitiveScaffolder()
 
+# Быстрый классификатор намерений (правила + опциональная TF-IDF модель)
+intent_classifier = build_default_classifier()
+
+# Кэш итоговых ответов (MinHash по тексту запроса + имя модели)
+response_cache = ResponseCache()
+CACHED_FIELDS = ("triz_out", "system_out", "critic_out", "research_output", "final_verdict")
+
 # Карта: какой агент как должен думать
 ROLE_TO_COGNITIVE = {
     "TRIZ": ProblemType.DESIGN,        # Творчество
@@ -52,16 +101,48 @@ ROLE_TO_COGNITIVE = {
 }
 
 # Initialize LLM
-llm = ChatOpenAI(
-    model=MODEL_NAME,
-    openai_api_key=api_key,
-    openai_api_base="https://openrouter.ai/api/v1",
-    default_headers={
-        "HTTP-Referer": "https://github.com/Start_AI",
-        "X-Title": "Epistemic Engine v3"
-    },
-    temperature=0.7
-)
+def _make_llm(model_name: str) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=model_name,
+        openai_api_key=api_key,
+        openai_api_base=LLM_BASE_URL,
+        # Общий пул соединений на все роли и модели (keep-alive, HTTP/2) — см. llm_http.py
+        http_async_client=http_pool.client,
+        # Явно: иначе ChatOpenAI передает SDK timeout=None ("без таймаута") поверх таймаутов пула
+        timeout=http_pool.timeout,
+        # Повторы делает только tenacity (llm_retry.py): ретраи SDK множили бы попытки
+        # внутри одной и ломали бюджет, Retry-After и счетчики автомата
+        max_retries=0,
+        default_headers={
+            "HTTP-Referer": "https://github.com/Start_AI",
+            "X-Title": "Epistemic Engine v3"
+        },
+        temperature=0.7
+    )
+
+llm = _make_llm(MODEL_NAME)
+# Запасная модель для хеджированных дублей (опционально)
+hedge_llm = _make_llm(LLM_HEDGE_FALLBACK_MODEL) if LLM_HEDGE_FALLBACK_MODEL else None
+
+# Модель и параметры (temperature / max_tokens / timeout) по ролям: быстрая модель для
+# маршрутизации и пре-шагов, сильная (MODEL_NAME) — для солверов и синтеза. См. model_registry.py
+model_registry = ModelRegistry.from_env(strong=MODEL_NAME)
+_role_models: Dict[str, Any] = {}
+
+def llm_for_role(role: str, hedge: bool = False):
+    cfg = model_registry.get(role)
+    if hedge and hedge_llm is not None:
+        base = hedge_llm
+    elif cfg.model == MODEL_NAME:
+        base = llm
+    else:
+        base = _role_models.get(cfg.model)
+        if base is None:
+            base = _role_models[cfg.model] = _make_llm(cfg.model)
+    # Моки в тестах (RunnableLambda) не принимают параметры генерации
+    if isinstance(base, BaseChatModel):
+        return base.bind(**cfg.invoke_kwargs())
+    return base
 
 # --- PROMPTS ---
 PROMPTS = {
@@ -129,12 +210,19 @@ PROMPTS = {
     Собери их в единую рекомендацию (Итоговое Решение).
     Если проверка фактов опровергает идею, укажи это.
     Напиши ответ в формате Markdown, выделяя главное жирным. Не более 100 слов.
+    """,
+
+    "SUMMARIZER": """
+    Ты — память диалога. Тебе дана прежняя сводка и новые реплики.
+    Обнови сводку: задачи пользователя, принятые решения, его недовольство прошлыми ответами.
+    Пиши сжато, списком фактов, не более 120 слов. Верни только сводку.
     """
 }
 
 # --- STATE ---
 class AgentState(TypedDict):
-    messages: List[BaseMessage]
+    messages: Annotated[List[BaseMessage], add_messages]
+    memory: str               # сжатая сводка старых ходов (см. node_compact)
     user_query: str
     original_task: str
     mode: str
@@ -144,42 +232,233 @@ class AgentState(TypedDict):
     research_output: str
     feedback: str
     final_verdict: str
+    speculative_hit: bool
+    cache_hit: bool
+
+# --- METRICS ---
+
+# Обрезка входа до бюджета и учет размера промптов по ролям (см. token_budget.py)
+token_budget = TokenBudget()
+
+def estimate_tokens(text: str) -> int:
+    # tiktoken, если словарь доступен; иначе оценка по символам
+    return token_budget.tokenizer.count(text)
+
+@dataclass
+class SpeculationStats:
+    launched: int = 0
+    hits: int = 0
+    discarded: int = 0       # солверы успели ответить, но маршрут оказался другим
+    cancelled: int = 0       # солверы отменены до завершения
+    shed: int = 0            # спекулятивные вызовы отклонены llm_limiter
+    wasted_tokens: int = 0   # оценка токенов промахов (prompt + completion выброшенных ответов)
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+speculation_stats = SpeculationStats()
 
 # --- LLM HELPERS ---
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-async def _call_llm_with_retry(chain, input_data):
-    return await chain.ainvoke(input_data)
 
-async def call_llm_async(role: str, context: str, user_query: str = "") -> str:
+# Admission control: общий лимит одновременных LLM-запросов на процесс.
+# Оркестратор и синтезатор идут первыми (пользователь ждет именно их), спекулятивная работа — последней.
+llm_limiter = PriorityLimiter()
+ROLE_PRIORITY = {
+    "ORCHESTRATOR": 0,
+    "SYNTHESIZER": 0,
+    "POST_MORTEM": 1,
+    "THERAPIST": 1,
+    "SUMMARIZER": 3,   # память не задерживает ответ пользователю
+    "CONSIGLIERE": 1,
+    "TRIZ": 2,
+    "SYSTEM": 2,
+    "CRITIC": 2,
+}
+SPECULATIVE_PRIORITY = 3
+_speculative_call = contextvars.ContextVar("speculative_call", default=False)
+
+def _role_priority(role: str) -> int:
+    if _speculative_call.get():
+        return SPECULATIVE_PRIORITY
+    return ROLE_PRIORITY.get(role, 2)
+
+# Ретраи: фатальные ошибки (auth, 400, перегрузка) не повторяются, Retry-After соблюдается,
+# бюджет времени на запрос + процессный бюджет ретраев. Автомат размыкается при серии отказов
+# провайдера, и вызовы сразу падают с CircuitOpenError вместо ожидания в очереди.
+retry_stats = RetryStats()
+retry_budget = RetryBudget()
+llm_breaker = CircuitBreaker()
+
+# Хеджирование (opt-in, LLM_HEDGING=1): долгий вызов дублируется после p90 его недавней
+# латентности, берется первый ответ. Дубль занимает свой слот лимитера с низшим приоритетом.
+hedger = Hedger()
+
+async def _hedge_invoke(hedge_chain, input_data):
+    async with llm_limiter.slot(SPECULATIVE_PRIORITY):
+        return await hedge_chain.ainvoke(input_data)
+
+# Слот лимитера берется на каждую попытку, а не на весь ретрай — бэкофф не держит слот.
+# metrics.track_llm_call снаружи ретрая: длительность вызова целиком, число ретраев, токены ответа.
+@metrics.track_llm_call(estimate_tokens)
+@llm_retry(retry_stats, retry_budget)
+async def _call_llm_with_retry(chain, input_data, role: str = "", hedge_chain=None):
+    retry_stats.attempts += 1
+    metrics.record_attempt()
+    probe = llm_breaker.before_call()
     try:
+        wait_start = time.perf_counter()
+        async with llm_limiter.slot(_role_priority(role)):
+            metrics.observe_queue_wait(role, time.perf_counter() - wait_start)
+            if hedge_chain is not None and hedger.applies_to(role):
+                result = await hedger.call(
+                    role,
+                    lambda: chain.ainvoke(input_data),
+                    lambda: _hedge_invoke(hedge_chain, input_data),
+                    can_hedge=llm_limiter.has_free_slot,
+                )
+            else:
+                result = await chain.ainvoke(input_data)
+    except Exception as e:
+        llm_breaker.record_failure(e, probe)
+        raise
+    except BaseException:
+        # CancelledError: иначе пробный запрос HALF_OPEN останется "в полете" навсегда
+        llm_breaker.record_cancelled(probe)
+        raise
+    llm_breaker.record_success()
+    retry_budget.record_success()
+    return result
+
+def _prompt_template(chain) -> Optional[ChatPromptTemplate]:
+    # chain = prompt | llm | parser, возможно обернутая with_config (TAG_NOSTREAM)
+    first = getattr(getattr(chain, "bound", chain), "first", None)
+    return first if isinstance(first, ChatPromptTemplate) else None
+
+def _fit_prompt(role: str, chain, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Обрезает переменные промпта до бюджета и логирует размер итогового промпта в токенах."""
+    input_data = token_budget.fit(role, input_data)
+    template = _prompt_template(chain)
+    if template is not None:
+        messages = template.format_messages(**input_data)
+        prompt_tokens = sum(estimate_tokens(m.content) for m in messages)
+    else:
+        prompt_tokens = sum(estimate_tokens(v) for v in input_data.values() if isinstance(v, str))
+    token_budget.record(role, prompt_tokens)
+    metrics.observe_prompt_tokens(role, prompt_tokens)
+    cfg = model_registry.get(role)
+    logger.info("llm call role=%s model=%s prompt_tokens=%d max_tokens=%s",
+                role, cfg.model, prompt_tokens, cfg.max_tokens)
+    return input_data
+
+# --- PROMPT CHAINS ---
+
+FEEDBACK_ROLES = ("TRIZ", "SYSTEM", "CRITIC")
+# Роли, чьи токены уходят в stream_mode="messages" (бот показывает их по мере генерации).
+# Остальные цепочки помечены TAG_NOSTREAM, чтобы не гонять лишние чанки через граф.
+STREAMING_ROLES = ("SYNTHESIZER",)
+
+class PromptChainCache:
+    """
+    Готовые цепочки `prompt | llm | StrOutputParser()` для каждой роли.
+    Ключ: (роль, есть ли фидбек, когнитивный тип, дубль для хеджа). Текст фидбека
+    подставляется как переменная шаблона, поэтому на горячем пути нет ни str.format,
+    ни парсинга ChatPromptTemplate. Кэш сбрасывается сам, если поменялись
+    PROMPTS, объекты llm / hedge_llm или model_registry.
+    """
+
+    def __init__(self):
+        self._chains: Dict[Any, Any] = {}
+        self._models_key = None
+        self._prompts_fingerprint = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint():
+        return hash(frozenset(PROMPTS.items()))
+
+    def _build(self, role: str, has_feedback: bool, cognitive_type: Optional[ProblemType], hedge: bool):
         system_msg = PROMPTS[role]
-        feedback_context = ""
 
         # Handle feedback injection
-        if role in ["TRIZ", "SYSTEM", "CRITIC"]:
-            if "FEEDBACK:" in context:
-                 feedback_context = f"\nВАЖНОЕ УТОЧНЕНИЕ ОТ ПОЛЬЗОВАТЕЛЯ: {context}"
+        if role in FEEDBACK_ROLES:
+            feedback_context = "\nВАЖНОЕ УТОЧНЕНИЕ ОТ ПОЛЬЗОВАТЕЛЯ: {feedback}" if has_feedback else ""
             system_msg = system_msg.format(feedback_context=feedback_context)
 
-        # --- [NEW] ВНЕДРЕНИЕ КОГНИТИВНОГО СЛОЯ ---
-        if role in ROLE_TO_COGNITIVE:
-            cognitive_type = ROLE_TO_COGNITIVE[role]
+        # --- ВНЕДРЕНИЕ КОГНИТИВНОГО СЛОЯ ---
+        if cognitive_type is not None:
             system_msg = scaffolder.enhance_prompt(system_msg, cognitive_type)
-        # -----------------------------------------
 
-        prompt_msgs = [("system", system_msg), ("user", "{input}")]
-        prompt = ChatPromptTemplate.from_messages(prompt_msgs)
-        chain = prompt | llm | StrOutputParser()
+        prompt = ChatPromptTemplate.from_messages([("system", system_msg), ("user", "{input}")])
+        chain = prompt | llm_for_role(role, hedge) | StrOutputParser()
+        if role not in STREAMING_ROLES:
+            chain = chain.with_config(tags=[TAG_NOSTREAM])
+        return chain
+
+    def get(self, role: str, has_feedback: bool = False, hedge: bool = False):
+        fingerprint = self._fingerprint()
+        models_key = (id(llm), id(hedge_llm), id(model_registry))
+        if self._models_key != models_key or self._prompts_fingerprint != fingerprint:
+            self.invalidate()
+            self._models_key = models_key
+            self._prompts_fingerprint = fingerprint
+
+        cognitive_type = ROLE_TO_COGNITIVE.get(role)
+        hedge = hedge and hedge_llm is not None
+        key = (role, has_feedback and role in FEEDBACK_ROLES, cognitive_type, hedge)
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    chain = self._build(role, key[1], cognitive_type, hedge)
+                    self._chains[key] = chain
+        return chain
+
+    def warm(self):
+        """Собирает цепочки для всех ролей заранее (вызывается на старте бота)."""
+        for role in PROMPTS:
+            self.get(role)
+            if role in FEEDBACK_ROLES:
+                self.get(role, has_feedback=True)
+
+    def invalidate(self):
+        with self._lock:
+            self._chains.clear()
+
+prompt_chains = PromptChainCache()
 
-        return await _call_llm_with_retry(chain, {"input": user_query if user_query else context})
+async def call_llm_async(role: str, context: str, user_query: str = "") -> str:
+    try:
+        has_feedback = role in FEEDBACK_ROLES and "FEEDBACK:" in context
+        chain = prompt_chains.get(role, has_feedback)
+        hedge_chain = prompt_chains.get(role, has_feedback, hedge=True) if hedger.applies_to(role) else None
+
+        input_data = {"input": user_query if user_query else context}
+        if has_feedback:
+            input_data["feedback"] = context
+        input_data = _fit_prompt(role, chain, input_data)
 
+        return await _call_llm_with_retry(chain, input_data, role, hedge_chain)
+
+    except LLMOverloaded:
+        # Пробрасываем до бота: пользователь получит быстрый ответ "занят"
+        raise
     except RetryError:
         return "⚠️ Сервис временно недоступен (все попытки исчерпаны)."
+    except CircuitOpenError:
+        return "⚠️ Сервис временно недоступен (слишком много ошибок подряд, пауза)."
     except Exception as e:
         return f"⚠️ Ошибка: {str(e)}"
 
 # --- NODES ---
 
+async def node_pre_classifier(state: AgentState):
+    # Без сетевого вызова: если локальный вердикт уверенный, LLM-оркестратор пропускается.
+    # Пустой mode = "не уверен" (перетирает mode прошлого прогона из чекпоинта),
+    # speculative_hit сбрасываем по той же причине — оркестратор может быть пропущен.
+    verdict = intent_classifier.classify(state['user_query'])
+    return {"mode": verdict.mode if verdict else "", "speculative_hit": False}
+
 async def node_orchestrator(state: AgentState):
     query = state['user_query']
     mode = await call_llm_async("ORCHESTRATOR", "", query)
@@ -194,27 +473,78 @@ async def node_orchestrator(state: AgentState):
             break
     if not found:
         mode = "SOLVER"
+    else:
+        intent_classifier.record(query, mode)
 
     return {"mode": mode}
 
+async def node_orchestrator_speculative(state: AgentState):
+    """
+    Оркестратор + спекулятивный запуск TRIZ/SYSTEM/CRITIC в тот же момент.
+    SOLVER -> результаты солверов сохраняются, узел solvers пропускается.
+    Любой другой режим (CHITCHAT или пре-шаг THERAPIST/CONSIGLIERE/RETRY, от которого
+    зависит контекст солверов) -> задача отменяется или результат выбрасывается.
+    """
+    # Контекст как у свежего хода SOLVER: mode/original_task/feedback в чекпоинте — от прошлого
+    # прогона (после RETRY там старая задача), а режим этого хода еще не известен
+    context_for_agents = _build_solver_context({**state, "mode": "SOLVER", "original_task": "", "feedback": ""})
+    # Задача копирует контекст: ее LLM-вызовы получат низший приоритет в llm_limiter
+    token = _speculative_call.set(True)
+    try:
+        speculative = asyncio.create_task(_run_solvers(context_for_agents))
+    finally:
+        _speculative_call.reset(token)
+    speculation_stats.launched += 1
+
+    try:
+        mode = (await node_orchestrator(state))["mode"]
+    except BaseException:
+        speculative.cancel()
+        raise
+
+    if mode == "SOLVER":
+        try:
+            triz_res, sys_res, crit_res = await speculative
+        except LLMOverloaded:
+            # Спекулятивные вызовы сброшены лимитером — обычный путь через узел solvers
+            speculation_stats.shed += 1
+            return {"mode": mode, "speculative_hit": False}
+        speculation_stats.hits += 1
+        return {"mode": mode, "speculative_hit": True,
+                "triz_out": triz_res, "system_out": sys_res, "critic_out": crit_res}
+
+    # Промах: считаем потраченные впустую токены (промпты уже ушли в API)
+    wasted = 3 * estimate_tokens(context_for_agents) + sum(
+        estimate_tokens(PROMPTS[role]) for role in FEEDBACK_ROLES
+    )
+    if speculative.done() and not speculative.cancelled() and speculative.exception() is None:
+        speculation_stats.discarded += 1
+        wasted += sum(estimate_tokens(out) for out in speculative.result())
+    else:
+        speculation_stats.cancelled += 1
+        speculative.cancel()
+    speculation_stats.wasted_tokens += wasted
+
+    return {"mode": mode, "speculative_hit": False}
+
 async def node_therapist(state: AgentState):
     query = state['user_query']
     response = await call_llm_async("THERAPIST", "", query)
-    new_messages = state['messages'] + [AIMessage(content=f"[Терапевт]: {response}")]
-    return {"messages": new_messages}
+    return {"messages": [AIMessage(content=f"[Терапевт]: {response}")]}
 
 async def node_consigliere(state: AgentState):
     query = state['user_query']
     response = await call_llm_async("CONSIGLIERE", "", query)
-    new_messages = state['messages'] + [AIMessage(content=f"[Консильери]: {response}")]
-    return {"messages": new_messages}
+    return {"messages": [AIMessage(content=f"[Консильери]: {response}")]}
 
 async def node_post_mortem(state: AgentState):
     history_text = "\n".join([f"{m.type}: {m.content}" for m in state['messages'][-5:]])
+    if state.get('memory'):
+        history_text = f"EARLIER: {state['memory']}\n{history_text}"
     feedback = await call_llm_async("POST_MORTEM", history_text)
     return {"feedback": feedback}
 
-async def node_solvers(state: AgentState):
+def _build_solver_context(state: AgentState) -> str:
     query = state['user_query']
     original_task = state.get('original_task', "")
     feedback = state.get('feedback', "")
@@ -236,30 +566,133 @@ async def node_solvers(state: AgentState):
     context_for_agents = f"{context_prefix}USER TASK: {current_task}"
     if feedback:
         context_for_agents = f"FEEDBACK: {feedback}\n{context_for_agents}"
+    return context_for_agents
 
-    triz_res, sys_res, crit_res = await asyncio.gather(
+async def _run_solvers(context_for_agents: str):
+    return await asyncio.gather(
         call_llm_async("TRIZ", context_for_agents, context_for_agents),
         call_llm_async("SYSTEM", context_for_agents, context_for_agents),
         call_llm_async("CRITIC", context_for_agents, context_for_agents)
     )
 
+async def node_solvers(state: AgentState):
+    triz_res, sys_res, crit_res = await _run_solvers(_build_solver_context(state))
     return {"triz_out": triz_res, "system_out": sys_res, "critic_out": crit_res}
 
+# --- FACT CHECKING ---
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_CLAIM_LABEL = re.compile(r"^[\w\s-]{1,20}:\s*")  # "РИСК:", "Bottleneck:", "Inversion:"
+_CLAIM_MAX_CHARS = 120
+
+def extract_claims(text: str, limit: int) -> List[str]:
+    """Достает из ответа солвера до `limit` проверяемых утверждений (короткие поисковые запросы)."""
+    if not text or text.startswith("⚠️") or limit <= 0:
+        return []
+    claims = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        sentence = _CLAIM_LABEL.sub("", sentence.replace("*", "").replace("#", "").strip())
+        if len(sentence.split()) < 4:
+            continue
+        if len(sentence) > _CLAIM_MAX_CHARS:
+            sentence = sentence[:_CLAIM_MAX_CHARS].rsplit(" ", 1)[0]
+        claims.append(sentence.rstrip(".!?"))
+        if len(claims) >= limit:
+            break
+    return claims
+
+def collect_claims(outputs: List[str], max_claims: int = FACT_CHECK_MAX_CLAIMS) -> List[str]:
+    """Утверждения из всех солверов по кругу (TRIZ, SYSTEM, CRITIC, TRIZ...), без дублей."""
+    per_output = [extract_claims(out, max_claims) for out in outputs]
+    claims, seen = [], set()
+    for i in range(max_claims):
+        for group in per_output:
+            if i < len(group) and group[i].lower() not in seen:
+                seen.add(group[i].lower())
+                claims.append(group[i])
+    return claims[:max_claims]
+
+async def _search_claim(claim: str, semaphore: asyncio.Semaphore) -> str:
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(search.invoke, claim), FACT_CHECK_TIMEOUT)
+        except asyncio.TimeoutError:
+            return f"Ошибка поиска: таймаут ({FACT_CHECK_TIMEOUT:.0f}s) для '{claim}'"
+        except Exception as e:
+            return f"Ошибка поиска: {e}"
+
+async def search_claims(claims: List[str], semaphore: Optional[asyncio.Semaphore] = None) -> List[str]:
+    semaphore = semaphore or asyncio.Semaphore(FACT_CHECK_CONCURRENCY)
+    return list(await asyncio.gather(*(_search_claim(c, semaphore) for c in claims)))
+
+def merge_research(results: List[str], max_chars: int = FACT_CHECK_MAX_CHARS) -> str:
+    """Склеивает результаты поиска: дубли (по блоку Title/Snippet/Link) выкидываются, общий объем ограничен."""
+    blocks, seen, errors = [], set(), []
+    for result in results:
+        if not result or result == "No results found.":
+            continue
+        if result.startswith(("Ошибка поиска:", "Search Error:", "Error:")):
+            errors.append(result)
+            continue
+        for block in result.split("\n\n"):
+            key = block.strip().lower()
+            if key and key not in seen:
+                seen.add(key)
+                blocks.append(block.strip())
+
+    merged, size = [], 0
+    for block in blocks:
+        if size + len(block) > max_chars:
+            break
+        merged.append(block)
+        size += len(block) + 2
+
+    if merged:
+        return "\n\n".join(merged)
+    return errors[0] if errors else "No results found."
+
 async def node_fact_checker(state: AgentState):
-    search_query = state['triz_out'][:100]
-    try:
-        search_res = await asyncio.to_thread(search.invoke, search_query)
-    except Exception as e:
-        search_res = f"Ошибка поиска: {e}"
-    return {"research_output": search_res}
+    claims = collect_claims([state['triz_out'], state['system_out'], state['critic_out']])
+    if not claims:
+        # Fallback на старое поведение: первые 100 символов идеи ТРИЗ
+        claims = [state['triz_out'][:100]]
+    return {"research_output": merge_research(await search_claims(claims))}
+
+async def _solve_and_check(role: str, context_for_agents: str, claims_limit: int,
+                           semaphore: asyncio.Semaphore):
+    output = await call_llm_async(role, context_for_agents, context_for_agents)
+    return output, await search_claims(extract_claims(output, claims_limit), semaphore)
+
+async def node_solvers_pipelined(state: AgentState):
+    """
+    Конвейерный режим: каждый солвер сразу отправляет свои утверждения в поиск.
+    Латентность поиска прячется за самым медленным LLM-ответом, а не прибавляется к нему.
+    Контракт состояния тот же: triz_out / system_out / critic_out / research_output.
+    """
+    context_for_agents = _build_solver_context(state)
+    semaphore = asyncio.Semaphore(FACT_CHECK_CONCURRENCY)
+    roles = FEEDBACK_ROLES
+    # Делим бюджет утверждений между солверами (4 -> 2/1/1)
+    limits = [FACT_CHECK_MAX_CLAIMS // len(roles) + (1 if i < FACT_CHECK_MAX_CLAIMS % len(roles) else 0)
+              for i in range(len(roles))]
 
-async def node_synthesizer(state: AgentState):
-    system_msg = PROMPTS["SYNTHESIZER"]
+    (triz_res, triz_found), (sys_res, sys_found), (crit_res, crit_found) = await asyncio.gather(*(
+        _solve_and_check(role, context_for_agents, limit, semaphore) for role, limit in zip(roles, limits)
+    ))
 
-    # --- [NEW] ВНЕДРЕНИЕ КОГНИТИВНОГО СЛОЯ ---
-    # Синтезатор должен использовать строгий диагноз, чтобы отфильтровать бред
-    system_msg = scaffolder.enhance_prompt(system_msg, ProblemType.DIAGNOSIS)
-    # -----------------------------------------
+    results = triz_found + sys_found + crit_found
+    if not results:
+        # Ни одного утверждения — как в node_fact_checker, проверяем начало идеи ТРИЗ
+        results = await search_claims([triz_res[:100]], semaphore)
+
+    return {"triz_out": triz_res, "system_out": sys_res, "critic_out": crit_res,
+            "research_output": merge_research(results)}
+
+async def node_synthesizer(state: AgentState):
+    # Синтезатор использует строгий диагноз (DIAGNOSIS), чтобы отфильтровать бред —
+    # см. ROLE_TO_COGNITIVE; цепочка берется из кэша prompt_chains.
+    # Токены вердикта стримятся через stream_mode="messages" (см. STREAMING_ROLES).
+    chain = prompt_chains.get("SYNTHESIZER")
 
     research_data = state.get("research_output", "Нет данных")
 
@@ -270,53 +703,228 @@ async def node_synthesizer(state: AgentState):
     Критик: {state['critic_out']}
     """
 
-    prompt = ChatPromptTemplate.from_messages([("system", system_msg), ("user", "{input}")])
-    chain = prompt | llm | StrOutputParser()
-
-    verdict = await _call_llm_with_retry(chain, {
+    input_data = _fit_prompt("SYNTHESIZER", chain, {
         "input": context,
         "research_data": research_data
     })
+    verdict = await _call_llm_with_retry(chain, input_data, "SYNTHESIZER")
 
     return {"final_verdict": verdict}
 
+# --- RESPONSE CACHE ---
+
+def _cacheable(state: AgentState) -> bool:
+    # Кэшируем только "чистый" SOLVER: фидбек и пре-шаги делают ответ персональным
+    return state.get('mode') == "SOLVER" and not state.get('feedback')
+
+async def node_cache_lookup(state: AgentState):
+    if not _cacheable(state):
+        return {"cache_hit": False}
+    entry = await response_cache.aget(state['user_query'], model_registry.get("SYNTHESIZER").model)
+    if entry is None:
+        return {"cache_hit": False}
+    return {"cache_hit": True, **entry.values}
+
+async def node_cache_store(state: AgentState):
+    verdict = state.get('final_verdict', "")
+    if _cacheable(state) and verdict and not verdict.startswith("⚠️"):
+        await response_cache.aput(state['user_query'], model_registry.get("SYNTHESIZER").model,
+                                  {f: state.get(f, "") for f in CACHED_FIELDS})
+    return {}
+
+# --- HISTORY COMPACTION ---
+
+# Поля одного прогона: после ответа они не нужны и не должны раздувать чекпоинт
+PER_RUN_FIELDS = {
+    "triz_out": "", "system_out": "", "critic_out": "", "research_output": "",
+    "feedback": "", "final_verdict": "", "speculative_hit": False, "cache_hit": False,
+}
+# Режимы, в которых запрос считается задачей (для RETRY), как в main.py
+TASK_MODES = ("SOLVER", "THERAPIST", "CONSIGLIERE")
+
+def _extractive_memory(memory: str, messages: List[BaseMessage]) -> str:
+    # Запасной вариант без LLM: по строке на реплику, самое новое в конце
+    lines = [f"{m.type}: {' '.join(str(m.content).split())[:200]}" for m in messages]
+    return "\n".join(filter(None, [memory] + lines))
+
+async def summarize_history(memory: str, messages: List[BaseMessage]) -> str:
+    text = "\n".join(f"{m.type}: {m.content}" for m in messages)
+    try:
+        summary = await call_llm_async("SUMMARIZER", f"ПРЕЖНЯЯ СВОДКА: {memory or '-'}\nНОВЫЕ РЕПЛИКИ:\n{text}")
+    except LLMOverloaded:
+        summary = ""
+    if not summary or summary.startswith("⚠️"):
+        summary = _extractive_memory(memory, messages)
+    if estimate_tokens(summary) > MEMORY_MAX_TOKENS:
+        summary = token_budget.tokenizer.truncate(summary, MEMORY_MAX_TOKENS)
+    return summary
+
+async def node_compact(state: AgentState):
+    """
+    Последний узел прогона: вердикт уходит в историю, история ограничивается окном
+    HISTORY_WINDOW (старое — в memory), поля прогона очищаются до записи чекпоинта.
+    Бот отправляет вердикт по событию updates синтезатора, не дожидаясь этого узла.
+    """
+    update: Dict[str, Any] = dict(PER_RUN_FIELDS)
+    new_messages = [AIMessage(content=state['final_verdict'])] if state.get('final_verdict') else []
+    if state.get('mode') in TASK_MODES:
+        update["original_task"] = state['user_query']
+
+    messages = list(state.get('messages', [])) + new_messages
+    if len(messages) > HISTORY_WINDOW + HISTORY_SUMMARY_BATCH:
+        old, kept = messages[:-HISTORY_WINDOW], messages[-HISTORY_WINDOW:]
+        update["memory"] = await summarize_history(state.get('memory', ""), old)
+        update["messages"] = [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + kept
+    elif new_messages:
+        update["messages"] = new_messages
+    return update
+
 # --- WORKFLOW ---
 
-def get_graph(checkpointer=None):
+def get_graph(checkpointer=None, fast_path: bool = INTENT_FAST_PATH, speculative: bool = SPECULATIVE_SOLVERS,
+              pipelined: bool = PIPELINED_FACT_CHECK, cached: bool = RESPONSE_CACHE_ENABLED,
+              compact: bool = HISTORY_COMPACTION):
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("orchestrator", node_orchestrator)
-    workflow.add_node("therapist", node_therapist)
-    workflow.add_node("consigliere", node_consigliere)
-    workflow.add_node("post_mortem", node_post_mortem)
-    workflow.add_node("solvers", node_solvers)
-    workflow.add_node("fact_checker", node_fact_checker)
-    workflow.add_node("synthesizer", node_synthesizer)
-
-    workflow.set_entry_point("orchestrator")
+    def add_node(name, fn):
+        # Каждый узел — под метриками (длительность, ошибки, режим) и спаном OpenTelemetry
+        workflow.add_node(name, metrics.instrument_node(name, fn))
+
+    if fast_path:
+        add_node("pre_classifier", node_pre_classifier)
+    add_node("orchestrator", node_orchestrator_speculative if speculative else node_orchestrator)
+    add_node("therapist", node_therapist)
+    add_node("consigliere", node_consigliere)
+    add_node("post_mortem", node_post_mortem)
+    add_node("solvers", node_solvers_pipelined if pipelined else node_solvers)
+    add_node("fact_checker", node_fact_checker)
+    add_node("synthesizer", node_synthesizer)
+    if cached:
+        add_node("cache_lookup", node_cache_lookup)
+        add_node("cache_store", node_cache_store)
+    if compact:
+        add_node("compact", node_compact)
+
+    # Все ветки заканчиваются сжатием истории (если включено)
+    finish = "compact" if compact else END
+
+    # SOLVER сначала заглядывает в кэш ответов (если включен)
+    solver_entry = "cache_lookup" if cached else "solvers"
 
     def route(state):
         mode = state['mode']
-        if mode == "CHITCHAT": return END
+        if mode == "CHITCHAT": return finish
         if mode == "THERAPIST": return "therapist"
         if mode == "CONSIGLIERE": return "consigliere"
         if mode == "RETRY": return "post_mortem"
-        return "solvers"
+        return solver_entry
 
-    workflow.add_conditional_edges("orchestrator", route, {
-        END: END,
+    route_map = {
+        finish: finish,
         "therapist": "therapist",
         "consigliere": "consigliere",
         "post_mortem": "post_mortem",
-        "solvers": "solvers"
-    })
+        solver_entry: solver_entry
+    }
+
+    if fast_path:
+        def route_fast(state):
+            # Локальный вердикт уверенный -> сразу в нужную ветку, иначе спрашиваем LLM
+            return route(state) if state.get('mode') else "orchestrator"
+
+        workflow.set_entry_point("pre_classifier")
+        workflow.add_conditional_edges("pre_classifier", route_fast, {**route_map, "orchestrator": "orchestrator"})
+    else:
+        workflow.set_entry_point("orchestrator")
+
+    if speculative:
+        def route_speculative(state):
+            # Солверы уже отработали внутри оркестратора
+            if state['mode'] == "SOLVER" and state.get('speculative_hit'):
+                return solver_entry if cached else "fact_checker"
+            return route(state)
+
+        workflow.add_conditional_edges("orchestrator", route_speculative, {**route_map, "fact_checker": "fact_checker"})
+    else:
+        workflow.add_conditional_edges("orchestrator", route, route_map)
+
+    if cached:
+        def route_cache(state):
+            if state.get('cache_hit'):
+                return finish
+            if speculative and state.get('speculative_hit'):
+                return "fact_checker"
+            return "solvers"
+
+        workflow.add_conditional_edges("cache_lookup", route_cache, {finish: finish, "fact_checker": "fact_checker", "solvers": "solvers"})
 
     workflow.add_edge("therapist", "solvers")
     workflow.add_edge("consigliere", "solvers")
     workflow.add_edge("post_mortem", "solvers")
-    workflow.add_edge("solvers", "fact_checker")
+    if pipelined:
+        # research_output уже готов; fact_checker нужен только после спекулятивного попадания
+        workflow.add_edge("solvers", "synthesizer")
+    else:
+        workflow.add_edge("solvers", "fact_checker")
     workflow.add_edge("fact_checker", "synthesizer")
-    workflow.add_edge("synthesizer", END)
+    if cached:
+        workflow.add_edge("synthesizer", "cache_store")
+        workflow.add_edge("cache_store", finish)
+    else:
+        workflow.add_edge("synthesizer", finish)
+    if compact:
+        workflow.add_edge("compact", END)
 
     # Use checkpointer if provided
     return workflow.compile(checkpointer=checkpointer)
+
+# --- GRAPH REGISTRY ---
+
+class GraphRegistry:
+    """
+    Кэш скомпилированных графов: один экземпляр на (checkpointer, опции).
+    Скомпилированный граф не хранит состояние прогона, поэтому его можно
+    делить между конкурентными хендлерами бота.
+    """
+
+    def __init__(self):
+        self._graphs: Dict[Any, Any] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(checkpointer, options: Dict[str, Any]):
+        # id() — чекпоинтер может быть нехэшируемым; сам объект держим в значении,
+        # чтобы id не переиспользовался после сборки мусора.
+        return (id(checkpointer), tuple(sorted(options.items())))
+
+    def get(self, checkpointer=None, **options):
+        key = self._key(checkpointer, options)
+        entry = self._graphs.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._graphs.get(key)
+                if entry is None:
+                    entry = (checkpointer, get_graph(checkpointer=checkpointer, **options))
+                    self._graphs[key] = entry
+        return entry[1]
+
+    def rebuild(self):
+        """Сбрасывает кэш (после смены PROMPTS / модели). Следующий get() перекомпилирует граф."""
+        with self._lock:
+            self._graphs.clear()
+
+    def __len__(self):
+        return len(self._graphs)
+
+graph_registry = GraphRegistry()
+
+# Счетчики существующих *Stats — в /metrics (см. metrics.StatsCollector)
+metrics.register_stats("search_cache", lambda: search.stats.as_dict())
+metrics.register_stats("response_cache", lambda: response_cache.stats.as_dict())
+metrics.register_stats("llm_retry", retry_stats.as_dict)
+# state_code: 0 closed, 1 half-open, 2 open
+metrics.register_stats("llm_breaker", llm_breaker.as_dict, gauges=("state_code", "failures"))
+metrics.register_stats("llm_limiter", llm_limiter.stats.as_dict, gauges=("max_wait_seconds",))
+metrics.register_stats("llm_hedge", hedger.stats.as_dict)
+metrics.register_stats("speculation", speculation_stats.as_dict)
+metrics.register_stats("llm_http", http_pool.stats.as_dict, gauges=("reuse_ratio",))
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import pickle
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Dict
+
+# --- CONFIG ---
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.85"))
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", "")      # JSONL с классификациями LLM (данные для обучения)
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "")  # pickle обученной TF-IDF модели (опционально)
+
+
+@dataclass
+class IntentVerdict:
+    mode: str
+    confidence: float
+    source: str  # "rules" | "model"
+
+
+class RuleClassifier:
+    """
+    Быстрые правила (regex) для очевидных случаев. Отвечает только CHITCHAT / RETRY:
+    SOLVER по ключевым словам слишком широк ("клиенты уходят" бывает и паникой),
+    его отдает только обученная модель. THERAPIST и CONSIGLIERE всегда решает LLM.
+    """
+
+    CHITCHAT = re.compile(
+        r"^(привет\w*|здравствуй\w*|добр\w+ (утро|день|вечер)|хай|хеллоу|hi|hello|hey|"
+        r"как дела|как ты|спасибо|благодарю|пока|до свидания|ок|окей|ok|thanks)[\s!?.,)]*$"
+    )
+    # Только короткая жалоба целиком ("не то, попробуй еще раз"): те же слова внутри нового
+    # вопроса ("Предложи другой вариант ценообразования") — не RETRY
+    RETRY = re.compile(
+        r"^((давай |это )?(попробуй (ещ[её] раз|снова)|ещ[её] раз|не то|фигня|ерунда|переделай|не подходит|"
+        r"другой вариант|не работает|try again)[\s!?.,)]*)+$"
+    )
+    # Эмоции и серая этика — локальный вердикт не выносится ни правилами, ни моделью.
+    # Основы слов, а не словоформы: "серые схемы", "страшно", "в отчаянии"
+    ESCALATION = re.compile(
+        r"(страх|страш|боюсь|паник|ужас|отчаян|депресс|ненавиж|не могу больше|помогите|рушит|"
+        r"обойти|незаконн|нелегальн|налог\w* (схем|уклон)|\bсер(ая|ой|ую|ые|ых|ыми|ым)\b|\bчерн(ая|ой|ую|ые|ых|ыми|ым)\b|в черную|"
+        r"взлом|обман|поддел|\bслить\b|\bслив\b|уволить.*\bбез\b|без выплат|чтобы (он|она|они) не узнал)"
+    )
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def is_escalation(self, query: str) -> bool:
+        return bool(self.ESCALATION.search(self.normalize(query)))
+
+    def classify(self, query: str) -> Optional[IntentVerdict]:
+        text = self.normalize(query)
+        if not text:
+            return None
+
+        if self.CHITCHAT.match(text):
+            return IntentVerdict("CHITCHAT", 0.95, "rules")
+
+        if self.ESCALATION.search(text):
+            return None
+
+        if self.RETRY.match(text):
+            return IntentVerdict("RETRY", 0.9, "rules")
+
+        return None
+
+
+class TfidfIntentModel:
+    """
+    Маленькая локальная модель (TF-IDF + логистическая регрессия), обучается на
+    залогированных решениях Оркестратора. scikit-learn — опциональная зависимость.
+    """
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+
+    @classmethod
+    def train(cls, records: List[Dict[str, str]]) -> "TfidfIntentModel":
+        from sklearn.pipeline import make_pipeline
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        texts = [r["query"] for r in records]
+        labels = [r["mode"] for r in records]
+        pipeline = make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), lowercase=True, sublinear_tf=True),
+            LogisticRegression(max_iter=1000),
+        )
+        pipeline.fit(texts, labels)
+        return cls(pipeline)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["TfidfIntentModel"]:
+        try:
+            with open(path, "rb") as f:
+                return cls(pickle.load(f))
+        except (OSError, ImportError, pickle.UnpicklingError, AttributeError):
+            return None
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self.pipeline, f)
+
+    def classify(self, query: str) -> Optional[IntentVerdict]:
+        if self.pipeline is None:
+            return None
+        probs = self.pipeline.predict_proba([query])[0]
+        best = probs.argmax()
+        return IntentVerdict(str(self.pipeline.classes_[best]), float(probs[best]), "model")
+
+
+class IntentClassifier:
+    """
+    Пре-классификатор перед node_orchestrator: правила (CHITCHAT / RETRY), затем (если есть)
+    локальная модель — только она может отдать SOLVER.
+    Возвращает вердикт только если уверенность >= threshold, иначе None — решает LLM.
+    """
+
+    LOCAL_MODES = ("CHITCHAT", "RETRY", "SOLVER")
+
+    def __init__(self, threshold: float = INTENT_CONFIDENCE_THRESHOLD,
+                 model: Optional[TfidfIntentModel] = None, log_path: str = INTENT_LOG_PATH):
+        self.threshold = threshold
+        self.rules = RuleClassifier()
+        self.model = model
+        self.log_path = log_path
+        self._log_lock = threading.Lock()
+
+    def classify(self, query: str) -> Optional[IntentVerdict]:
+        if self.rules.is_escalation(query):
+            # Эмоции / серая этика: только LLM может выбрать THERAPIST или CONSIGLIERE
+            return None
+
+        for stage in (self.rules, self.model):
+            if stage is None:
+                continue
+            verdict = stage.classify(query)
+            if verdict and verdict.mode in self.LOCAL_MODES and verdict.confidence >= self.threshold:
+                return verdict
+        return None
+
+    def record(self, query: str, mode: str):
+        """Логирует решение LLM-оркестратора (JSONL) — обучающие данные для TfidfIntentModel."""
+        if not self.log_path:
+            return
+        line = json.dumps({"query": query, "mode": mode}, ensure_ascii=False)
+        with self._log_lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def load_records(path: str) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_default_classifier() -> IntentClassifier:
+    model = TfidfIntentModel.load(INTENT_MODEL_PATH) if INTENT_MODEL_PATH else None
+    return IntentClassifier(model=model)
+
+
+if __name__ == "__main__":
+    # Обучение: python intent_classifier.py intents.jsonl intent_model.pkl
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python intent_classifier.py <log.jsonl> <model.pkl>")
+        sys.exit(1)
+
+    records = load_records(sys.argv[1])
+    TfidfIntentModel.train(records).save(sys.argv[2])
+    print(f"Trained on {len(records)} records -> {sys.argv[2]}")
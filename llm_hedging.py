@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+# --- CONFIG ---
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_ROLES = tuple(r.strip() for r in os.getenv("LLM_HEDGE_ROLES", "TRIZ,SYSTEM,CRITIC").split(",") if r.strip())
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))  # дубль после p90 недавней латентности
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))    # секунд, не раньше
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))   # без истории не хеджируем
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))          # доля дублей от числа вызовов
+LLM_HEDGE_FALLBACK_MODEL = os.getenv("LLM_HEDGE_FALLBACK_MODEL", "")    # модель для дубля; пусто = та же
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0        # дубль ответил раньше основного запроса
+    budget_denied: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class LatencyTracker:
+    """Скользящее окно латентностей успешных вызовов по ролям."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, role: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(role, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, role: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = self._samples.get(role)
+            if not samples or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """Token bucket: каждый вызов добавляет `ratio` токена, каждый дубль тратит один."""
+
+    def __init__(self, ratio: float = LLM_HEDGE_BUDGET, max_tokens: float = 5.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class Hedger:
+    """
+    Хеджированные запросы: если вызов не вернулся за p-й перцентиль своей недавней
+    латентности, запускается дубль (возможно, на запасную модель). Берется первый
+    успешный ответ, проигравший отменяется. Число дублей ограничено HedgeBudget.
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGING, roles=LLM_HEDGE_ROLES,
+                 percentile: float = LLM_HEDGE_PERCENTILE, min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES, budget: Optional[HedgeBudget] = None):
+        self.enabled = enabled
+        self.roles = set(roles)
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget if budget is not None else HedgeBudget()
+        self.latency = LatencyTracker()
+        self.stats = HedgeStats()
+
+    def applies_to(self, role: str) -> bool:
+        return self.enabled and role in self.roles
+
+    def delay_for(self, role: str) -> Optional[float]:
+        p = self.latency.percentile(role, self.percentile, self.min_samples)
+        return None if p is None else max(self.min_delay, p)
+
+    async def call(self, role: str, primary: Callable[[], Awaitable], backup: Callable[[], Awaitable],
+                   can_hedge: Callable[[], bool] = lambda: True):
+        self.stats.calls += 1
+        self.budget.record_call()
+        start = time.monotonic()
+        delay = self.delay_for(role)
+
+        first = asyncio.ensure_future(primary())
+        tasks = {first}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and can_hedge():
+                    if self.budget.try_spend():
+                        self.stats.hedged += 1
+                        tasks.add(asyncio.ensure_future(backup()))
+                    else:
+                        self.stats.budget_denied += 1
+
+            last_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        # Победа дубля: латентность основного как минимум столько же — пишем нижнюю границу
+                        self.latency.record(role, time.monotonic() - start)
+                        if task is not first:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
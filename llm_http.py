@@ -0,0 +1,112 @@
+import os
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"                                # нужен пакет h2, иначе HTTP/1.1
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "64"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "32"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "90"))  # секунд простоя до закрытия
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))                 # между чанками ответа
+LLM_WRITE_TIMEOUT = float(os.getenv("LLM_WRITE_TIMEOUT", "10"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))                 # ожидание свободного соединения
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    connections: int = 0          # новые TCP-соединения
+    tls_handshakes: int = 0
+    http_versions: Counter = field(default_factory=Counter)
+
+    @property
+    def reused(self) -> int:
+        return max(0, self.requests - self.connections)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused": self.reused,
+            "reuse_ratio": round(self.reused / self.requests, 3) if self.requests else 0.0,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+class SharedHTTPClient:
+    """
+    Один httpx.AsyncClient на процесс для всех ChatOpenAI (все роли и модели):
+    keep-alive, HTTP/2 (если установлен h2), лимиты пула и раздельные таймауты.
+    Через trace-расширение httpcore считает новые соединения и TLS-рукопожатия.
+    """
+
+    def __init__(self, http2: bool = LLM_HTTP2, max_connections: int = LLM_POOL_MAX_CONNECTIONS,
+                 max_keepalive: int = LLM_POOL_MAX_KEEPALIVE, keepalive_expiry: float = LLM_POOL_KEEPALIVE_EXPIRY,
+                 timeout: Optional[httpx.Timeout] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        if http2 and not http2_available():
+            logger.warning("LLM_HTTP2=1, но пакет h2 не установлен — используется HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = timeout or httpx.Timeout(connect=LLM_CONNECT_TIMEOUT, read=LLM_READ_TIMEOUT,
+                                                write=LLM_WRITE_TIMEOUT, pool=LLM_POOL_TIMEOUT)
+        self.transport = transport
+        self.stats = ConnectionStats()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Создается при первом обращении (engine._make_llm); после aclose() — заново
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.AsyncClient(
+                    http2=self.http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    transport=self.transport,
+                    event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                )
+            return self._client
+
+    async def _on_request(self, request: httpx.Request):
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response: httpx.Response):
+        self.stats.requests += 1
+        self.stats.http_versions[response.http_version] += 1
+
+    async def _trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.stats.connections += 1
+        elif event == "connection.start_tls.complete":
+            self.stats.tls_handshakes += 1
+
+    async def aclose(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+            logger.info("LLM HTTP pool closed: %s", self.stats.as_dict())
+
+
+http_pool = SharedHTTPClient()
@@ -0,0 +1,114 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, List
+
+# --- CONFIG ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # одновременных запросов к LLM на процесс
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))              # ожидающих слота; сверх — отказ
+
+
+class LLMOverloaded(Exception):
+    """Очередь к LLM переполнена — запрос отклонен сразу (load shedding)."""
+
+
+@dataclass
+class LimiterStats:
+    acquired: int = 0
+    queued: int = 0
+    shed: int = 0
+    wait_seconds_total: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return asdict(self)
+
+
+class PriorityLimiter:
+    """
+    Процессный async-семафор с приоритетами: меньшее число = выше приоритет.
+    Освободившийся слот отдается ожидающему с наивысшим приоритетом (FIFO внутри приоритета).
+    Очередь ожидания ограничена: при переполнении вытесняется худший ожидающий (низший
+    приоритет, пришедший последним), если новый запрос важнее, иначе отклоняется сам новый.
+    Отклоненный запрос получает LLMOverloaded.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.stats = LimiterStats()
+        self._waiters: List[tuple] = []  # heap: (priority, seq, future)
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def has_free_slot(self) -> bool:
+        return self.active < self.max_concurrency and not self.waiting
+
+    def _worst_waiter(self):
+        live = [entry for entry in self._waiters if not entry[2].done()]
+        return max(live, key=lambda entry: (entry[0], entry[1])) if live else None
+
+    def overloaded(self, priority: int = 0) -> bool:
+        """True, если запрос с таким приоритетом сейчас был бы отклонен (для быстрого ответа в боте)."""
+        if self.active < self.max_concurrency or self.waiting < self.max_queue:
+            return False
+        worst = self._worst_waiter()
+        return worst is None or worst[0] <= priority
+
+    async def acquire(self, priority: int = 0) -> float:
+        """Возвращает время ожидания слота в секундах."""
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            self.stats.acquired += 1
+            return 0.0
+
+        if self.waiting >= self.max_queue:
+            worst = self._worst_waiter()
+            self.stats.shed += 1
+            if worst is None or worst[0] <= priority:
+                raise LLMOverloaded(f"LLM queue is full ({self.max_queue} waiting)")
+            # Место в очереди освобождает менее важный запрос (например, спекулятивный)
+            worst[2].set_exception(LLMOverloaded(f"LLM queue is full, evicted by priority {priority}"))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self.stats.queued += 1
+        start = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже передан нам, но нас отменили — отдаем следующему
+                self.release()
+            raise
+
+        waited = time.monotonic() - start
+        self.stats.acquired += 1
+        self.stats.wait_seconds_total += waited
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        return waited
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Слот переходит к ожидающему, active не меняется
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
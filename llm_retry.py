@@ -0,0 +1,244 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+import openai
+from tenacity import retry, retry_if_exception, stop_after_attempt
+from tenacity.stop import stop_base
+from tenacity.wait import wait_base
+
+from llm_limiter import LLMOverloaded
+
+# --- CONFIG ---
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BUDGET_SECONDS = float(os.getenv("LLM_RETRY_BUDGET_SECONDS", "20"))  # на один LLM-запрос, включая ожидания
+LLM_RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "10"))
+LLM_RETRY_RATIO = float(os.getenv("LLM_RETRY_RATIO", "0.2"))                   # ретраев на успешный запрос (процессный бюджет)
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))           # подряд неудач до размыкания
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))          # секунд в OPEN до пробного запроса
+
+# HTTP-статусы, при которых повтор имеет смысл
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Неудачи, говорящие о проблеме с сервисом целиком (а не с конкретным запросом)
+BREAKER_STATUS = RETRYABLE_STATUS | {401, 403}
+# Сбои транспорта без HTTP-статуса: соединение, таймаут, обрыв
+TRANSPORT_ERRORS = (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError, ConnectionError)
+
+
+class CircuitOpenError(Exception):
+    """Автомат разомкнут: LLM-провайдер стабильно падает, запросы отклоняются сразу."""
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_transport_error(exc: BaseException) -> bool:
+    return isinstance(exc, TRANSPORT_ERRORS)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Повторяем только сбои транспорта (APIConnectionError / APITimeoutError, httpx, таймауты)
+    и 408/409/429/5xx. Остальное фатально: auth, валидация, перегрузка, а также ошибки
+    в нашем коде (KeyError в шаблоне промпта, парсинг) — их повтор ничего не даст.
+    CancelledError не Exception и сюда не проходит (tenacity ловит BaseException).
+    """
+    if not isinstance(exc, Exception) or isinstance(exc, (LLMOverloaded, CircuitOpenError)):
+        return False
+    if is_transport_error(exc):
+        return True
+    code = status_code(exc)
+    return code is not None and code in RETRYABLE_STATUS
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Читает Retry-After / retry-after-ms из ответа провайдера."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        millis = headers.get("retry-after-ms")
+        if millis is not None:
+            return max(0.0, float(millis) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryStats:
+    attempts: int = 0
+    retries: int = 0
+    retry_after_honored: int = 0
+    fatal: int = 0               # ошибки, которые не ретраились по классу
+    budget_denied: int = 0       # ретрай запрещен процессным бюджетом
+    deadline_stops: int = 0      # следующее ожидание не влезало в бюджет времени запроса
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class RetryBudget:
+    """
+    Процессный бюджет ретраев (token bucket): каждый успешный запрос дает `ratio` токена,
+    каждый ретрай тратит один. Под массовым отказом ретраи не умножают нагрузку.
+    """
+
+    def __init__(self, ratio: float = LLM_RETRY_RATIO, min_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = min_tokens
+        self.tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """CLOSED -> (threshold неудач подряд) -> OPEN -> (cooldown) -> HALF_OPEN -> один пробный запрос."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    # Числовой код состояния для gauge в /metrics
+    STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Пропускает вызов или бросает CircuitOpenError. True — этот вызов и есть пробный запрос HALF_OPEN."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_cancelled(self, probe: bool = False):
+        """Вызов отменен (cancel-политика, спекуляция, хедж): состояние не меняем, только освобождаем свою пробу."""
+        if probe:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def record_failure(self, exc: BaseException, probe: bool = False):
+        code = status_code(exc)
+        if not (is_transport_error(exc) or code in BREAKER_STATUS):
+            # Ошибка конкретного запроса (400, 404, 422, баг в промпте...) — сервис жив
+            if probe:
+                with self._lock:
+                    self._probe_in_flight = False
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"state": self.state, "state_code": self.STATE_CODES[self.state], "failures": self.failures,
+                "opens": self.opens, "rejected": self.rejected}
+
+
+class wait_retry_after(wait_base):
+    """Retry-After провайдера, если он есть; иначе экспоненциальный бэкофф с full jitter."""
+
+    def __init__(self, stats: RetryStats, multiplier: float = 1.0, max_wait: float = LLM_RETRY_MAX_WAIT):
+        self.stats = stats
+        self.multiplier = multiplier
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state) -> float:
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        hinted = retry_after_seconds(exc) if exc is not None else None
+        if hinted is not None:
+            self.stats.retry_after_honored += 1
+            # Небольшой jitter, чтобы клиенты не вернулись одной волной
+            return hinted + random.uniform(0, 0.25 * self.multiplier)
+        ceiling = min(self.max_wait, self.multiplier * 2 ** retry_state.attempt_number)
+        return random.uniform(0, ceiling)
+
+
+class stop_after_budget(stop_base):
+    """Останавливает ретраи, если следующее ожидание выводит запрос за бюджет времени."""
+
+    def __init__(self, budget_seconds: float, stats: RetryStats):
+        self.budget_seconds = budget_seconds
+        self.stats = stats
+
+    def __call__(self, retry_state) -> bool:
+        upcoming = retry_state.upcoming_sleep or 0.0
+        if retry_state.seconds_since_start + upcoming > self.budget_seconds:
+            self.stats.deadline_stops += 1
+            return True
+        return False
+
+
+def llm_retry(stats: RetryStats, budget: RetryBudget, attempts: int = LLM_RETRY_ATTEMPTS,
+              budget_seconds: float = LLM_RETRY_BUDGET_SECONDS):
+    """Декоратор tenacity для LLM-вызовов: классификация ошибок, Retry-After, jitter и бюджеты."""
+
+    def should_retry(exc: BaseException) -> bool:
+        if not isinstance(exc, Exception):
+            return False
+        if not is_retryable(exc):
+            stats.fatal += 1
+            return False
+        if not budget.try_spend():
+            stats.budget_denied += 1
+            return False
+        return True
+
+    def before_sleep(retry_state):
+        stats.retries += 1
+
+    return retry(
+        retry=retry_if_exception(should_retry),
+        wait=wait_retry_after(stats),
+        stop=stop_after_attempt(attempts) | stop_after_budget(budget_seconds, stats),
+        before_sleep=before_sleep,
+    )
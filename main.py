@@ -19,6 +19,9 @@ from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, System
 from langgraph.graph import StateGraph, END
 from langchain_community.tools import DuckDuckGoSearchRun
 
+# Общий HTTP-пул (keep-alive, HTTP/2), тот же, что у бота
+from llm_http import http_pool
+
 # Надежность (Retries)
 from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
 
@@ -47,6 +50,7 @@ llm = ChatOpenAI(
     model=MODEL_NAME,
     openai_api_key=api_key,
     openai_api_base="https://openrouter.ai/api/v1",
+    http_async_client=http_pool.client,
     default_headers={
         "HTTP-Referer": "https://github.com/Start_AI", # Для статистики OpenRouter
         "X-Title": "Epistemic Engine v3"
@@ -455,6 +459,8 @@ async def main():
         except EOFError:
              break
 
+    await http_pool.aclose()
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
@@ -0,0 +1,213 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextlib
+import contextvars
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional
+
+from aiohttp import web
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))     # /metrics в режиме polling; 0 = выключено (в webhook — на его порту)
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "0") == "1"   # спаны OpenTelemetry (нужен opentelemetry-sdk + экспортер)
+
+PREFIX = "epistemic"
+
+# Свой реестр, а не глобальный: в /metrics только метрики бота
+registry = CollectorRegistry()
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+_TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+NODE_DURATION = Histogram(f"{PREFIX}_node_duration_seconds", "Graph node duration", ["node"],
+                          buckets=_LATENCY_BUCKETS, registry=registry)
+NODE_ERRORS = Counter(f"{PREFIX}_node_errors_total", "Graph node exceptions", ["node"], registry=registry)
+# Отмена — штатное событие (новое сообщение, промах спекуляции, проигравший хедж), не ошибка
+NODE_CANCELLED = Counter(f"{PREFIX}_node_cancelled_total", "Graph node runs cancelled", ["node"], registry=registry)
+# outcome: ok | error | cancelled
+LLM_DURATION = Histogram(f"{PREFIX}_llm_call_duration_seconds", "LLM call duration including retries",
+                         ["role", "outcome"], buckets=_LATENCY_BUCKETS, registry=registry)
+LLM_QUEUE_WAIT = Histogram(f"{PREFIX}_llm_queue_wait_seconds", "Wait for a PriorityLimiter slot, per attempt",
+                           ["role"], buckets=_LATENCY_BUCKETS, registry=registry)
+LLM_RETRIES = Histogram(f"{PREFIX}_llm_retries", "Retries per LLM call", ["role"],
+                        buckets=(0, 1, 2, 3, 5), registry=registry)
+LLM_PROMPT_TOKENS = Histogram(f"{PREFIX}_llm_prompt_tokens", "Prompt tokens per LLM call", ["role"],
+                              buckets=_TOKEN_BUCKETS, registry=registry)
+LLM_COMPLETION_TOKENS = Histogram(f"{PREFIX}_llm_completion_tokens", "Completion tokens per LLM call", ["role"],
+                                  buckets=_TOKEN_BUCKETS, registry=registry)
+ROUTING_MODES = Counter(f"{PREFIX}_routing_mode_total", "Routing decisions", ["node", "mode"], registry=registry)
+CACHE_EVENTS = Counter(f"{PREFIX}_response_cache_lookups_total", "Response cache lookups", ["result"],
+                       registry=registry)
+
+# Число попыток текущего LLM-вызова (внутренняя функция под ретраем видит тот же контекст)
+_attempts = contextvars.ContextVar("llm_attempts", default=None)
+
+
+# --- OPENTELEMETRY (опционально) ---
+
+def _make_tracer():
+    if not OTEL_ENABLED:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED=1, but opentelemetry is not installed — spans are disabled")
+        return None
+    # Провайдер и экспортер настраиваются снаружи (opentelemetry-instrument / OTEL_* env)
+    return trace.get_tracer("epistemic-engine")
+
+
+tracer = _make_tracer()
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Спан OpenTelemetry (или ничего, если трейсинг выключен). Контекст наследуют узлы графа."""
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None}) as s:
+        yield s
+
+
+# --- GRAPH NODES ---
+
+def instrument_node(name: str, fn: Callable) -> Callable:
+    """Обертка узла графа: длительность, ошибки, выбранный режим и попадания в кэш ответов."""
+
+    @functools.wraps(fn)
+    async def wrapper(state):
+        start = time.perf_counter()
+        with span(f"node.{name}"):
+            try:
+                update = await fn(state)
+            except asyncio.CancelledError:
+                NODE_CANCELLED.labels(name).inc()
+                raise
+            except BaseException:
+                NODE_ERRORS.labels(name).inc()
+                raise
+            finally:
+                NODE_DURATION.labels(name).observe(time.perf_counter() - start)
+        if isinstance(update, dict):
+            if update.get("mode"):
+                ROUTING_MODES.labels(name, update["mode"]).inc()
+            if "cache_hit" in update and name == "cache_lookup":
+                CACHE_EVENTS.labels("hit" if update["cache_hit"] else "miss").inc()
+        return update
+
+    return wrapper
+
+
+# --- LLM CALLS ---
+
+def track_llm_call(count_tokens: Callable[[str], int]):
+    """
+    Внешняя обертка над _call_llm_with_retry(chain, input_data, role, ...): полная длительность
+    с ретраями, исход, число ретраев и токены ответа. Ставится поверх llm_retry.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(chain, input_data, role: str = "", *args, **kwargs):
+            attempts = []
+            token = _attempts.set(attempts)
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                with span(f"llm.{role or 'unknown'}", role=role):
+                    result = await fn(chain, input_data, role, *args, **kwargs)
+                outcome = "ok"
+                if isinstance(result, str):
+                    LLM_COMPLETION_TOKENS.labels(role).observe(count_tokens(result))
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                _attempts.reset(token)
+                LLM_DURATION.labels(role, outcome).observe(time.perf_counter() - start)
+                LLM_RETRIES.labels(role).observe(max(0, len(attempts) - 1))
+
+        return wrapper
+
+    return decorator
+
+
+def record_attempt():
+    """Вызывается в начале каждой попытки внутри ретрая."""
+    attempts = _attempts.get()
+    if attempts is not None:
+        attempts.append(1)
+
+
+def observe_queue_wait(role: str, seconds: float):
+    LLM_QUEUE_WAIT.labels(role).observe(seconds)
+
+
+def observe_prompt_tokens(role: str, tokens: int):
+    LLM_PROMPT_TOKENS.labels(role).observe(tokens)
+
+
+# --- EXISTING STATS ---
+
+class StatsCollector:
+    """
+    Экспортирует существующие *Stats.as_dict() (кэши, ретраи, лимитер, HTTP-пул...): поля —
+    монотонные счетчики (counter, *_total), кроме перечисленных в gauges (размер очереди/пула, максимумы).
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._gauges: Dict[str, FrozenSet[str]] = {}
+
+    def register(self, name: str, as_dict: Callable[[], Dict[str, Any]], gauges: Iterable[str] = ()):
+        self._sources[name] = as_dict
+        self._gauges[name] = frozenset(gauges)
+
+    def collect(self):
+        for name, as_dict in sorted(self._sources.items()):
+            try:
+                values = as_dict()
+            except Exception as e:
+                logger.warning(f"Stats source {name} failed: {e}")
+                continue
+            for field, value in values.items():
+                # Вложенные словари (по ролям, версиям HTTP) не экспортируем
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                family = GaugeMetricFamily if field in self._gauges[name] else CounterMetricFamily
+                yield family(f"{PREFIX}_{name}_{field}", f"{name}.{field}", value=value)
+
+
+stats_collector = StatsCollector()
+registry.register(stats_collector)
+
+
+def register_stats(name: str, as_dict: Callable[[], Dict[str, Any]], gauges: Iterable[str] = ()):
+    stats_collector.register(name, as_dict, gauges)
+
+
+# --- HTTP ---
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server(host: str = "0.0.0.0", port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """Отдельный /metrics для режима polling (в webhook-режиме маршрут есть на сервере вебхука)."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics on {host}:{port}/metrics")
+    return runner
@@ -0,0 +1,234 @@
+"""
+Локальный мок OpenAI-совместимого /chat/completions (как у OpenRouter) для офлайн-нагрузки.
+Задержка (время до первого токена + на каждый токен), доля ошибок 500/429 и стриминг (SSE)
+настраиваются; ответы детерминированы при фиксированном seed.
+
+    python mock_llm_server.py --port 8300 --ttft lognormal:0.8:0.5 --per-token 0.01 --error-rate 0.02
+    LLM_BASE_URL=http://127.0.0.1:8300/v1 OPENROUTER_API_KEY=sk-mock python main.py
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+# Слова для генерируемых ответов
+_WORDS = ("рынок", "клиент", "гипотеза", "риск", "процесс", "ресурс", "метрика", "канал",
+          "подписка", "бюджет", "воронка", "команда", "продукт", "обратная", "связь", "рост")
+
+# Ответы по подстроке системного промпта (первое совпадение); остальное — сгенерированный текст.
+# {route} — режим по ключевым словам запроса пользователя (ROUTES), по умолчанию SOLVER
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    ("Оркестратор", "{route}"),
+    ('Начни ответ со слов "РИСК:"', "РИСК: {text}"),
+]
+
+ROUTES: List[Tuple[str, str]] = [
+    ("привет", "CHITCHAT"),
+    ("паник", "THERAPIST"),
+    ("обойти", "CONSIGLIERE"),
+    ("еще раз", "RETRY"),
+]
+
+
+@dataclass
+class LatencyDistribution:
+    """fixed:S | uniform:LO:HI | normal:MEAN:STD | lognormal:MEDIAN:SIGMA (секунды, не меньше 0)."""
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, *params = spec.split(":")
+        params = [float(p) for p in params] + [0.0, 0.0]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        return cls(kind, params[0], params[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            value = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            value = self.a * rng.lognormvariate(0.0, self.b) if self.a > 0 else 0.0
+        else:
+            value = self.a
+        return max(0.0, value)
+
+
+@dataclass
+class MockLLMConfig:
+    ttft: LatencyDistribution = field(default_factory=LatencyDistribution)   # до первого токена
+    per_token: float = 0.0             # секунд на каждый следующий токен
+    completion_tokens: int = 60        # длина ответа, если клиент не ограничил max_tokens
+    error_rate: float = 0.0            # доля ответов 500
+    rate_limit_rate: float = 0.0       # доля ответов 429
+    seed: int = 0
+
+
+@dataclass
+class MockLLMStats:
+    requests: int = 0
+    streamed: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    models: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+def count_tokens(text: str) -> int:
+    # Грубая оценка, как у token_budget без tiktoken: ~3 символа на токен
+    return len(text) // 3 + 1
+
+
+class MockLLMServer:
+    def __init__(self, config: Optional[MockLLMConfig] = None, rules: Optional[List[Tuple[str, str]]] = None):
+        self.config = config or MockLLMConfig()
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.stats = MockLLMStats()
+        self._rng = random.Random(self.config.seed)
+        self._ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        # LLM_BASE_URL может быть как .../v1, так и корнем
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        app.router.add_post("/chat/completions", self.handle_completion)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # --- RESPONSES ---
+
+    def _reply(self, system: str, user: str, max_tokens: Optional[int]) -> str:
+        n = min(max_tokens or self.config.completion_tokens, self.config.completion_tokens)
+        text = " ".join(self._rng.choice(_WORDS) for _ in range(max(1, n)))
+        for needle, template in self.rules:
+            if needle in system:
+                route = next((mode for word, mode in ROUTES if word in user.lower()), "SOLVER")
+                return template.format(text=text, route=route)
+        return text
+
+    def _chunk(self, completion_id: str, model: str, delta: Dict, finish: Optional[str] = None,
+               usage: Optional[Dict] = None) -> bytes:
+        body = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if usage is None else []}
+        if usage is not None:
+            body["usage"] = usage
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode()
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.stats.requests += 1
+        model = body.get("model", "mock")
+        self.stats.models[model] = self.stats.models.get(model, 0) + 1
+
+        roll = self._rng.random()
+        if roll < self.config.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"error": {"message": "mock upstream error", "type": "server_error"}}, status=500)
+        if roll < self.config.error_rate + self.config.rate_limit_rate:
+            self.stats.rate_limited += 1
+            return web.json_response({"error": {"message": "mock rate limit", "type": "rate_limit"}}, status=429,
+                                     headers={"Retry-After": "1"})
+
+        messages = body.get("messages", [])
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+        prompt_tokens = sum(count_tokens(m.get("content", "")) for m in messages)
+        reply = self._reply(system, user, body.get("max_tokens") or body.get("max_completion_tokens"))
+        tokens = reply.split(" ")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        self.stats.prompt_tokens += prompt_tokens
+        self.stats.completion_tokens += len(tokens)
+        completion_id = f"chatcmpl-mock-{next(self._ids)}"
+
+        await asyncio.sleep(self.config.ttft.sample(self._rng))
+        if not body.get("stream"):
+            await asyncio.sleep(self.config.per_token * (len(tokens) - 1))
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.stats.streamed += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await response.write(self._chunk(completion_id, model, {"role": "assistant", "content": ""}))
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.config.per_token)
+            await response.write(self._chunk(completion_id, model, {"content": token if i == 0 else " " + token}))
+        await response.write(self._chunk(completion_id, model, {}, finish="stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await response.write(self._chunk(completion_id, model, {}, usage=usage))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats.as_dict())
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--ttft", default="fixed:0.05", help="задержка до первого токена: fixed:S, uniform:LO:HI, "
+                                                             "normal:MEAN:STD, lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--per-token", type=float, default=0.0, help="секунд на каждый следующий токен")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args) -> MockLLMConfig:
+    return MockLLMConfig(ttft=LatencyDistribution.parse(args.ttft), per_token=args.per_token,
+                         completion_tokens=args.completion_tokens, error_rate=args.error_rate,
+                         rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible /chat/completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8300)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(config_from_args(args))
+    print(f"Mock LLM at {await server.start(args.host, args.port)} (stats: GET /stats)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
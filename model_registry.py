@@ -0,0 +1,110 @@
+import os
+import json
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, Optional
+
+# --- CONFIG ---
+LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-4o")                   # сильная модель (tier "strong")
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "openai/gpt-4o-mini")    # быстрая модель (tier "fast")
+LLM_ROLES_CONFIG = os.getenv("LLM_ROLES_CONFIG", "")                  # JSON-файл с настройками ролей
+
+# Роли, которым хватает быстрой модели: классификация и короткие пре-шаги
+FAST_ROLES = ("ORCHESTRATOR", "POST_MORTEM", "THERAPIST", "CONSIGLIERE", "SUMMARIZER")
+ROLES = FAST_ROLES + ("TRIZ", "SYSTEM", "CRITIC", "SYNTHESIZER")
+
+# Потолок ответа по ролям (max_tokens): промпты просят "одно слово", "2 предложения",
+# "не более 100 слов" — с запасом на кириллицу и Markdown, чтобы не резать нормальный ответ
+ROLE_MAX_TOKENS = {
+    "ORCHESTRATOR": 8,
+    "POST_MORTEM": 200,
+    "THERAPIST": 250,
+    "CONSIGLIERE": 250,
+    "SUMMARIZER": 300,
+    "TRIZ": 200,
+    "SYSTEM": 200,
+    "CRITIC": 200,
+    "SYNTHESIZER": 600,
+}
+
+
+@dataclass(frozen=True)
+class RoleModelConfig:
+    model: str
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None   # секунд на один HTTP-запрос
+
+    def invoke_kwargs(self) -> Dict[str, object]:
+        """Параметры вызова для ChatOpenAI.bind(): модель общая, настройки — на роль."""
+        kwargs = {"temperature": self.temperature}
+        if self.max_tokens is not None:
+            kwargs["max_tokens"] = self.max_tokens
+        if self.timeout is not None:
+            kwargs["timeout"] = self.timeout
+        return kwargs
+
+
+class ModelRegistry:
+    """
+    Модель и параметры генерации для каждой роли.
+    Приоритет настроек: env LLM_<FIELD>_<ROLE> > JSON из LLM_ROLES_CONFIG > tier по умолчанию.
+
+    Пример JSON:
+        {"ORCHESTRATOR": {"model": "openai/gpt-4o-mini", "temperature": 0, "max_tokens": 5, "timeout": 10}}
+    """
+
+    def __init__(self, roles: Dict[str, RoleModelConfig], default: RoleModelConfig):
+        self._roles = dict(roles)
+        self.default = default
+
+    def get(self, role: str) -> RoleModelConfig:
+        return self._roles.get(role, self.default)
+
+    def models(self):
+        return sorted({cfg.model for cfg in self._roles.values()} | {self.default.model})
+
+    def as_dict(self) -> Dict[str, Dict[str, object]]:
+        return {role: asdict(cfg) for role, cfg in sorted(self._roles.items())}
+
+    @classmethod
+    def tiered(cls, strong: str = LLM_MODEL, fast: str = LLM_FAST_MODEL) -> "ModelRegistry":
+        default = RoleModelConfig(model=strong)
+        roles = {
+            role: RoleModelConfig(model=fast if role in FAST_ROLES else strong, max_tokens=ROLE_MAX_TOKENS.get(role))
+            for role in ROLES
+        }
+        # Оркестратор возвращает одно слово — детерминированно и коротко
+        roles["ORCHESTRATOR"] = replace(roles["ORCHESTRATOR"], temperature=0.0)
+        return cls(roles, default)
+
+    @classmethod
+    def single(cls, model: str = LLM_MODEL) -> "ModelRegistry":
+        """Одна модель на все роли (как до тиров); потолки ответа те же."""
+        roles = {role: RoleModelConfig(model=model, max_tokens=ROLE_MAX_TOKENS.get(role)) for role in ROLES}
+        return cls(roles, RoleModelConfig(model=model))
+
+    @classmethod
+    def from_env(cls, strong: str = LLM_MODEL, fast: str = LLM_FAST_MODEL,
+                 config_path: str = LLM_ROLES_CONFIG, environ=os.environ) -> "ModelRegistry":
+        registry = cls.tiered(strong, fast)
+        overrides: Dict[str, Dict[str, object]] = {}
+        if config_path:
+            with open(config_path, encoding="utf-8") as f:
+                overrides = json.load(f)
+
+        roles = dict(registry._roles)
+        for role in set(ROLES) | set(overrides):
+            cfg = roles.get(role, registry.default)
+            fields = dict(overrides.get(role, {}))
+            env = {
+                "model": environ.get(f"LLM_MODEL_{role}"),
+                "temperature": environ.get(f"LLM_TEMPERATURE_{role}"),
+                "max_tokens": environ.get(f"LLM_MAX_TOKENS_{role}"),
+                "timeout": environ.get(f"LLM_TIMEOUT_{role}"),
+            }
+            fields.update({k: v for k, v in env.items() if v not in (None, "")})
+            for name, cast in (("temperature", float), ("max_tokens", int), ("timeout", float)):
+                if fields.get(name) is not None:
+                    fields[name] = cast(fields[name])
+            roles[role] = replace(cfg, **fields)
+        return cls(roles, registry.default)
@@ -0,0 +1,335 @@
+"""
+Запись и детерминированное воспроизведение прогонов графа.
+
+Recorder перехватывает все LLM-вызовы (engine._call_llm_with_retry — через него идут
+call_llm_async и синтезатор) и поиск (engine.search.backend, т.е. под кэшем) и пишет
+в компактный gzip-JSONL: ходы пользователей, ответы, задержки. Сам промпт не хранится —
+только его хэш и размер.
+
+Replayer подставляет записанные ответы вместо сети и заново гоняет engine.get_graph
+по тем же диалогам: задержки вызовов сохраняются (--latency preserve), обнуляются (zero)
+или масштабируются (число). Так изменения графа можно профилировать на реальной форме трафика.
+
+    python replay.py record queries.txt --out session.jsonl.gz        # реальный API или LLM_BASE_URL
+    python replay.py replay session.jsonl.gz --latency zero --out results.json
+    REPLAY_RECORD_PATH=session.jsonl.gz python bot.py                  # запись живого бота
+"""
+import os
+import json
+import gzip
+import time
+import hashlib
+import asyncio
+import argparse
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+# --- CONFIG ---
+REPLAY_RECORD_PATH = os.getenv("REPLAY_RECORD_PATH", "")   # бот пишет сессию сюда; пусто = не пишем
+
+FORMAT_VERSION = 1
+
+
+class ReplayMiss(Exception):
+    """В записи нет ответа для этого вызова (граф сделал вызов, которого не было при записи)."""
+
+
+def _thread_id() -> str:
+    # thread_id текущего прогона графа; вне графа — пусто
+    try:
+        from langgraph.config import get_config
+        return str(get_config().get("configurable", {}).get("thread_id", ""))
+    except RuntimeError:
+        return ""
+
+
+def call_key(engine, chain, input_data: Dict[str, Any]) -> str:
+    """Хэш итогового промпта (шаблон роли + переменные): меняется и при правке PROMPTS, и контекста."""
+    template = engine._prompt_template(chain)
+    if template is not None:
+        payload = "\n".join(m.content for m in template.format_messages(**input_data))
+    else:
+        payload = json.dumps(input_data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+# --- RECORD ---
+
+class Recorder:
+    """Пишет события сессии: turn (запрос пользователя), llm и search (ответ + задержка)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.events = 0
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()   # поиск пишет из потоков asyncio.to_thread
+        self._start = time.perf_counter()
+        self._engine = None
+        self._originals: Dict[str, Any] = {}
+        self._write({"kind": "header", "version": FORMAT_VERSION,
+                     "created": datetime.now().isoformat(timespec="seconds")})
+
+    def _write(self, event: Dict[str, Any]):
+        with self._lock:
+            self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self.events += 1
+
+    def record_turn(self, thread_id: str, query: str):
+        self._write({"kind": "turn", "thread": thread_id, "query": query,
+                     "at": round(time.perf_counter() - self._start, 3)})
+
+    def install(self, engine):
+        self._engine = engine
+        self._originals = {"llm": engine._call_llm_with_retry, "search": engine.search.backend}
+        original_llm, backend = self._originals["llm"], self._originals["search"]
+        recorder = self
+
+        async def recorded_llm(chain, input_data, role: str = "", *args, **kwargs):
+            start = time.perf_counter()
+            event = {"kind": "llm", "thread": _thread_id(), "role": role, "key": call_key(engine, chain, input_data),
+                     "prompt_chars": sum(len(v) for v in input_data.values() if isinstance(v, str))}
+            try:
+                result = await original_llm(chain, input_data, role, *args, **kwargs)
+            except Exception as e:
+                recorder._write({**event, "error": f"{type(e).__name__}: {e}",
+                                 "latency": round(time.perf_counter() - start, 4)})
+                raise
+            recorder._write({**event, "output": result, "latency": round(time.perf_counter() - start, 4)})
+            return result
+
+        class RecordedSearch:
+            def invoke(self, query: str) -> str:
+                start = time.perf_counter()
+                result = backend.invoke(query)
+                recorder._write({"kind": "search", "thread": _thread_id(), "query": query, "output": result,
+                                 "latency": round(time.perf_counter() - start, 4)})
+                return result
+
+        engine._call_llm_with_retry = recorded_llm
+        engine.search.backend = RecordedSearch()
+
+    def close(self):
+        if self._engine is not None:
+            self._engine._call_llm_with_retry = self._originals["llm"]
+            self._engine.search.backend = self._originals["search"]
+            self._engine = None
+        with self._lock:
+            self._file.close()
+
+
+def load_session(path: str) -> List[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if not events or events[0].get("kind") != "header" or events[0].get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: not a replay session (format v{FORMAT_VERSION})")
+    return events
+
+
+# --- REPLAY ---
+
+@dataclass
+class ReplayStats:
+    llm_exact: int = 0        # совпал хэш промпта
+    llm_fallback: int = 0     # промпт изменился — взят следующий ответ этой роли в диалоге
+    llm_missing: int = 0
+    search_exact: int = 0
+    search_fallback: int = 0
+    search_missing: int = 0
+    slept_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return asdict(self)
+
+
+class Replayer:
+    """
+    Отдает записанные ответы вместо LLM и поиска. Ответы ищутся в очереди (диалог, роль):
+    сначала по хэшу промпта, иначе берется следующий по порядку — так запись переживает
+    изменения промптов. latency_scale: 1 — как при записи, 0 — без задержек.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self.stats = ReplayStats()
+        self.turns: Dict[str, List[str]] = defaultdict(list)
+        self._llm: Dict[tuple, Deque[Dict]] = defaultdict(deque)
+        self._search: Dict[str, Deque[Dict]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._engine = None
+        self._originals: Dict[str, Any] = {}
+        for event in events:
+            if event["kind"] == "turn":
+                self.turns[event["thread"]].append(event["query"])
+            elif event["kind"] == "llm":
+                self._llm[(event["thread"], event["role"])].append(event)
+            elif event["kind"] == "search":
+                self._search[event["thread"]].append(event)
+
+    @classmethod
+    def from_file(cls, path: str, latency_scale: float = 1.0) -> "Replayer":
+        return cls(load_session(path), latency_scale)
+
+    def _take(self, queue: Deque[Dict], match) -> Optional[Dict]:
+        with self._lock:
+            for event in queue:
+                if match(event):
+                    queue.remove(event)
+                    return event
+            return queue.popleft() if queue else None
+
+    async def llm(self, chain, input_data, role: str = "", *args, **kwargs) -> str:
+        key = call_key(self._engine, chain, input_data)
+        event = self._take(self._llm[(_thread_id(), role)], lambda e: e["key"] == key)
+        if event is None:
+            self.stats.llm_missing += 1
+            raise ReplayMiss(f"no recorded {role} call")
+        if event["key"] == key:
+            self.stats.llm_exact += 1
+        else:
+            self.stats.llm_fallback += 1
+        delay = event["latency"] * self.latency_scale
+        self.stats.slept_seconds += delay
+        await asyncio.sleep(delay)
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        return event["output"]
+
+    def search(self, query: str) -> str:
+        event = self._take(self._search[_thread_id()], lambda e: e["query"] == query)
+        if event is None:
+            self.stats.search_missing += 1
+            return "No results found."
+        if event["query"] == query:
+            self.stats.search_exact += 1
+        else:
+            self.stats.search_fallback += 1
+        delay = event["latency"] * self.latency_scale
+        self.stats.slept_seconds += delay
+        time.sleep(delay)   # вызывается из asyncio.to_thread, как настоящий поиск
+        return event["output"]
+
+    def install(self, engine):
+        import metrics
+        replayer = self
+
+        class ReplaySearch:
+            def invoke(self, query: str) -> str:
+                return replayer.search(query)
+
+        self._engine = engine
+        self._originals = {"llm": engine._call_llm_with_retry, "search": engine.search.backend}
+        # Метрики LLM-вызовов (metrics.py) остаются и при воспроизведении
+        engine._call_llm_with_retry = metrics.track_llm_call(engine.estimate_tokens)(self.llm)
+        engine.search.backend = ReplaySearch()
+
+    def uninstall(self):
+        if self._engine is not None:
+            self._engine._call_llm_with_retry = self._originals["llm"]
+            self._engine.search.backend = self._originals["search"]
+            self._engine = None
+
+    async def run(self, graph) -> Dict:
+        """Диалоги — параллельно, ходы внутри диалога — по порядку, как в записи."""
+        from bench_load import LoadReport
+
+        report = LoadReport()
+
+        async def conversation(thread_id: str, queries: List[str]):
+            for query in queries:
+                await report.run_turn(graph, thread_id, query)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(conversation(t, q) for t, q in self.turns.items()))
+        return report.summary(time.perf_counter() - start)
+
+
+# --- CLI ---
+
+def _read_queries(path: str, threads: int) -> List[tuple]:
+    """Строки 'thread_id<TAB>запрос' или просто 'запрос' (диалоги раскладываются по кругу)."""
+    turns = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(l.rstrip("\n") for l in f):
+            if not line.strip():
+                continue
+            thread_id, _, query = line.partition("\t") if "\t" in line else (f"rec_{i % threads}", "", line)
+            turns.append((thread_id, query))
+    return turns
+
+
+async def record_main(args):
+    import engine
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.memory import MemorySaver
+    from llm_http import http_pool
+
+    recorder = Recorder(args.out)
+    recorder.install(engine)
+    graph = engine.get_graph(checkpointer=MemorySaver())
+    by_thread: Dict[str, List[str]] = defaultdict(list)
+    for thread_id, query in _read_queries(args.queries, args.threads):
+        by_thread[thread_id].append(query)
+
+    async def conversation(thread_id: str, queries: List[str]):
+        config = {"configurable": {"thread_id": thread_id}}
+        for query in queries:
+            recorder.record_turn(thread_id, query)
+            state = await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query}, config)
+            print(f"[{thread_id}] {state.get('mode')}: {query[:60]}")
+
+    try:
+        await asyncio.gather(*(conversation(t, q) for t, q in by_thread.items()))
+    finally:
+        recorder.close()
+        await http_pool.aclose()
+    print(f"{recorder.events} events -> {args.out} ({os.path.getsize(args.out)} bytes)")
+
+
+async def replay_main(args):
+    os.environ.setdefault("OPENROUTER_API_KEY", "sk-replay")
+    import engine
+    from langgraph.checkpoint.memory import MemorySaver
+    from bench_load import compare
+
+    scale = {"preserve": 1.0, "zero": 0.0}.get(args.latency)
+    replayer = Replayer.from_file(args.session, float(args.latency) if scale is None else scale)
+    replayer.install(engine)
+    try:
+        results = await replayer.run(engine.get_graph(checkpointer=MemorySaver()))
+    finally:
+        replayer.uninstall()
+
+    report = {"started_at": datetime.now().isoformat(timespec="seconds"),
+              "config": {"session": args.session, "latency": args.latency},
+              "results": results, "replay": replayer.stats.as_dict(),
+              "llm": {}, "prompt_tokens_by_role": engine.token_budget.stats.as_dict()}
+    print(json.dumps({"results": results, "replay": replayer.stats.as_dict()}, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record / replay graph runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="прогнать запросы через граф и записать сессию")
+    rec.add_argument("queries", help="файл: 'thread_id<TAB>запрос' или 'запрос' на строку")
+    rec.add_argument("--out", default="session.jsonl.gz")
+    rec.add_argument("--threads", type=int, default=4, help="диалогов, если thread_id не указан")
+    rep = sub.add_parser("replay", help="воспроизвести сессию без сети")
+    rep.add_argument("session")
+    rep.add_argument("--latency", default="preserve", help="preserve | zero | множитель (например 0.5)")
+    rep.add_argument("--out", help="JSON с результатами (формат bench_load.py)")
+    rep.add_argument("--compare", help="JSON прошлого прогона")
+    args = parser.parse_args()
+    asyncio.run(record_main(args) if args.command == "record" else replay_main(args))
+
+
+if __name__ == "__main__":
+    main()
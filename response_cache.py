@@ -0,0 +1,257 @@
+import os
+import re
+import math
+import time
+import asyncio
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional, Set
+
+from search_cache import normalize_query
+
+# --- CONFIG ---
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_MIN_JACCARD = float(os.getenv("RESPONSE_CACHE_MIN_JACCARD", "0.8"))  # порог похожести запросов
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Токены, меняющие смысл при почти том же тексте: числа и отрицания
+_GUARD = re.compile(r"\d+|\b(?:не|нет|ни|без|not|no|without)\b")
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Символьные n-граммы нормализованного текста (устойчивы к опечаткам и окончаниям)."""
+    text = normalize_query(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def guard_tokens(text: str) -> tuple:
+    """
+    Числа и отрицания запроса. Похожесть по шинглам/эмбеддингам их почти не видит
+    ("продажи на 10%" vs "на 50%" — Jaccard 0.85), поэтому они должны совпасть точно.
+    """
+    return tuple(sorted(_GUARD.findall(normalize_query(text))))
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash-сигнатура: num_perm независимых хэш-функций вида (a*x + b) mod p."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                        for _ in range(num_perm)]
+
+    def signature(self, features: Set[str]) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=4).digest(), "big")
+                  for f in features]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [min((a * h + b) % _MERSENNE_PRIME & _MAX_HASH for h in hashes) for a, b in self._params]
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    query: str
+    model: str
+    values: Dict[str, str]
+    created: float = field(default_factory=time.time)
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class MinHashIndex:
+    """
+    Поиск почти-дубликатов без эмбеддингов: MinHash + LSH по полосам.
+    Сигнатура режется на `bands` полос; кандидаты — запросы, совпавшие хотя бы в одной
+    полосе, затем подтверждаются точным Jaccard по шинглам (>= min_jaccard)
+    и точным совпадением чисел и отрицаний (guard_tokens).
+    """
+
+    blocking = False   # features() считается на месте, без сети
+
+    def __init__(self, min_jaccard: float = RESPONSE_CACHE_MIN_JACCARD, num_perm: int = 64, bands: int = 16):
+        self.min_jaccard = min_jaccard
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._buckets: Dict[tuple, Set[str]] = {}
+        self._features: Dict[str, tuple] = {}  # key -> (model, shingles, band_keys, guard)
+
+    def _band_keys(self, model: str, features: Set[str]) -> List[tuple]:
+        sig = self.hasher.signature(features)
+        return [(model, band, tuple(sig[band * self._rows:(band + 1) * self._rows])) for band in range(self.bands)]
+
+    def features(self, text: str) -> tuple:
+        return shingles(text), guard_tokens(text)
+
+    def add(self, key: str, features: tuple, model: str):
+        shingle_set, guard = features
+        band_keys = self._band_keys(model, shingle_set)
+        self._features[key] = (model, shingle_set, band_keys, guard)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        entry = self._features.pop(key, None)
+        if entry is None:
+            return
+        for band_key in entry[2]:
+            bucket = self._buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def lookup(self, features: tuple, model: str) -> Optional[str]:
+        shingle_set, guard = features
+        candidates = set()
+        for band_key in self._band_keys(model, shingle_set):
+            candidates |= self._buckets.get(band_key, set())
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            _, other, _, other_guard = self._features[key]
+            if other_guard != guard:
+                continue
+            score = jaccard(shingle_set, other)
+            if score >= self.min_jaccard and score > best_score:
+                best_key, best_score = key, score
+        return best_key
+
+
+class VectorIndex:
+    """
+    Опциональный бэкенд на эмбеддингах: `embed(text) -> List[float]` передается снаружи
+    (например, OpenAIEmbeddings().embed_query). Линейный поиск по косинусу — размер кэша ограничен.
+    Числа и отрицания, как и в MinHashIndex, должны совпасть точно.
+    embed — обычно сетевой вызов: ResponseCache.aget/aput считают его в потоке, вне блокировки.
+    """
+
+    blocking = True
+
+    def __init__(self, embed: Callable[[str], List[float]], min_similarity: float = 0.92):
+        self.embed = embed
+        self.min_similarity = min_similarity
+        self._vectors: Dict[str, tuple] = {}  # key -> (model, vector, norm, guard)
+
+    def features(self, text: str) -> tuple:
+        vector = self.embed(text)
+        return vector, math.sqrt(sum(x * x for x in vector)) or 1.0, guard_tokens(text)
+
+    def add(self, key: str, features: tuple, model: str):
+        self._vectors[key] = (model, *features)
+
+    def remove(self, key: str):
+        self._vectors.pop(key, None)
+
+    def lookup(self, features: tuple, model: str) -> Optional[str]:
+        vector, norm, guard = features
+        best_key, best_score = None, self.min_similarity
+        for key, (other_model, other, other_norm, other_guard) in self._vectors.items():
+            if other_model != model or other_guard != guard:
+                continue
+            score = sum(a * b for a, b in zip(vector, other)) / (norm * other_norm)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+
+class ResponseCache:
+    """
+    Кэш итоговых ответов (вердикт + выходы солверов) для похожих вопросов.
+    Ключ: похожесть запроса (index) + имя модели. TTL и ограничение размера (LRU).
+    """
+
+    def __init__(self, index=None, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.index = index if index is not None else MinHashIndex()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = ResponseCacheStats()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(query: str, model: str) -> str:
+        return hashlib.sha1(f"{model}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def get(self, query: str, model: str, features: Optional[tuple] = None) -> Optional[CacheEntry]:
+        # Признаки (шинглы / эмбеддинг) считаются до блокировки: embed может ходить в сеть
+        if features is None:
+            features = self.index.features(query)
+        with self._lock:
+            key = self._make_key(query, model)
+            if key not in self._entries:
+                key = self.index.lookup(features, model)
+
+            entry = self._entries.get(key) if key else None
+            if entry is not None and time.time() - entry.created > self.ttl:
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry
+
+    def put(self, query: str, model: str, values: Dict[str, str], features: Optional[tuple] = None):
+        if features is None:
+            features = self.index.features(query)
+        with self._lock:
+            key = self._make_key(query, model)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CacheEntry(key=key, query=query, model=model, values=dict(values))
+            self.index.add(key, features, model)
+            self.stats.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    async def _afeatures(self, query: str) -> tuple:
+        if self.index.blocking:
+            return await asyncio.to_thread(self.index.features, query)
+        return self.index.features(query)
+
+    async def aget(self, query: str, model: str) -> Optional[CacheEntry]:
+        """get() для узлов графа: блокирующий embed не занимает event loop."""
+        return self.get(query, model, await self._afeatures(query))
+
+    async def aput(self, query: str, model: str, values: Dict[str, str]):
+        self.put(query, model, values, await self._afeatures(query))
+
+    def _drop(self, key: str):
+        self._entries.pop(key, None)
+        self.index.remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def __len__(self):
+        return len(self._entries)
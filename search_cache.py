@@ -0,0 +1,194 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+# --- CONFIG ---
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))       # секунды
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))        # записей в памяти (LRU)
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")                # SQLite-файл; пусто = только память
+# Сколько ждать чужой in-flight поиск: тот же таймаут, что у самого поиска в проверке фактов
+SEARCH_FLIGHT_TIMEOUT = float(os.getenv("FACT_CHECK_TIMEOUT", "8"))
+
+# Ответы-ошибки SimpleSearch не кэшируем
+_ERROR_PREFIXES = ("Error:", "Search Error:", "Ошибка поиска:")
+
+_PUNCT = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def normalize_query(query: str) -> str:
+    """Ключ кэша: регистр, пунктуация и лишние пробелы не важны."""
+    return " ".join(_PUNCT.sub(" ", query.lower()).split())
+
+
+@dataclass
+class SearchCacheStats:
+    hits: int = 0
+    misses: int = 0
+    disk_hits: int = 0
+    collapsed: int = 0   # запросы, дождавшиеся чужого in-flight поиска
+    flight_timeouts: int = 0  # не дождались чужого поиска за wait_timeout
+    evictions: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class SearchCache:
+    """
+    LRU-кэш с TTL в памяти + опциональная персистентность в SQLite,
+    чтобы теплый кэш переживал рестарт.
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_SIZE,
+                 db_path: str = SEARCH_CACHE_PATH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = SearchCacheStats()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return time.time() - created > self.ttl
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        """count=False — повторная проверка без учета в hits/misses (см. CachedSearch.invoke)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    if count:
+                        self.stats.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, value FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[0]):
+                    self._put_memory(key, row[0], row[1])
+                    if count:
+                        self.stats.hits += 1
+                        self.stats.disk_hits += 1
+                    return row[1]
+
+            if count:
+                self.stats.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        created = time.time()
+        with self._lock:
+            self._put_memory(key, created, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, created),
+                )
+                self._db.commit()
+
+    def _put_memory(self, key: str, created: float, value: str):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def purge_expired(self):
+        """Чистит просроченные записи на диске (в памяти они вытесняются лениво)."""
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM search_cache WHERE created < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = ""
+
+
+class CachedSearch:
+    """
+    Обертка над SimpleSearch с тем же интерфейсом invoke(query) -> str.
+    Одинаковые параллельные запросы схлопываются в один (single-flight):
+    invoke вызывается из asyncio.to_thread, поэтому синхронизация потоковая.
+    Ведомые ждут ведущего не дольше wait_timeout: wait_for вокруг to_thread поток не
+    останавливает, и зависший поиск иначе копил бы занятые потоки пула.
+    """
+
+    def __init__(self, backend, cache: Optional[SearchCache] = None, wait_timeout: float = SEARCH_FLIGHT_TIMEOUT):
+        self.backend = backend
+        self.cache = cache if cache is not None else SearchCache()
+        self.wait_timeout = wait_timeout
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> SearchCacheStats:
+        return self.cache.stats
+
+    def invoke(self, query: str) -> str:
+        key = normalize_query(query)
+        if not key:
+            return self.backend.invoke(query)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                with self._lock:
+                    self.cache.stats.flight_timeouts += 1
+                return f"Search Error: timed out after {self.wait_timeout:.0f}s waiting for '{query}'"
+            with self._lock:
+                self.cache.stats.collapsed += 1
+            return flight.result
+
+        try:
+            # Прошлый ведущий мог записать кэш между нашим get и снятием своего flight
+            cached = self.cache.get(key, count=False)
+            if cached is not None:
+                flight.result = cached
+                with self._lock:
+                    self.cache.stats.collapsed += 1
+            else:
+                flight.result = self.backend.invoke(query)
+                if not flight.result.startswith(_ERROR_PREFIXES):
+                    self.cache.set(key, flight.result)
+        except Exception as e:
+            flight.result = f"Search Error: {str(e)}"
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+        return flight.result
@@ -0,0 +1,202 @@
+import os
+import hmac
+import asyncio
+import logging
+from dataclasses import dataclass, asdict, field
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))          # сколько процессов-воркеров в кластере
+BOT_WORKER_ID = int(os.getenv("BOT_WORKER_ID", "0"))      # номер этого воркера (0..BOT_WORKERS-1)
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))  # воркер i слушает WORKER_BASE_PORT + i
+ROUTER_FORWARD_TIMEOUT = float(os.getenv("ROUTER_FORWARD_TIMEOUT", "10"))
+ROUTER_POLL_TIMEOUT = int(os.getenv("ROUTER_POLL_TIMEOUT", "30"))  # long-poll getUpdates, секунд
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# --- HASHING ---
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): при изменении числа воркеров N -> N+1
+    переезжает только ~1/(N+1) пользователей, а не почти все, как при key % N.
+    """
+    b, j = -1, 0
+    key &= 0xFFFFFFFFFFFFFFFF
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def update_user_id(update: Dict) -> Optional[int]:
+    """Telegram user id из сырого апдейта (message, callback_query, poll_answer, ...)."""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        for holder in ("from", "user", "chat"):
+            if isinstance(payload.get(holder), dict) and "id" in payload[holder]:
+                return int(payload[holder]["id"])
+    return None
+
+
+def shard_for_update(update: Dict, workers: int) -> int:
+    """Номер воркера для апдейта. thread_id графа == user id, поэтому состояние пользователя
+    всегда трогает один и тот же воркер. Апдейты без пользователя — воркеру 0."""
+    user_id = update_user_id(update)
+    return 0 if user_id is None or workers <= 1 else jump_hash(user_id, workers)
+
+
+def worker_urls(workers: int, host: str = "127.0.0.1", base_port: int = WORKER_BASE_PORT,
+                path: str = "/webhook") -> List[str]:
+    return [f"http://{host}:{base_port + i}{path}" for i in range(workers)]
+
+
+# --- ROUTER ---
+
+@dataclass
+class RouterStats:
+    received: int = 0
+    forwarded: int = 0
+    rejected: int = 0       # воркер перегружен или недоступен
+    per_worker: List[int] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+class ShardRouter:
+    """
+    Фронт кластера: единственная точка, которую видит Telegram (webhook или long polling —
+    у токена бота может быть только один получатель). Каждый апдейт пересылается как есть
+    в webhook воркера shard_for_update(update). Воркеры — обычные bot.py в BOT_MODE=webhook,
+    у каждого свой граф, чекпоинтер и пулы соединений.
+    """
+
+    def __init__(self, worker_urls: Iterable[str], secret: str = "", worker_secret: str = "",
+                 timeout: float = ROUTER_FORWARD_TIMEOUT):
+        self.worker_urls = list(worker_urls)
+        self.secret = secret                    # проверяем у входящих апдейтов от Telegram
+        self.worker_secret = worker_secret      # передаем воркерам
+        self.timeout = timeout
+        self.stats = RouterStats(per_worker=[0] * len(self.worker_urls))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def forward(self, update: Dict) -> int:
+        """Отправляет апдейт своему воркеру, возвращает HTTP-статус (503, если воркер недоступен)."""
+        shard = shard_for_update(update, len(self.worker_urls))
+        headers = {SECRET_HEADER: self.worker_secret} if self.worker_secret else {}
+        try:
+            async with self.session.post(self.worker_urls[shard], json=update, headers=headers) as resp:
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Worker {shard} unreachable: {e}")
+            status = 503
+        if status == 200:
+            self.stats.forwarded += 1
+            self.stats.per_worker[shard] += 1
+        else:
+            self.stats.rejected += 1
+        return status
+
+    # --- WEBHOOK FRONT ---
+
+    def build_app(self, path: str = "/webhook") -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_cleanup(self, app: web.Application):
+        await self.aclose()
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        self.stats.received += 1
+        # 503 воркера отдаем Telegram как есть — он доставит апдейт повторно
+        status = await self.forward(update)
+        return web.Response(status=200 if status == 200 else 503)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "workers": len(self.worker_urls), **self.stats.as_dict()})
+
+    async def set_webhook(self, token: str, url: str, api_url: str = "https://api.telegram.org"):
+        if not self.secret:
+            # Без секрета роутер принял бы поддельные апдейты от кого угодно
+            raise RuntimeError("Refusing to register a webhook without WEBHOOK_SECRET")
+        params = {"url": url, "secret_token": self.secret}
+        async with self.session.post(f"{api_url}/bot{token}/setWebhook", json=params) as resp:
+            body = await resp.json()
+        if not body.get("ok"):
+            raise RuntimeError(f"setWebhook failed: {body.get('description')}")
+
+    # --- POLLING FRONT ---
+
+    async def poll(self, token: str, api_url: str = "https://api.telegram.org",
+                   poll_timeout: int = ROUTER_POLL_TIMEOUT, retry_delay: float = 1.0):
+        """
+        Long polling для локального запуска без публичного адреса. offset сдвигается только
+        после того, как все апдейты пачки приняты воркерами; внутри шарда порядок сохраняется.
+        """
+        offset = 0
+        url = f"{api_url}/bot{token}/getUpdates"
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=poll_timeout + 10)) as poll_session:
+            # getUpdates не работает, пока у бота зарегистрирован webhook
+            async with poll_session.post(f"{api_url}/bot{token}/deleteWebhook"):
+                pass
+            while True:
+                try:
+                    async with poll_session.get(url, params={"offset": offset, "timeout": poll_timeout}) as resp:
+                        body = await resp.json()
+                    if not body.get("ok"):
+                        # Например, 409: у бота еще висит webhook
+                        raise aiohttp.ClientError(body.get("description", f"HTTP {resp.status}"))
+                    updates = body.get("result", [])
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"getUpdates failed: {e}")
+                    await asyncio.sleep(retry_delay)
+                    continue
+                if not updates:
+                    continue
+                self.stats.received += len(updates)
+                await self._deliver(updates, retry_delay)
+                offset = updates[-1]["update_id"] + 1
+
+    async def _deliver(self, updates: List[Dict], retry_delay: float):
+        by_shard: Dict[int, List[Dict]] = {}
+        for update in updates:
+            by_shard.setdefault(shard_for_update(update, len(self.worker_urls)), []).append(update)
+
+        async def deliver_shard(batch: List[Dict]):
+            for update in batch:
+                # Перегруженный воркер ждем; апдейт, который воркер отверг (400/421), не повторяем
+                while (status := await self.forward(update)) == 503:
+                    await asyncio.sleep(retry_delay)
+                if status != 200:
+                    logger.error(f"Update {update.get('update_id')} dropped by worker: HTTP {status}")
+
+        await asyncio.gather(*(deliver_shard(batch) for batch in by_shard.values()))
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+        logger.info(f"Shard router stopped: {self.stats.as_dict()}")
@@ -0,0 +1,97 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+from sqlalchemy.future import select
+
+from database import DB, User
+from activity_tracker import ActivityTracker
+
+
+class TestActivityTracker(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DB(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'users.db')}")
+        await self.db.init_db()
+        self.batches = []
+
+    async def asyncTearDown(self):
+        await self.db.engine.dispose()
+        self.tmp.cleanup()
+
+    async def users(self):
+        async with self.db.async_session() as session:
+            return {u.id: u for u in (await session.execute(select(User))).scalars()}
+
+    async def recording_upsert(self, rows):
+        self.batches.append(len(rows))
+        return await self.db.upsert_users(rows)
+
+    async def test_coalesces_into_one_bulk_upsert(self):
+        tracker = ActivityTracker(self.recording_upsert, interval=3600)
+        for i in range(10):
+            tracker.touch(1, "alice", "Alice")
+            tracker.touch(2, f"bob{i}", "Bob")
+        self.assertEqual(tracker.pending, 2)
+        self.assertEqual(tracker.stats.coalesced, 18)
+
+        await tracker.flush()
+        self.assertEqual(self.batches, [2])
+        users = await self.users()
+        self.assertEqual(users[2].username, "bob9")
+
+    async def test_upsert_updates_existing_user(self):
+        await self.db.register_or_update_user(1, "old", "Old Name")
+        created = (await self.users())[1].created_at
+
+        tracker = ActivityTracker(self.db.upsert_users, interval=3600)
+        tracker.touch(1, "new", "New Name")
+        await tracker.flush()
+
+        user = (await self.users())[1]
+        self.assertEqual((user.username, user.full_name), ("new", "New Name"))
+        self.assertEqual(user.created_at, created)
+        self.assertGreaterEqual(user.last_active, created)
+
+    async def test_stop_flushes_pending(self):
+        tracker = ActivityTracker(self.recording_upsert, interval=3600)
+        tracker.start()
+        tracker.touch(1, "alice", "Alice")
+        await tracker.stop()
+        self.assertIn(1, await self.users())
+        self.assertEqual(tracker.pending, 0)
+
+    async def test_max_pending_triggers_flush(self):
+        tracker = ActivityTracker(self.recording_upsert, interval=3600, max_pending=3)
+        tracker.start()
+        for i in range(3):
+            tracker.touch(i, None, None)
+        for _ in range(50):
+            if self.batches:
+                break
+            await asyncio.sleep(0.01)
+        await tracker.stop()
+        self.assertEqual(self.batches, [3])
+
+    async def test_failed_flush_requeues_without_losing_newer_touch(self):
+        calls = []
+
+        async def failing(rows):
+            calls.append(rows)
+            tracker.touch(1, "newer", "Alice")  # пришло, пока шла запись
+            raise ConnectionError("db down")
+
+        tracker = ActivityTracker(failing, interval=3600)
+        tracker.touch(1, "older", "Alice")
+        tracker.touch(2, "bob", "Bob")
+        with self.assertRaises(ConnectionError):
+            await tracker.flush()
+
+        self.assertEqual(tracker.pending, 2)
+        self.assertEqual(tracker._pending[1]["username"], "newer")
+        self.assertEqual(tracker.stats.failures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
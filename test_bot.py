@@ -0,0 +1,190 @@
+import os
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST-TOKEN-NOT-USED")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+import bot
+import engine
+
+
+# Ответ модели по маркеру в системном промпте роли
+SCRIPT = [
+    ("Оркестратор", "SOLVER"),
+    ("Агент ТРИЗ", "Инверсия: пусть платят за тишину"),
+    ("Системный Аналитик", "Узкое место в оплате"),
+    ("Риск-менеджер", "РИСК: блокировка платежей"),
+    ("Синтезатор решений", "**Итог:** запускайте платную подписку"),
+]
+SYNTHESIZER_REPLY = SCRIPT[-1][1]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Чат-модель без сети: отвечает по SCRIPT и стримит ответ по словам."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @staticmethod
+    def _reply(messages) -> str:
+        system = messages[0].content
+        return next((reply for marker, reply in SCRIPT if marker in system), "ok")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._reply(messages).split(" ")
+        for i, word in enumerate(words):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeSentMessage:
+    def __init__(self, chat: "FakeMessage", text: str):
+        self.chat = chat
+        self.html_text = text
+
+    async def edit_text(self, text: str, parse_mode=None):
+        self.html_text = text
+        self.chat.log.append(("edit", text, parse_mode))
+
+
+class FakeMessage:
+    """Входящее сообщение aiogram: answer/edit_text пишут в log вместо Telegram."""
+
+    def __init__(self, text: str, user_id: int = 555):
+        self.text = text
+        self.message_id = 1
+        self.from_user = SimpleNamespace(id=user_id, username="ivan", full_name="Ivan")
+        self.log = []
+        self.verdict_delivered = asyncio.Event()
+
+    async def answer(self, text: str, parse_mode=None):
+        self.log.append(("answer", text, parse_mode))
+        if text == "**VERDICT**":
+            self.verdict_delivered.set()
+        return FakeSentMessage(self, text)
+
+
+class BotTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.memory = MemorySaver()
+        self._patches = [
+            patch.object(bot, "checkpointer", self.memory),
+            patch.object(engine.search, "invoke", lambda q: "Mock Search Results"),
+            patch.object(engine, "llm", RunnableLambda(lambda x: AIMessage(content="**VERDICT**"))),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+    def use_graph(self, **graph_options):
+        graph_options.setdefault("fast_path", False)
+        graph = engine.get_graph(checkpointer=self.memory, **graph_options)
+        return patch.object(bot.graph_registry, "get", lambda checkpointer=None, **_: graph)
+
+
+class TestVerdictDelivery(BotTestCase):
+    async def test_verdict_sent_before_history_summary(self):
+        message = FakeMessage("Как монетизировать бота?")
+        order = []
+
+        async def mock_llm_call(role, context, user_query=""):
+            if role == "ORCHESTRATOR":
+                return "SOLVER"
+            if role == "SUMMARIZER":
+                # Сводка ждет, пока пользователь получит ответ; если бот ждет сводку — таймаут
+                try:
+                    await asyncio.wait_for(message.verdict_delivered.wait(), 2)
+                    order.append("summarizer")
+                except asyncio.TimeoutError:
+                    order.append("summarizer timed out")
+                return "SUMMARY"
+            return f"{role} answer"
+
+        # Окно истории 1: сводка запускается уже на первом ходу
+        with patch.object(engine, "call_llm_async", mock_llm_call), \
+                patch.object(engine, "HISTORY_WINDOW", 1), patch.object(engine, "HISTORY_SUMMARY_BATCH", 0), \
+                self.use_graph(compact=True):
+            await bot.process_query(message, message.text)
+
+        self.assertEqual(order, ["summarizer"])
+        answers = [text for kind, text, _ in message.log if kind == "answer"]
+        self.assertIn("**VERDICT**", answers)
+        self.assertIn("TRIZ answer", answers[-1])   # спойлеры с ответами агентов
+        state = await self.memory.aget_tuple({"configurable": {"thread_id": "555"}})
+        self.assertEqual(state.checkpoint["channel_values"]["memory"], "SUMMARY")
+
+
+class TestVerdictStreaming(BotTestCase):
+    def setUp(self):
+        super().setUp()
+        model = ScriptedChatModel()
+        fast_model = engine.model_registry.get("ORCHESTRATOR").model
+        self._stream_patches = [
+            patch.object(engine, "llm", model),
+            patch.dict(engine._role_models, {fast_model: model}),
+            patch.object(engine, "prompt_chains", engine.PromptChainCache()),
+            patch.object(bot, "UPDATE_INTERVAL", 0),   # каждый чанк — отдельная правка черновика
+        ]
+        for p in self._stream_patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._stream_patches:
+            p.stop()
+        super().tearDown()
+
+    async def stream_drafts(self) -> list:
+        message = FakeMessage("Как монетизировать бота?")
+        with self.use_graph(compact=False):
+            await bot.process_query(message, message.text)
+        # Черновики стрима шлются без разметки и с курсором
+        drafts = [text for _, text, parse_mode in message.log if parse_mode is None and text.endswith(" ▌")]
+        self.assertIn(("edit", SYNTHESIZER_REPLY, bot.ParseMode.MARKDOWN), message.log)
+        return drafts
+
+    def assert_only_synthesizer(self, drafts: list):
+        self.assertGreater(len(drafts), 1)
+        for draft in drafts:
+            self.assertTrue(SYNTHESIZER_REPLY.startswith(draft[:-2]), draft)
+        self.assertEqual(drafts[-1], SYNTHESIZER_REPLY + " ▌")
+
+    async def test_only_synthesizer_tokens_streamed(self):
+        self.assert_only_synthesizer(await self.stream_drafts())
+
+    async def test_nostream_roles_emit_no_chunks(self):
+        """Цепочки солверов и оркестратора помечены TAG_NOSTREAM: их токены не попадают в стрим графа."""
+        graph = engine.get_graph(checkpointer=MemorySaver(), fast_path=False, compact=False)
+        query = "Как монетизировать бота?"
+        nodes = set()
+        async for chunk, metadata in graph.astream({"messages": [HumanMessage(content=query)], "user_query": query},
+                                                   {"configurable": {"thread_id": "s"}}, stream_mode="messages"):
+            if chunk.content:
+                nodes.add(metadata["langgraph_node"])
+        self.assertEqual(nodes, {"synthesizer"})
+
+    async def test_bot_filters_other_nodes(self):
+        # Даже если солверы начнут стримить (без TAG_NOSTREAM), бот показывает только синтезатор
+        with patch.object(engine, "STREAMING_ROLES", tuple(engine.PROMPTS)):
+            self.assert_only_synthesizer(await self.stream_drafts())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import json
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from langgraph.checkpoint.base.id import uuid6
+
+from checkpoint_gc import CheckpointGC
+
+# Схема AsyncPostgresSaver (JSONB -> TEXT для SQLite)
+SCHEMA = [
+    """CREATE TABLE checkpoints (
+        thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', checkpoint_id TEXT NOT NULL,
+        parent_checkpoint_id TEXT, type TEXT, checkpoint TEXT NOT NULL, metadata TEXT NOT NULL DEFAULT '{}',
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))""",
+    """CREATE TABLE checkpoint_blobs (
+        thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', channel TEXT NOT NULL,
+        version TEXT NOT NULL, type TEXT NOT NULL, blob BLOB,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version))""",
+    """CREATE TABLE checkpoint_writes (
+        thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, blob BLOB NOT NULL,
+        task_path TEXT NOT NULL DEFAULT '', PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))""",
+]
+
+NOW = datetime(2026, 1, 31, tzinfo=timezone.utc)
+
+
+def version(n: int) -> str:
+    return f"{n:032}.{0:016}"
+
+
+class TestCheckpointGC(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'cp.db')}")
+        async with self.engine.begin() as conn:
+            for ddl in SCHEMA:
+                await conn.execute(text(ddl))
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def add_thread(self, thread_id: str, steps: int, last_active: datetime):
+        """Как пишет Postgres-saver: messages меняется каждый шаг, mode — только на первом."""
+        async with self.engine.begin() as conn:
+            parent = None
+            for step in range(1, steps + 1):
+                checkpoint_id = str(uuid6())
+                ts = (last_active - timedelta(minutes=steps - step)).isoformat()
+                checkpoint = {"v": 1, "id": checkpoint_id, "ts": ts,
+                              "channel_versions": {"messages": version(step), "branch:to:mode": version(1)}}
+                await conn.execute(text(
+                    "INSERT INTO checkpoints VALUES (:t, '', :id, :parent, NULL, :cp, '{}')"
+                ), {"t": thread_id, "id": checkpoint_id, "parent": parent, "cp": json.dumps(checkpoint)})
+                await conn.execute(text(
+                    "INSERT INTO checkpoint_blobs VALUES (:t, '', 'messages', :v, 'msgpack', :blob)"
+                ), {"t": thread_id, "v": version(step), "blob": b"x" * 100})
+                if step == 1:
+                    await conn.execute(text(
+                        "INSERT INTO checkpoint_blobs VALUES (:t, '', 'branch:to:mode', :v, 'msgpack', :blob)"
+                    ), {"t": thread_id, "v": version(1), "blob": b"m"})
+                await conn.execute(text(
+                    "INSERT INTO checkpoint_writes VALUES (:t, '', :id, 'task', 0, 'messages', 'msgpack', :blob, '')"
+                ), {"t": thread_id, "id": checkpoint_id, "blob": b"w"})
+                parent = checkpoint_id
+
+    async def rows(self, table: str, thread_id: str):
+        async with self.engine.connect() as conn:
+            return (await conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE thread_id = :t"),
+                                       {"t": thread_id})).scalar()
+
+    async def test_keeps_last_n_and_referenced_blobs(self):
+        await self.add_thread("active", steps=30, last_active=NOW)
+        gc = CheckpointGC(self.engine, keep_last=5, ttl_days=30, batch=2, pause=0)
+
+        stats = await gc.run_once(now=NOW)
+
+        self.assertEqual(await self.rows("checkpoints", "active"), 5)
+        self.assertEqual(await self.rows("checkpoint_writes", "active"), 5)
+        # 5 живых версий messages + версия mode, на которую все еще ссылаются
+        self.assertEqual(await self.rows("checkpoint_blobs", "active"), 6)
+        self.assertEqual(stats["checkpoints_deleted"], 25)
+        self.assertEqual(stats["blobs_deleted"], 25)
+        self.assertEqual(stats["writes_deleted"], 25)
+        self.assertEqual(stats["table_rows"]["checkpoints"], 5)
+
+        # Последний чекпоинт (продолжение диалога) на месте
+        async with self.engine.connect() as conn:
+            latest = (await conn.execute(text("SELECT MAX(checkpoint_id) FROM checkpoints"))).scalar()
+            self.assertEqual(json.loads((await conn.execute(text(
+                "SELECT checkpoint FROM checkpoints WHERE checkpoint_id = :id"), {"id": latest})).scalar())
+                ["channel_versions"]["messages"], version(30))
+
+    async def test_expires_idle_threads(self):
+        await self.add_thread("idle", steps=3, last_active=NOW - timedelta(days=40))
+        await self.add_thread("recent", steps=3, last_active=NOW - timedelta(days=1))
+        gc = CheckpointGC(self.engine, keep_last=10, ttl_days=30, pause=0)
+
+        await gc.run_once(now=NOW)
+
+        for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+            self.assertEqual(await self.rows(table, "idle"), 0)
+        self.assertEqual(await self.rows("checkpoints", "recent"), 3)
+        self.assertEqual(gc.stats.threads_expired, 1)
+
+    async def test_batches_cover_all_threads(self):
+        for i in range(7):
+            await self.add_thread(f"user{i}", steps=4, last_active=NOW)
+        gc = CheckpointGC(self.engine, keep_last=2, ttl_days=0, batch=3, pause=0)
+
+        await gc.run_once(now=NOW)
+
+        self.assertEqual(gc.stats.threads_pruned, 7)
+        for i in range(7):
+            self.assertEqual(await self.rows("checkpoints", f"user{i}"), 2)
+
+        # Повторный проход ничего не трогает
+        await gc.run_once(now=NOW)
+        self.assertEqual(gc.stats.checkpoints_deleted, 14)
+
+    async def test_background_task_stops(self):
+        gc = CheckpointGC(self.engine, interval=3600, pause=0)
+        gc.start()
+        await gc.stop()
+        self.assertIsNone(gc._task)
+
+
+if __name__ == "__main__":
+    unittest.main()
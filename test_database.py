@@ -0,0 +1,56 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+from database import DB, DB_POOL_SIZE, DB_STATEMENT_CACHE_SIZE, engine_options
+
+
+class TestUpsert(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DB(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'users.db')}")
+        await self.db.init_db()
+
+    async def asyncTearDown(self):
+        await self.db.engine.dispose()
+        self.tmp.cleanup()
+
+    async def test_insert_then_update_keeps_created_at(self):
+        created = await self.db.register_or_update_user(1, "alice", "Alice")
+        self.assertEqual(created.username, "alice")
+        self.assertIsNotNone(created.created_at)
+
+        updated = await self.db.register_or_update_user(1, "alice2", "Alice B")
+        self.assertEqual((updated.id, updated.username, updated.full_name), (1, "alice2", "Alice B"))
+        self.assertEqual(updated.created_at, created.created_at)
+        self.assertGreaterEqual(updated.last_active, created.last_active)
+
+    async def test_concurrent_upserts_same_user(self):
+        # Без read-modify-write гонка двух первых сообщений не дает IntegrityError
+        await asyncio.gather(*(self.db.register_or_update_user(7, f"u{i}", "U") for i in range(10)))
+        user = await self.db.register_or_update_user(7, "final", "U")
+        self.assertEqual(user.username, "final")
+
+    async def test_pool_status(self):
+        await self.db.register_or_update_user(1, "alice", "Alice")
+        status = self.db.pool_status()
+        self.assertEqual(status["size"], DB_POOL_SIZE)
+        self.assertGreaterEqual(status["checkouts"], 2)
+        self.assertGreaterEqual(status["connects"], 1)
+        self.assertEqual(status["checkedout"], 0)
+
+
+class TestEngineOptions(unittest.TestCase):
+    def test_asyncpg_gets_timeouts_and_statement_cache(self):
+        options = engine_options("postgresql+asyncpg://u:p@localhost/db")
+        self.assertEqual(options["url"].query["prepared_statement_cache_size"], str(DB_STATEMENT_CACHE_SIZE))
+        self.assertIn("statement_timeout", options["connect_args"]["server_settings"])
+        self.assertTrue(options["pool_pre_ping"])
+
+    def test_memory_sqlite_has_no_pool_options(self):
+        self.assertEqual(list(engine_options("sqlite+aiosqlite://")), ["url"])
+
+
+if __name__ == "__main__":
+    unittest.main()
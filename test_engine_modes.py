@@ -0,0 +1,280 @@
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import engine
+from intent_classifier import IntentVerdict
+from response_cache import ResponseCache
+
+
+def make_llm_mock(mode: str, calls: list, solver_delay: float = 0.0):
+    async def mock_llm_call(role, context, user_query=""):
+        calls.append(role)
+        if role == "ORCHESTRATOR":
+            return mode
+        await asyncio.sleep(solver_delay)
+        return f"{role} answer"
+    return mock_llm_call
+
+
+class KeywordSolverModel:
+    """Обученная модель намерений (правила SOLVER не отдают): SOLVER для запросов со словом."""
+
+    def __init__(self, keyword: str):
+        self.keyword = keyword
+
+    def classify(self, query: str):
+        return IntentVerdict("SOLVER", 0.95, "model") if self.keyword in query.lower() else None
+
+
+class EngineModesTestCase(unittest.IsolatedAsyncioTestCase):
+    """Прогоны графа в разных режимах с замоканными LLM и поиском (как в test_engine.py)."""
+
+    def setUp(self):
+        self.calls = []
+        self._patches = [
+            patch.object(engine.search, "invoke", lambda q: "Mock Search Results"),
+            patch.object(engine, "llm", RunnableLambda(lambda x: AIMessage(content="**VERDICT**"))),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+    async def run_graph(self, query: str, checkpointer=None, thread_id: str = "test", **graph_options):
+        graph_options.setdefault("fast_path", False)
+        graph_options.setdefault("compact", False)
+        graph = engine.get_graph(checkpointer=checkpointer or MemorySaver(), **graph_options)
+        config = {"configurable": {"thread_id": thread_id}}
+        return await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query}, config)
+
+
+class TestSpeculativeSolvers(EngineModesTestCase):
+    async def test_hit_keeps_results(self):
+        with patch.object(engine, "call_llm_async", make_llm_mock("SOLVER", self.calls)):
+            state = await self.run_graph("Как монетизировать бота?", speculative=True)
+        self.assertTrue(state["speculative_hit"])
+        self.assertEqual(state["triz_out"], "TRIZ answer")
+        self.assertEqual(state["final_verdict"], "**VERDICT**")
+        # Солверы вызваны ровно один раз — узел solvers пропущен
+        self.assertEqual(self.calls.count("TRIZ"), 1)
+
+    async def test_chitchat_cancels_solvers(self):
+        before = engine.speculation_stats.cancelled
+        with patch.object(engine, "call_llm_async", make_llm_mock("CHITCHAT", self.calls, solver_delay=1.0)):
+            state = await self.run_graph("Привет", speculative=True)
+        self.assertFalse(state["speculative_hit"])
+        self.assertNotIn("final_verdict", state)
+        self.assertEqual(engine.speculation_stats.cancelled, before + 1)
+        self.assertGreater(engine.speculation_stats.wasted_tokens, 0)
+
+    async def test_pre_step_reruns_solvers(self):
+        with patch.object(engine, "call_llm_async", make_llm_mock("THERAPIST", self.calls)):
+            state = await self.run_graph("Мне страшно", speculative=True)
+        self.assertEqual(state["final_verdict"], "**VERDICT**")
+        # Спекулятивный прогон выброшен, солверы запущены заново после терапевта
+        self.assertFalse(state["speculative_hit"])
+        self.assertEqual(self.calls[-3:], ["TRIZ", "SYSTEM", "CRITIC"])
+        self.assertIn("THERAPIST", self.calls)
+
+    async def test_new_question_after_retry_uses_new_task(self):
+        contexts = []
+        modes = iter(["SOLVER", "RETRY", "SOLVER"])
+
+        async def mock_llm_call(role, context, user_query=""):
+            if role == "ORCHESTRATOR":
+                return next(modes)
+            if role == "TRIZ":
+                contexts.append(context)
+            return f"{role} answer"
+
+        # В чекпоинте после RETRY остаются mode=RETRY и original_task прошлой задачи
+        memory = MemorySaver()
+        with patch.object(engine, "call_llm_async", mock_llm_call):
+            for query in ("Задача A", "Не то, еще раз", "Задача B"):
+                await self.run_graph(query, checkpointer=memory, speculative=True, compact=True)
+        # Последний ход — спекулятивное попадание: солверы вызваны один раз, с новой задачей
+        self.assertIn("USER TASK: Задача B", contexts[-1])
+        self.assertNotIn("Задача A", contexts[-1])
+
+
+class TestPipelinedSolvers(EngineModesTestCase):
+    async def test_same_state_contract(self):
+        searched = []
+
+        def invoke(q):
+            searched.append(q)
+            return f"Title: {q}"
+
+        async def mock_llm_call(role, context, user_query=""):
+            if role == "ORCHESTRATOR":
+                return "SOLVER"
+            return f"{role} предлагает проверить гипотезу на реальных пользователях."
+
+        with patch.object(engine, "call_llm_async", mock_llm_call), patch.object(engine.search, "invoke", invoke):
+            state = await self.run_graph("Как монетизировать бота?", pipelined=True)
+        self.assertEqual(state["final_verdict"], "**VERDICT**")
+        self.assertEqual(len(searched), 3)  # по утверждению от каждого солвера
+        for role in ("TRIZ", "SYSTEM", "CRITIC"):
+            self.assertIn(role, state["research_output"])
+
+    async def test_speculative_and_pipelined(self):
+        with patch.object(engine, "call_llm_async", make_llm_mock("SOLVER", self.calls)):
+            state = await self.run_graph("Как монетизировать бота?", speculative=True, pipelined=True)
+        self.assertEqual(state["final_verdict"], "**VERDICT**")
+        self.assertEqual(self.calls.count("TRIZ"), 1)
+
+
+class TestResponseCache(EngineModesTestCase):
+    def setUp(self):
+        super().setUp()
+        self._cache_patch = patch.object(engine, "response_cache", ResponseCache())
+        self._cache_patch.start()
+
+    def tearDown(self):
+        self._cache_patch.stop()
+        super().tearDown()
+
+    async def test_similar_question_short_circuits(self):
+        with patch.object(engine, "call_llm_async", make_llm_mock("SOLVER", self.calls)):
+            await self.run_graph("Как монетизировать телеграм бота?", cached=True, thread_id="u1")
+            self.calls.clear()
+            state = await self.run_graph("как монетизировать телеграмм бота", cached=True, thread_id="u2")
+        self.assertTrue(state["cache_hit"])
+        self.assertEqual(state["final_verdict"], "**VERDICT**")
+        self.assertEqual(self.calls, ["ORCHESTRATOR"])
+
+    async def test_other_modes_not_cached(self):
+        with patch.object(engine, "call_llm_async", make_llm_mock("THERAPIST", self.calls)):
+            await self.run_graph("Мне страшно запускать бизнес", cached=True)
+        self.assertEqual(len(engine.response_cache), 0)
+
+    async def test_stale_speculative_flag_is_reset(self):
+        # Первый прогон через спекулятивный оркестратор, второй — через быстрый путь
+        memory = MemorySaver()
+        with patch.object(engine, "call_llm_async", make_llm_mock("SOLVER", self.calls)), \
+                patch.object(engine.intent_classifier, "model", KeywordSolverModel("клиент")):
+            await self.run_graph("Почему небо голубое?", checkpointer=memory, speculative=True, cached=True, fast_path=True)
+            self.calls.clear()
+            state = await self.run_graph("Как снизить отток клиентов?", checkpointer=memory, speculative=True,
+                                         cached=True, fast_path=True)
+        self.assertFalse(state["cache_hit"])
+        self.assertEqual(self.calls, ["TRIZ", "SYSTEM", "CRITIC"])
+
+
+class TestBreakerCancellation(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_probe_does_not_wedge_breaker(self):
+        breaker = engine.CircuitBreaker(threshold=1, cooldown=0.0)
+        breaker.record_failure(TimeoutError())
+        started = asyncio.Event()
+
+        async def hang(_):
+            started.set()
+            await asyncio.sleep(60)
+
+        with patch.object(engine, "llm_breaker", breaker):
+            # Пробный запрос HALF_OPEN отменяется (cancel-политика, спекуляция, проигравший хедж)
+            probe = asyncio.create_task(engine._call_llm_with_retry(RunnableLambda(hang), {}, "TRIZ"))
+            await started.wait()
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+            result = await engine._call_llm_with_retry(RunnableLambda(lambda _: "ok"), {}, "TRIZ")
+        self.assertEqual(result, "ok")
+        self.assertEqual(breaker.state, engine.CircuitBreaker.CLOSED)
+
+
+class TestFactChecker(unittest.IsolatedAsyncioTestCase):
+    def test_claims_from_all_solvers(self):
+        claims = engine.collect_claims([
+            "**Инверсия**: Берите деньги за то, что пользователь НЕ пользуется ботом.",
+            "Bottleneck: скорость обработки платежей ограничивает пропускную способность.",
+            "РИСК: Пользователи ненавидят платить за подписку в Telegram.",
+        ], max_claims=4)
+        self.assertEqual(len(claims), 3)
+        self.assertTrue(claims[2].startswith("Пользователи ненавидят"))
+
+    def test_error_outputs_are_skipped(self):
+        self.assertEqual(engine.extract_claims("⚠️ Ошибка: 401 Unauthorized for this request", 3), [])
+
+    def test_merge_dedup_and_budget(self):
+        block = "Title: a\nSnippet: b\nLink: c"
+        merged = engine.merge_research([block, block, "No results found.", "Search Error: boom"])
+        self.assertEqual(merged, block)
+        self.assertLessEqual(len(engine.merge_research(["x" * 50, "y" * 50], max_chars=60)), 60)
+
+    async def test_slow_search_times_out(self):
+        import time
+
+        def slow_invoke(q):
+            time.sleep(0.5 if q == "slow" else 0)
+            return f"Title: {q}"
+
+        with patch.object(engine.search, "invoke", slow_invoke), patch.object(engine, "FACT_CHECK_TIMEOUT", 0.05):
+            results = await engine.search_claims(["fast", "slow"])
+        self.assertEqual(results[0], "Title: fast")
+        self.assertIn("таймаут", results[1])
+
+
+def checkpoint_size(checkpointer, config) -> int:
+    # Размер сериализованных значений каналов — то, что уходит в строку чекпоинта
+    checkpoint = checkpointer.get_tuple(config).checkpoint
+    return sum(len(checkpointer.serde.dumps_typed(v)[1]) for v in checkpoint["channel_values"].values())
+
+
+class TestHistoryCompaction(EngineModesTestCase):
+    async def run_turns(self, n: int, memory: MemorySaver):
+        sizes = []
+        for i in range(n):
+            state = await self.run_graph(f"Задача номер {i}: " + "как масштабировать продажи? " * 20,
+                                         checkpointer=memory, thread_id="history", compact=True)
+            sizes.append(checkpoint_size(memory, {"configurable": {"thread_id": "history"}}))
+        return state, sizes
+
+    async def test_history_bounded_and_summarized(self):
+        memory = MemorySaver()
+        with patch.object(engine, "call_llm_async", make_llm_mock("SOLVER", self.calls)):
+            state, sizes = await self.run_turns(40, memory)
+
+        limit = engine.HISTORY_WINDOW + engine.HISTORY_SUMMARY_BATCH
+        self.assertLessEqual(len(state["messages"]), limit)
+        self.assertEqual(state["memory"], "SUMMARIZER answer")
+        self.assertIn("SUMMARIZER", self.calls)
+        # Вердикт записан в историю, поля прогона очищены до чекпоинта
+        self.assertEqual(state["messages"][-1].content, "**VERDICT**")
+        self.assertEqual(state["triz_out"], "")
+        self.assertEqual(state["final_verdict"], "")
+        self.assertEqual(state["original_task"], state["user_query"])
+        # Размер чекпоинта не растет с числом ходов
+        self.assertLessEqual(max(sizes[20:]), max(sizes[:20]) * 1.1)
+
+    async def test_summarizer_failure_falls_back_to_extractive_memory(self):
+        async def failing_summarizer(role, context, user_query=""):
+            if role == "SUMMARIZER":
+                return "⚠️ Ошибка: timeout"
+            return await make_llm_mock("SOLVER", self.calls)(role, context, user_query)
+
+        with patch.object(engine, "call_llm_async", failing_summarizer):
+            state, _ = await self.run_turns(10, MemorySaver())
+        self.assertIn("Задача номер 0", state["memory"])
+        self.assertLessEqual(engine.estimate_tokens(state["memory"]), engine.MEMORY_MAX_TOKENS + 10)
+
+    async def test_therapist_message_kept_in_history(self):
+        memory = MemorySaver()
+        with patch.object(engine, "call_llm_async", make_llm_mock("THERAPIST", self.calls)):
+            state = await self.run_graph("Мне страшно", checkpointer=memory, compact=True)
+        contents = [m.content for m in state["messages"]]
+        self.assertEqual(contents, ["Мне страшно", "[Терапевт]: THERAPIST answer", "**VERDICT**"])
+
+
+if __name__ == '__main__':
+    unittest.main()
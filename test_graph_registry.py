@@ -0,0 +1,92 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import engine
+from intent_classifier import IntentVerdict
+
+
+class TestGraphRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = engine.GraphRegistry()
+
+    def test_same_checkpointer_reuses_graph(self):
+        """Повторный get() с тем же чекпоинтером не перекомпилирует граф."""
+        memory = MemorySaver()
+        self.assertIs(self.registry.get(checkpointer=memory), self.registry.get(checkpointer=memory))
+        self.assertEqual(len(self.registry), 1)
+
+    def test_different_checkpointers_get_own_graphs(self):
+        g1 = self.registry.get(checkpointer=MemorySaver())
+        g2 = self.registry.get(checkpointer=MemorySaver())
+        self.assertIsNot(g1, g2)
+
+    def test_rebuild_recompiles(self):
+        memory = MemorySaver()
+        g1 = self.registry.get(checkpointer=memory)
+        self.registry.rebuild()
+        self.assertEqual(len(self.registry), 0)
+        self.assertIsNot(g1, self.registry.get(checkpointer=memory))
+
+
+class TestPromptChainCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = engine.PromptChainCache()
+        self.built = []
+        build = self.cache._build
+
+        def counting_build(role, *args):
+            self.built.append(role)
+            return build(role, *args)
+
+        self._patches = [
+            patch.object(self.cache, "_build", counting_build),
+            patch.object(engine, "prompt_chains", self.cache),
+            patch.object(engine, "llm", RunnableLambda(lambda x: AIMessage(content="**VERDICT**"))),
+            patch.object(engine.search, "invoke", lambda q: "Mock Search Results"),
+            # Быстрый путь SOLVER отдает только обученная модель намерений
+            patch.object(engine.intent_classifier, "model",
+                         SimpleNamespace(classify=lambda q: IntentVerdict("SOLVER", 0.95, "model"))),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+    async def test_chains_built_once_and_reused_across_graphs(self):
+        """Цепочки собираются один раз на роль и переживают пересборку графа."""
+        query = "Как монетизировать телеграм бота?"  # быстрый путь SOLVER, без оркестратора
+        for _ in range(2):
+            graph = engine.get_graph(checkpointer=MemorySaver(), fast_path=True, compact=False)
+            state = await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query},
+                                        {"configurable": {"thread_id": "chains"}})
+            self.assertEqual(state["final_verdict"], "**VERDICT**")
+        self.assertEqual(sorted(self.built), ["CRITIC", "SYNTHESIZER", "SYSTEM", "TRIZ"])
+        self.assertIs(self.cache.get("TRIZ"), self.cache.get("TRIZ"))
+
+    def test_prompt_change_rebuilds(self):
+        chain = self.cache.get("TRIZ")
+        with patch.dict(engine.PROMPTS, {"TRIZ": engine.PROMPTS["TRIZ"] + "\nОтвечай по-английски."}):
+            self.assertIsNot(self.cache.get("TRIZ"), chain)
+        self.assertEqual(self.built, ["TRIZ", "TRIZ"])
+
+    def test_model_change_rebuilds(self):
+        chain = self.cache.get("TRIZ")
+        with patch.object(engine, "llm", RunnableLambda(lambda x: AIMessage(content="other"))):
+            self.assertIsNot(self.cache.get("TRIZ"), chain)
+        with patch.object(engine, "model_registry", engine.ModelRegistry.from_env(strong=engine.MODEL_NAME)):
+            self.cache.get("TRIZ")
+        self.assertEqual(self.built, ["TRIZ", "TRIZ", "TRIZ"])
+
+
+if __name__ == '__main__':
+    unittest.main()
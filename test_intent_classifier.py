@@ -0,0 +1,80 @@
+import unittest
+from intent_classifier import IntentClassifier, IntentVerdict, TfidfIntentModel
+
+try:
+    import sklearn  # noqa: F401
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+
+class AlwaysSolverModel:
+    """Модель, уверенно отвечающая SOLVER на всё (проверяем, что её перекрывают эскалации)."""
+
+    def classify(self, query):
+        return IntentVerdict("SOLVER", 0.99, "model")
+
+
+class TestIntentClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = IntentClassifier(threshold=0.85, log_path="")
+
+    def test_greeting_is_chitchat(self):
+        verdict = self.classifier.classify("Привет!")
+        self.assertEqual(verdict.mode, "CHITCHAT")
+        self.assertEqual(verdict.source, "rules")
+
+    def test_retry(self):
+        self.assertEqual(self.classifier.classify("не то, попробуй еще раз").mode, "RETRY")
+        self.assertEqual(self.classifier.classify("Фигня. Переделай!").mode, "RETRY")
+
+    def test_retry_words_inside_new_question(self):
+        """Слова жалобы внутри нового вопроса — это новая задача, а не RETRY."""
+        for query in ("Наш продукт не подходит для рынка, что менять?",
+                      "Предложи другой вариант ценообразования",
+                      "Как объяснить клиенту ещё раз условия договора?"):
+            verdict = self.classifier.classify(query)
+            self.assertNotEqual(verdict and verdict.mode, "RETRY", query)
+
+    def test_rules_never_emit_solver(self):
+        """SOLVER по ключевым словам не выносится: его отдает только обученная модель."""
+        self.assertIsNone(self.classifier.classify("Как монетизировать телеграм бота?"))
+        with_model = IntentClassifier(threshold=0.85, model=AlwaysSolverModel(), log_path="")
+        verdict = with_model.classify("Как монетизировать телеграм бота?")
+        self.assertEqual((verdict.mode, verdict.source), ("SOLVER", "model"))
+
+    def test_risky_business_questions_go_to_llm(self):
+        """Бизнес-слова рядом с эмоциями или серой этикой — не SOLVER, даже если модель уверена."""
+        with_model = IntentClassifier(threshold=0.85, model=AlwaysSolverModel(), log_path="")
+        for query in ("Как снизить налоги через серые схемы?",
+                      "Мне страшно, бизнес рушится, клиенты уходят",
+                      "Я в отчаянии, выручка упала",
+                      "Как уволить сотрудника без выплат, чтобы он не узнал",
+                      "Партнер уходит из стартапа, хочу слить его базу"):
+            self.assertIsNone(self.classifier.classify(query), query)
+            self.assertIsNone(with_model.classify(query), query)
+
+    def test_emotions_go_to_llm(self):
+        """Эмоции и серую этику решает только LLM (THERAPIST / CONSIGLIERE)."""
+        self.assertIsNone(self.classifier.classify("Я в панике, продажи падают, что делать?"))
+        self.assertIsNone(self.classifier.classify("Как обойти закон и не платить клиентам?"))
+
+    def test_unknown_goes_to_llm(self):
+        self.assertIsNone(self.classifier.classify("Почему небо голубое?"))
+
+    def test_threshold_falls_back(self):
+        strict = IntentClassifier(threshold=0.99, log_path="")
+        self.assertIsNone(strict.classify("Привет!"))
+
+    @unittest.skipUnless(HAS_SKLEARN, "scikit-learn not installed")
+    def test_tfidf_model(self):
+        records = [{"query": q, "mode": "CHITCHAT"} for q in ["как поживаешь", "что нового", "как настроение"]] * 5
+        records += [{"query": q, "mode": "SOLVER"} for q in ["снизить отток пользователей", "нанять разработчиков", "поднять цены на подписку"]] * 5
+        classifier = IntentClassifier(threshold=0.5, model=TfidfIntentModel.train(records), log_path="")
+        verdict = classifier.classify("как настроение сегодня")
+        self.assertEqual(verdict.mode, "CHITCHAT")
+        self.assertEqual(verdict.source, "model")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from llm_hedging import Hedger, HedgeBudget
+
+
+def make_hedger(**kwargs):
+    hedger = Hedger(enabled=True, roles=("TRIZ",), percentile=0.9, min_delay=0.01, min_samples=3,
+                    budget=kwargs.pop("budget", HedgeBudget(ratio=1.0)), **kwargs)
+    for _ in range(3):
+        hedger.latency.record("TRIZ", 0.01)
+    return hedger
+
+
+class TestHedger(unittest.IsolatedAsyncioTestCase):
+    async def test_fast_call_is_not_hedged(self):
+        hedger = make_hedger()
+
+        async def fast():
+            return "primary"
+
+        self.assertEqual(await hedger.call("TRIZ", fast, fast), "primary")
+        self.assertEqual(hedger.stats.hedged, 0)
+
+    async def test_slow_call_hedged_and_loser_cancelled(self):
+        hedger = make_hedger()
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+                return "primary"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def backup():
+            return "backup"
+
+        self.assertEqual(await hedger.call("TRIZ", slow, backup), "backup")
+        await asyncio.sleep(0)
+        self.assertTrue(cancelled.is_set())
+        self.assertEqual(hedger.stats.hedge_wins, 1)
+
+    async def test_no_history_no_hedge(self):
+        hedger = Hedger(enabled=True, roles=("TRIZ",), min_samples=3, budget=HedgeBudget(ratio=1.0))
+        self.assertIsNone(hedger.delay_for("TRIZ"))
+
+    async def test_budget_caps_hedges(self):
+        hedger = make_hedger(budget=HedgeBudget(ratio=0.0))
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        self.assertEqual(await hedger.call("TRIZ", slow, slow), "primary")
+        self.assertEqual(hedger.stats.hedged, 0)
+        self.assertEqual(hedger.stats.budget_denied, 1)
+
+    async def test_backup_used_when_primary_fails(self):
+        hedger = make_hedger()
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("boom")
+
+        async def backup():
+            await asyncio.sleep(0.1)
+            return "backup"
+
+        self.assertEqual(await hedger.call("TRIZ", failing, backup), "backup")
+
+
+if __name__ == '__main__':
+    unittest.main()
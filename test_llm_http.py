@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import unittest
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from unittest.mock import patch
+
+import httpx
+import openai
+from aiohttp import web
+from langchain_openai import ChatOpenAI
+
+import engine
+from llm_http import SharedHTTPClient, http_pool
+
+
+def completion(content: str) -> dict:
+    return {
+        "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "mock",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class TestSharedHTTPClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.hits = 0
+
+        async def handler(request):
+            self.hits += 1
+            return web.json_response(completion("ok"))
+
+        async def failing(request):
+            self.hits += 1
+            return web.json_response({"error": {"message": "overloaded"}}, status=503)
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", handler)
+        async def slow(request):
+            await asyncio.sleep(3)
+            return web.json_response(completion("late"))
+
+        app.router.add_post("/failing/chat/completions", failing)
+        app.router.add_post("/slow/chat/completions", slow)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        self.root_url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_models_share_one_connection(self):
+        pool = SharedHTTPClient(http2=False)
+        self.addAsyncCleanup(pool.aclose)
+        models = [
+            ChatOpenAI(model=name, api_key="sk-mock", base_url=self.base_url, http_async_client=pool.client)
+            for name in ("strong", "fast")
+        ]
+        for _ in range(3):
+            for model in models:
+                self.assertEqual((await model.ainvoke("hi")).content, "ok")
+
+        stats = pool.stats.as_dict()
+        self.assertEqual(stats["requests"], 6)
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["reused"], 5)
+        self.assertEqual(stats["http_versions"], {"HTTP/1.1": 6})
+
+    async def test_aclose_recreates_client(self):
+        pool = SharedHTTPClient(http2=False)
+        first = pool.client
+        await pool.aclose()
+        self.assertTrue(first.is_closed)
+        self.assertIsNot(pool.client, first)
+        await pool.aclose()
+
+    def engine_model(self, path: str, pool: SharedHTTPClient):
+        self.addAsyncCleanup(pool.aclose)
+        with patch.object(engine, "http_pool", pool), patch.object(engine, "LLM_BASE_URL", self.root_url + path):
+            return engine._make_llm("mock")
+
+    async def test_engine_models_do_not_retry_internally(self):
+        """Один вызов — один HTTP-запрос: повторы делает tenacity, а не SDK."""
+        model = self.engine_model("/failing", SharedHTTPClient(http2=False))
+        with self.assertRaises(Exception) as ctx:
+            await model.ainvoke("hi")
+        self.assertEqual(getattr(ctx.exception, "status_code", None), 503)
+        self.assertEqual(self.hits, 1)
+
+    async def test_engine_models_respect_pool_timeout(self):
+        model = self.engine_model("/slow", SharedHTTPClient(http2=False, timeout=httpx.Timeout(0.5)))
+        start = time.perf_counter()
+        with self.assertRaises(openai.APITimeoutError):
+            await model.ainvoke("hi")
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_engine_models_use_shared_pool(self):
+        self.assertIs(engine._make_llm("any/model").http_async_client, http_pool.client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+
+from llm_limiter import PriorityLimiter, LLMOverloaded
+
+
+class TestPriorityLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrency_bound(self):
+        limiter = PriorityLimiter(max_concurrency=2, max_queue=10)
+        running, peak = 0, 0
+
+        async def work():
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(work() for _ in range(8)))
+        self.assertEqual(peak, 2)
+        self.assertEqual(limiter.active, 0)
+
+    async def test_priority_order(self):
+        limiter = PriorityLimiter(max_concurrency=1, max_queue=10)
+        order = []
+        await limiter.acquire()
+
+        async def work(name, priority):
+            async with limiter.slot(priority):
+                order.append(name)
+
+        tasks = [asyncio.create_task(work("solver", 2)), asyncio.create_task(work("speculative", 3)),
+                 asyncio.create_task(work("synthesizer", 0))]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["synthesizer", "solver", "speculative"])
+
+    async def test_load_shedding(self):
+        limiter = PriorityLimiter(max_concurrency=1, max_queue=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        self.assertTrue(limiter.overloaded())
+        with self.assertRaises(LLMOverloaded):
+            await limiter.acquire()
+        self.assertEqual(limiter.stats.shed, 1)
+        limiter.release()
+        await waiter
+
+    async def test_load_shedding_evicts_lower_priority(self):
+        limiter = PriorityLimiter(max_concurrency=1, max_queue=2)
+        await limiter.acquire()
+        solver = asyncio.create_task(limiter.acquire(2))
+        speculative = asyncio.create_task(limiter.acquire(3))
+        await asyncio.sleep(0)
+        # Очередь полна: синтезатор вытесняет спекулятивный вызов, а не отклоняется сам
+        self.assertFalse(limiter.overloaded(0))
+        self.assertTrue(limiter.overloaded(3))
+        synthesizer = asyncio.create_task(limiter.acquire(0))
+        await asyncio.sleep(0)
+        with self.assertRaises(LLMOverloaded):
+            await speculative
+        # Новый низкоприоритетный запрос при полной очереди отклоняется сам
+        with self.assertRaises(LLMOverloaded):
+            await limiter.acquire(3)
+        self.assertEqual(limiter.stats.shed, 2)
+
+        limiter.release()
+        await synthesizer
+        self.assertFalse(solver.done())
+        limiter.release()
+        await solver
+
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        limiter = PriorityLimiter(max_concurrency=1, max_queue=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        limiter.release()
+        self.assertEqual(limiter.active, 0)
+        await limiter.acquire()
+        self.assertEqual(limiter.active, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
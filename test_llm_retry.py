@@ -0,0 +1,152 @@
+import asyncio
+import unittest
+
+import httpx
+import openai
+
+from llm_retry import (llm_retry, RetryStats, RetryBudget, CircuitBreaker, CircuitOpenError,
+                       is_retryable, retry_after_seconds)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+
+class TestClassification(unittest.TestCase):
+    def test_fatal_and_retryable(self):
+        self.assertFalse(is_retryable(FakeAPIError(401)))
+        self.assertFalse(is_retryable(FakeAPIError(400)))
+        self.assertTrue(is_retryable(FakeAPIError(429)))
+        self.assertTrue(is_retryable(FakeAPIError(503)))
+        self.assertTrue(is_retryable(asyncio.TimeoutError()))
+        self.assertFalse(is_retryable(asyncio.CancelledError()))
+
+    def test_only_transport_errors_without_status_retry(self):
+        request = httpx.Request("POST", "http://llm/v1/chat/completions")
+        self.assertTrue(is_retryable(openai.APITimeoutError(request=request)))
+        self.assertTrue(is_retryable(openai.APIConnectionError(request=request)))
+        self.assertTrue(is_retryable(httpx.ConnectError("refused")))
+        self.assertTrue(is_retryable(FakeAPIError(409)))
+        # Ошибки в нашем коде (шаблон промпта, парсинг) не повторяются
+        self.assertFalse(is_retryable(KeyError("input")))
+        self.assertFalse(is_retryable(ValueError("bad json")))
+
+    def test_retry_after_headers(self):
+        self.assertEqual(retry_after_seconds(FakeAPIError(429, {"retry-after": "3"})), 3.0)
+        self.assertEqual(retry_after_seconds(FakeAPIError(429, {"retry-after-ms": "250"})), 0.25)
+        self.assertIsNone(retry_after_seconds(FakeAPIError(429)))
+
+
+class TestRetryPolicy(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.stats = RetryStats()
+        self.calls = 0
+
+    def make_call(self, errors, **kwargs):
+        @llm_retry(self.stats, RetryBudget(), **kwargs)
+        async def call():
+            self.calls += 1
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+        return call
+
+    async def test_auth_error_fails_fast(self):
+        with self.assertRaises(FakeAPIError):
+            await self.make_call([FakeAPIError(401)])()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.stats.fatal, 1)
+
+    async def test_honors_retry_after(self):
+        call = self.make_call([FakeAPIError(429, {"retry-after-ms": "10"})])
+        self.assertEqual(await call(), "ok")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.stats.retry_after_honored, 1)
+
+    async def test_time_budget_stops_long_waits(self):
+        call = self.make_call([FakeAPIError(429, {"retry-after": "60"})], budget_seconds=5)
+        with self.assertRaises(Exception):
+            await call()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.stats.deadline_stops, 1)
+
+    async def test_process_budget_limits_retries(self):
+        @llm_retry(self.stats, RetryBudget(min_tokens=1))
+        async def call():
+            raise FakeAPIError(429, {"retry-after-ms": "1"})
+
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                await call()
+        self.assertEqual(self.stats.budget_denied, 2)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_and_recovers(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.0)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record_failure(FakeAPIError(503))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # cooldown=0: сразу пробный запрос, второй параллельный отклоняется
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_probe_frees_half_open(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.0)
+        breaker.record_failure(FakeAPIError(503))
+        probe = breaker.before_call()  # пробный запрос
+        self.assertTrue(probe)
+        breaker.record_cancelled(probe)  # ...отменен: состояние то же, следующий вызов пропускается
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.before_call())
+
+    def test_only_probe_frees_half_open(self):
+        """Отмена или ошибка запроса, начатого еще в CLOSED, не освобождает чужую пробу."""
+        breaker = CircuitBreaker(threshold=1, cooldown=0.0)
+        old_call = breaker.before_call()
+        self.assertFalse(old_call)
+        breaker.record_failure(FakeAPIError(503))
+        breaker.before_call()          # пробный запрос
+        breaker.record_cancelled(old_call)
+        breaker.record_failure(FakeAPIError(400), old_call)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_state_code(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        self.assertEqual(breaker.as_dict()["state_code"], 0)
+        breaker.record_failure(FakeAPIError(503))
+        self.assertEqual(breaker.as_dict()["state_code"], 2)
+
+    def test_request_errors_do_not_trip(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        breaker.record_failure(FakeAPIError(400))
+        breaker.record_failure(KeyError("input"))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure(httpx.ReadTimeout("slow"))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_rejects(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        breaker.record_failure(FakeAPIError(401))
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual(breaker.rejected, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
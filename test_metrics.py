@@ -0,0 +1,120 @@
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import engine
+import metrics
+
+
+def sample(name: str, **labels) -> float:
+    return metrics.registry.get_sample_value(name, labels) or 0.0
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": {"retry-after-ms": "10"}})()
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patches = [
+            patch.object(engine.search, "invoke", lambda q: "Mock Search Results"),
+            patch.object(engine, "llm", RunnableLambda(lambda x: AIMessage(content="**VERDICT** готов"))),
+            patch.object(engine, "call_llm_async", self.mock_llm_call),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def mock_llm_call(self, role, context, user_query=""):
+        return "SOLVER" if role == "ORCHESTRATOR" else f"{role} answer"
+
+    async def test_graph_nodes_and_llm_calls_are_measured(self):
+        before = {node: sample("epistemic_node_duration_seconds_count", node=node)
+                  for node in ("orchestrator", "solvers", "fact_checker", "synthesizer")}
+        routed = sample("epistemic_routing_mode_total", node="orchestrator", mode="SOLVER")
+        synth_calls = sample("epistemic_llm_call_duration_seconds_count", role="SYNTHESIZER", outcome="ok")
+        prompt_tokens = sample("epistemic_llm_prompt_tokens_count", role="SYNTHESIZER")
+
+        graph = engine.get_graph(checkpointer=MemorySaver(), fast_path=False, compact=False)
+        query = "Как монетизировать телеграм бота?"
+        await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query},
+                            {"configurable": {"thread_id": "metrics"}})
+
+        for node, count in before.items():
+            self.assertEqual(sample("epistemic_node_duration_seconds_count", node=node), count + 1, node)
+        self.assertEqual(sample("epistemic_routing_mode_total", node="orchestrator", mode="SOLVER"), routed + 1)
+        self.assertEqual(sample("epistemic_llm_call_duration_seconds_count", role="SYNTHESIZER", outcome="ok"),
+                         synth_calls + 1)
+        self.assertEqual(sample("epistemic_llm_prompt_tokens_count", role="SYNTHESIZER"), prompt_tokens + 1)
+        self.assertGreater(sample("epistemic_llm_completion_tokens_sum", role="SYNTHESIZER"), 0)
+
+    async def test_retries_and_queue_wait(self):
+        failures = [FakeAPIError(503)]
+
+        def flaky(_):
+            if failures:
+                raise failures.pop()
+            return "ok"
+
+        retries = sample("epistemic_llm_retries_sum", role="TEST")
+        self.assertEqual(await engine._call_llm_with_retry(RunnableLambda(flaky), {"input": "x"}, "TEST"), "ok")
+        self.assertEqual(sample("epistemic_llm_retries_sum", role="TEST"), retries + 1)
+        self.assertEqual(sample("epistemic_llm_queue_wait_seconds_count", role="TEST"), 2)   # на каждую попытку
+
+    async def test_node_errors_counted(self):
+        async def broken(state):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            await metrics.instrument_node("broken", broken)({})
+        self.assertEqual(sample("epistemic_node_errors_total", node="broken"), 1)
+
+    async def test_cancellation_is_not_an_error(self):
+        async def slow(state):
+            await asyncio.sleep(60)
+
+        task = asyncio.create_task(metrics.instrument_node("slow", slow)({}))
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(sample("epistemic_node_cancelled_total", node="slow"), 1)
+        self.assertEqual(sample("epistemic_node_errors_total", node="slow"), 0)
+
+    async def test_metrics_endpoint(self):
+        metrics.register_stats("test_source", lambda: {"hits": 3, "ratio": 0.5, "nested": {"a": 1}, "name": "x"},
+                               gauges=("ratio",))
+        app = web.Application()
+        app.router.add_get("/metrics", metrics.metrics_handler)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        self.addAsyncCleanup(client.close)
+
+        body = await (await client.get("/metrics")).text()
+        self.assertIn("epistemic_node_duration_seconds_bucket", body)
+        # Монотонные поля — counter (*_total), остальные — gauge
+        self.assertRegex(body, r"# TYPE epistemic_test_source_hits(_total)? counter")
+        self.assertIn("epistemic_test_source_hits_total 3.0", body)
+        self.assertIn("# TYPE epistemic_test_source_ratio gauge", body)
+        self.assertIn("epistemic_test_source_ratio 0.5", body)
+        self.assertIn("epistemic_search_cache_hits", body)
+        # Состояние автомата LLM: gauge 0/1/2 и счетчики размыканий
+        self.assertIn("# TYPE epistemic_llm_breaker_state_code gauge", body)
+        self.assertIn("epistemic_llm_breaker_opens_total", body)
+        self.assertNotIn("epistemic_test_source_nested", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import random
+import unittest
+
+import openai
+from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_openai import ChatOpenAI
+
+from mock_llm_server import LatencyDistribution, MockLLMConfig, MockLLMServer
+
+
+class TestLatencyDistribution(unittest.TestCase):
+    def test_parse_and_sample(self):
+        rng = random.Random(1)
+        self.assertEqual(LatencyDistribution.parse("fixed:0.25").sample(rng), 0.25)
+        uniform = LatencyDistribution.parse("uniform:0.1:0.2")
+        self.assertTrue(all(0.1 <= uniform.sample(rng) <= 0.2 for _ in range(100)))
+        lognormal = LatencyDistribution.parse("lognormal:0.5:0.3")
+        samples = sorted(lognormal.sample(rng) for _ in range(1001))
+        self.assertAlmostEqual(samples[500], 0.5, delta=0.05)
+        self.assertTrue(all(s >= 0 for s in (LatencyDistribution.parse("normal:0:1").sample(rng) for _ in range(50))))
+        with self.assertRaises(ValueError):
+            LatencyDistribution.parse("pareto:1")
+
+
+class TestMockLLMServer(unittest.IsolatedAsyncioTestCase):
+    async def start(self, **config):
+        self.server = MockLLMServer(MockLLMConfig(**config))
+        base_url = await self.server.start()
+        self.addAsyncCleanup(self.server.stop)
+        return ChatOpenAI(model="mock/model", api_key="sk-mock", base_url=base_url, max_retries=0, max_tokens=20)
+
+    async def test_completion_with_usage(self):
+        llm = await self.start(completion_tokens=30)
+        result = await llm.ainvoke([SystemMessage(content="Ты — Синтезатор."), HumanMessage(content="Вопрос")])
+        self.assertEqual(len(result.content.split()), 20)   # max_tokens клиента
+        self.assertEqual(result.usage_metadata["output_tokens"], 20)
+        self.assertEqual(self.server.stats.requests, 1)
+        self.assertEqual(self.server.stats.models, {"mock/model": 1})
+
+    async def test_streaming(self):
+        llm = await self.start(per_token=0.001)
+        chunks = [chunk.content async for chunk in llm.astream("Вопрос") if chunk.content]
+        self.assertEqual(len(chunks), 20)
+        self.assertEqual(self.server.stats.streamed, 1)
+
+    async def test_orchestrator_routes_by_keywords(self):
+        llm = await self.start()
+        system = SystemMessage(content="Ты — Оркестратор системы принятия решений.")
+        self.assertEqual((await llm.ainvoke([system, HumanMessage(content="Привет!")])).content, "CHITCHAT")
+        self.assertEqual((await llm.ainvoke([system, HumanMessage(content="Как поднять продажи?")])).content, "SOLVER")
+
+    async def test_latency_and_errors(self):
+        llm = await self.start(ttft=LatencyDistribution("fixed", 0.2))
+        start = time.perf_counter()
+        await llm.ainvoke("Вопрос")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+
+        self.server.config.error_rate = 1.0
+        with self.assertRaises(openai.InternalServerError):
+            await llm.ainvoke("Вопрос")
+        self.server.config.error_rate, self.server.config.rate_limit_rate = 0.0, 1.0
+        with self.assertRaises(openai.RateLimitError):
+            await llm.ainvoke("Вопрос")
+        self.assertEqual((self.server.stats.errors, self.server.stats.rate_limited), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+import unittest
+import unittest.mock
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from langchain_core.runnables import RunnableLambda
+
+import engine
+from model_registry import ModelRegistry, RoleModelConfig
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_tiered_defaults(self):
+        registry = ModelRegistry.tiered(strong="strong", fast="fast")
+        self.assertEqual(registry.get("ORCHESTRATOR").model, "fast")
+        self.assertEqual(registry.get("ORCHESTRATOR").temperature, 0.0)
+        self.assertEqual(registry.get("POST_MORTEM").model, "fast")
+        self.assertEqual(registry.get("TRIZ").model, "strong")
+        self.assertEqual(registry.get("SYNTHESIZER").model, "strong")
+        self.assertEqual(registry.get("UNKNOWN").model, "strong")
+
+    def test_single(self):
+        registry = ModelRegistry.single("only")
+        self.assertEqual(registry.models(), ["only"])
+        self.assertEqual(registry.get("ORCHESTRATOR").temperature, 0.7)
+        self.assertEqual(registry.get("SYNTHESIZER").max_tokens, 600)
+
+    def test_env_overrides_json(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"TRIZ": {"model": "json-model", "max_tokens": 100, "timeout": None},
+                       "SYSTEM": {"temperature": 0.2}}, f)
+        self.addCleanup(os.unlink, f.name)
+        environ = {"LLM_MODEL_TRIZ": "env-model", "LLM_MAX_TOKENS_CRITIC": "50"}
+
+        registry = ModelRegistry.from_env(strong="strong", fast="fast", config_path=f.name, environ=environ)
+        self.assertEqual(registry.get("TRIZ"), RoleModelConfig(model="env-model", max_tokens=100))
+        self.assertEqual(registry.get("SYSTEM"), RoleModelConfig(model="strong", temperature=0.2, max_tokens=200))
+        self.assertEqual(registry.get("CRITIC").invoke_kwargs(), {"temperature": 0.7, "max_tokens": 50})
+
+
+class TestEngineRoleModels(unittest.TestCase):
+    def setUp(self):
+        self.orig_registry = engine.model_registry
+        self.addCleanup(setattr, engine, "model_registry", self.orig_registry)
+        self.addCleanup(engine._role_models.clear)
+
+    def test_roles_share_models_and_bind_params(self):
+        engine.model_registry = ModelRegistry.tiered(strong=engine.MODEL_NAME, fast="fast-model")
+        orchestrator = engine.llm_for_role("ORCHESTRATOR")
+        post_mortem = engine.llm_for_role("POST_MORTEM")
+        triz = engine.llm_for_role("TRIZ")
+
+        self.assertEqual(orchestrator.bound.model_name, "fast-model")
+        self.assertIs(orchestrator.bound, post_mortem.bound)  # один клиент на модель
+        self.assertIs(triz.bound, engine.llm)
+        self.assertEqual(orchestrator.kwargs, {"temperature": 0.0, "max_tokens": 8})
+
+    def test_mock_llm_is_not_bound(self):
+        mock = RunnableLambda(lambda x: x)
+        with unittest.mock.patch.object(engine, "llm", mock):
+            engine.model_registry = ModelRegistry.single(engine.MODEL_NAME)
+            self.assertIs(engine.llm_for_role("SYNTHESIZER"), mock)
+
+    def test_prompt_chains_rebuilt_on_registry_change(self):
+        engine.model_registry = ModelRegistry.single(engine.MODEL_NAME)
+        before = engine.prompt_chains.get("ORCHESTRATOR")
+        engine.model_registry = ModelRegistry.tiered(strong=engine.MODEL_NAME, fast="fast-model")
+        self.assertIsNot(engine.prompt_chains.get("ORCHESTRATOR"), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import gzip
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+
+import engine
+from model_registry import ModelRegistry
+from search_cache import SearchCache
+from replay import Recorder, Replayer, load_session
+
+CONVERSATIONS = {
+    "alice": ["Как монетизировать телеграм бота?", "А если аудитория маленькая?"],
+    "bob": ["Как снизить отток клиентов в SaaS?"],
+}
+LLM_LATENCY = 0.05
+
+
+async def live_llm(prompt):
+    # "Сеть": по системному промпту понимаем роль, отвечаем с задержкой
+    system = prompt.to_messages()[0].content
+    await asyncio.sleep(LLM_LATENCY)
+    if "Оркестратор" in system:
+        return AIMessage(content="SOLVER")
+    return AIMessage(content=f"Ответ на {len(prompt.to_string())} символов. **ИТОГ**")
+
+
+class FakeBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, query: str) -> str:
+        self.calls += 1
+        return f"Title: {query[:20]}\nSnippet: live result"
+
+
+async def broken_llm(prompt):
+    raise AssertionError("replay must not call the LLM")
+
+
+class TestRecordReplay(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "session.jsonl.gz")
+        self.backend = FakeBackend()
+        patches = [
+            # Все роли через engine.llm, чтобы подменить "сеть" одним объектом
+            patch.object(engine, "model_registry", ModelRegistry.single(engine.MODEL_NAME)),
+            patch.object(engine, "llm", RunnableLambda(live_llm)),
+            patch.object(engine.search, "backend", self.backend),
+            patch.object(engine.search, "cache", SearchCache()),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def graph(self):
+        return engine.get_graph(checkpointer=MemorySaver(), fast_path=False, compact=False)
+
+    async def record(self):
+        graph = self.graph()
+        verdicts = {}
+        recorder = Recorder(self.path)
+        recorder.install(engine)
+        try:
+            for thread_id, queries in CONVERSATIONS.items():
+                for query in queries:
+                    recorder.record_turn(thread_id, query)
+                    state = await graph.ainvoke({"messages": [HumanMessage(content=query)], "user_query": query},
+                                                {"configurable": {"thread_id": thread_id}})
+                    verdicts[(thread_id, query)] = state["final_verdict"]
+        finally:
+            recorder.close()
+        return verdicts
+
+    def fresh_search_cache(self):
+        engine.search.cache = SearchCache()
+
+    async def test_session_file_is_compact(self):
+        await self.record()
+        events = load_session(self.path)
+        kinds = [e["kind"] for e in events]
+        self.assertEqual(kinds.count("turn"), 3)
+        # На ход: оркестратор, 3 солвера, синтезатор
+        self.assertEqual(kinds.count("llm"), 15)
+        self.assertEqual(kinds.count("search"), self.backend.calls)
+        self.assertEqual({e["thread"] for e in events if e["kind"] == "llm"}, {"alice", "bob"})
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            self.assertNotIn("Оркестратор системы", f.read())  # промпты не пишем
+
+    async def test_replay_without_network_reproduces_answers(self):
+        await self.record()
+        search_calls = self.backend.calls
+        self.fresh_search_cache()
+        engine.llm = RunnableLambda(broken_llm)
+
+        replayer = Replayer.from_file(self.path, latency_scale=0.0)
+        replayer.install(engine)
+        try:
+            results = await replayer.run(self.graph())
+        finally:
+            replayer.uninstall()
+
+        self.assertEqual(results["turns"], 3)
+        self.assertEqual(results["errors"], 0)
+        self.assertEqual(replayer.stats.llm_exact, 15)
+        self.assertEqual(replayer.stats.llm_missing + replayer.stats.llm_fallback, 0)
+        self.assertEqual(replayer.stats.slept_seconds, 0.0)
+        self.assertEqual(self.backend.calls, search_calls)
+        self.assertIsNot(engine.search.backend, replayer)  # uninstall вернул бэкенд
+
+    async def test_preserved_latency_and_prompt_changes(self):
+        await self.record()
+        self.fresh_search_cache()
+        # Промпт ТРИЗ поменялся после записи: ответы берутся по порядку, а не по хэшу
+        prompts = {**engine.PROMPTS, "TRIZ": engine.PROMPTS["TRIZ"] + "\nОтвечай по-новому."}
+        with patch.object(engine, "PROMPTS", prompts):
+            replayer = Replayer.from_file(self.path, latency_scale=1.0)
+            replayer.install(engine)
+            try:
+                results = await replayer.run(self.graph())
+            finally:
+                replayer.uninstall()
+
+        self.assertEqual(replayer.stats.llm_fallback, 3)
+        self.assertEqual(replayer.stats.llm_missing, 0)
+        # оркестратор + солверы (параллельно) + синтезатор — не меньше трех задержек на ход
+        self.assertGreaterEqual(results["e2e_ms"]["p50"], 3 * LLM_LATENCY * 1000)
+        self.assertGreater(replayer.stats.slept_seconds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import time
+import asyncio
+import unittest
+
+from response_cache import ResponseCache, VectorIndex
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(ttl=60, max_entries=2)
+        self.cache.put("Как монетизировать телеграм бота?", "gpt-4o", {"final_verdict": "v1"})
+
+    def test_near_duplicate_hit(self):
+        entry = self.cache.get("как монетизировать телеграмм-бота", "gpt-4o")
+        self.assertEqual(entry.values["final_verdict"], "v1")
+
+    def test_different_question_miss(self):
+        self.assertIsNone(self.cache.get("Как монетизировать телеграм канал?", "gpt-4o"))
+        self.assertIsNone(self.cache.get("Как нанять разработчиков?", "gpt-4o"))
+        # Почти тот же текст, но другие числа или отрицание — другой вопрос
+        for stored, asked in (("Как увеличить продажи на 10%", "Как увеличить продажи на 50%"),
+                              ("Стоит ли запускать подписку за 100 рублей", "Стоит ли запускать подписку за 900 рублей"),
+                              ("Как нанять 5 разработчиков", "Как нанять 50 разработчиков"),
+                              ("Стоит ли поднимать цены на подписку", "Стоит ли не поднимать цены на подписку")):
+            cache = ResponseCache(ttl=60)
+            cache.put(stored, "gpt-4o", {"final_verdict": "v"})
+            self.assertIsNone(cache.get(asked, "gpt-4o"), asked)
+            self.assertIsNotNone(cache.get(stored.lower() + "?", "gpt-4o"), stored)
+
+    def test_model_is_part_of_key(self):
+        self.assertIsNone(self.cache.get("Как монетизировать телеграм бота?", "claude"))
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=0.01)
+        cache.put("вопрос про маркетинг", "m", {"final_verdict": "v"})
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("вопрос про маркетинг", "m"))
+        self.assertEqual(len(cache), 0)
+
+    def test_size_limit(self):
+        self.cache.put("вопрос про маркетинг", "gpt-4o", {})
+        self.cache.put("вопрос про найм", "gpt-4o", {})
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("Как монетизировать телеграм бота?", "gpt-4o"))
+        self.assertEqual(self.cache.stats.evictions, 1)
+
+    def test_vector_backend(self):
+        vectors = {"деньги с бота": [1.0, 0.1], "заработок на боте": [0.98, 0.12], "найм": [0.0, 1.0],
+                   "заработок на 2 ботах": [0.98, 0.12]}
+        cache = ResponseCache(index=VectorIndex(vectors.__getitem__, min_similarity=0.95))
+        cache.put("деньги с бота", "m", {"final_verdict": "v"})
+        self.assertIsNotNone(cache.get("заработок на боте", "m"))
+        self.assertIsNone(cache.get("найм", "m"))
+        self.assertIsNone(cache.get("заработок на 2 ботах", "m"))
+
+
+class TestVectorIndexAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_embed_runs_off_loop_and_outside_lock(self):
+        def slow_embed(text):
+            # "Сетевой" эмбеддер: не должен держать ни event loop, ни блокировку кэша
+            self.assertFalse(cache._lock.locked())
+            time.sleep(0.2)
+            return [1.0, 0.0]
+
+        cache = ResponseCache(index=VectorIndex(slow_embed))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await cache.aput("деньги с бота", "m", {"final_verdict": "v"})
+        entry = await cache.aget("заработок на боте", "m")
+        task.cancel()
+        self.assertEqual(entry.values["final_verdict"], "v")
+        self.assertGreater(ticks, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
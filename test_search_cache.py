@@ -0,0 +1,125 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from search_cache import SearchCache, CachedSearch, normalize_query
+
+
+class CountingBackend:
+    def __init__(self, delay: float = 0.0, result: str = "Title: x", release: threading.Event = None):
+        self.calls = 0
+        self.delay = delay
+        self.result = result
+        self.release = release
+        self._lock = threading.Lock()
+
+    def invoke(self, query: str) -> str:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.release is not None:
+            self.release.wait()
+        return self.result
+
+
+class LateCache(SearchCache):
+    """Первый get промахивается, хотя запись уже есть: ведущий записал кэш сразу после нашей проверки."""
+
+    def __init__(self):
+        super().__init__(ttl=60, max_entries=10, db_path="")
+        self.raced = False
+
+    def get(self, key, count=True):
+        if count and not self.raced:
+            self.raced = True
+            self.stats.misses += 1
+            return None
+        return super().get(key, count)
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_normalized_keys_hit(self):
+        backend = CountingBackend()
+        search = CachedSearch(backend, SearchCache(ttl=60, max_entries=10, db_path=""))
+        search.invoke("Инверсия: платить за НЕ использование!")
+        search.invoke("  инверсия платить за не   использование ")
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(search.stats.hits, 1)
+        self.assertEqual(search.stats.misses, 1)
+        self.assertEqual(normalize_query("A,  b!"), "a b")
+
+    def test_ttl_expires(self):
+        cache = SearchCache(ttl=0.01, max_entries=10, db_path="")
+        cache.set("k", "v")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("k"))
+
+    def test_lru_eviction(self):
+        cache = SearchCache(ttl=60, max_entries=2, db_path="")
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_errors_not_cached(self):
+        backend = CountingBackend(result="Search Error: timeout")
+        search = CachedSearch(backend, SearchCache(ttl=60, max_entries=10, db_path=""))
+        search.invoke("q")
+        search.invoke("q")
+        self.assertEqual(backend.calls, 2)
+
+    def test_single_flight(self):
+        backend = CountingBackend(delay=0.1)
+        search = CachedSearch(backend, SearchCache(ttl=60, max_entries=10, db_path=""))
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(search.invoke, ["same query"] * 5))
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(set(results), {"Title: x"})
+
+    def test_follower_wait_is_bounded(self):
+        """Зависший ведущий не держит ведомых дольше wait_timeout."""
+        release = threading.Event()
+        backend = CountingBackend(release=release)
+        search = CachedSearch(backend, SearchCache(ttl=60, max_entries=10, db_path=""), wait_timeout=0.05)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(search.invoke, "same query")
+            while backend.calls == 0:
+                time.sleep(0.005)
+            start = time.perf_counter()
+            follower = search.invoke("same query")
+            self.assertLess(time.perf_counter() - start, 1)
+            release.set()
+            self.assertEqual(leader.result(), "Title: x")
+        self.assertTrue(follower.startswith("Search Error:"))
+        self.assertEqual(search.stats.flight_timeouts, 1)
+
+    def test_new_leader_rechecks_cache(self):
+        cache = LateCache()
+        cache.set("same query", "cached")
+        backend = CountingBackend()
+        search = CachedSearch(backend, cache)
+        self.assertEqual(search.invoke("same query"), "cached")
+        self.assertEqual(backend.calls, 0)
+        self.assertEqual(cache.stats.misses, 1)
+
+    def test_sqlite_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "search.db")
+            cache = SearchCache(ttl=60, max_entries=10, db_path=path)
+            cache.set("k", "v")
+            cache.close()
+
+            warm = SearchCache(ttl=60, max_entries=10, db_path=path)
+            self.assertEqual(warm.get("k"), "v")
+            self.assertEqual(warm.stats.disk_hits, 1)
+            warm.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
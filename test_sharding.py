@@ -0,0 +1,99 @@
+import unittest
+from collections import Counter
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from aiogram import Bot, Dispatcher
+
+from sharding import ShardRouter, jump_hash, shard_for_update, update_user_id
+from webhook import WebhookServer
+
+
+def message_update(update_id: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": "U"}
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 1760000000, "text": "hi",
+                                                "chat": {**user, "type": "private"}, "from": user}}
+
+
+class TestShardHashing(unittest.TestCase):
+    def test_jump_hash_is_stable_and_balanced(self):
+        shards = [jump_hash(uid, 4) for uid in range(10_000)]
+        self.assertEqual(shards, [jump_hash(uid, 4) for uid in range(10_000)])
+        counts = Counter(shards)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        self.assertTrue(all(2200 < c < 2800 for c in counts.values()), counts)
+
+    def test_adding_worker_moves_few_users(self):
+        moved = sum(jump_hash(uid, 4) != jump_hash(uid, 5) for uid in range(10_000))
+        # ~1/5 пользователей переезжает на новый воркер, остальные остаются на месте
+        self.assertLess(moved, 2500)
+        self.assertTrue(all(jump_hash(uid, 5) == 4 for uid in range(10_000) if jump_hash(uid, 4) != jump_hash(uid, 5)))
+
+    def test_user_id_from_update_types(self):
+        self.assertEqual(update_user_id(message_update(1, 42)), 42)
+        self.assertEqual(update_user_id({"update_id": 2, "callback_query": {"id": "q", "from": {"id": 7}}}), 7)
+        self.assertEqual(update_user_id({"update_id": 3, "poll_answer": {"poll_id": "p", "user": {"id": 9}}}), 9)
+        self.assertIsNone(update_user_id({"update_id": 4}))
+        self.assertEqual(shard_for_update({"update_id": 4}, 8), 0)
+
+
+class TestShardRouter(unittest.IsolatedAsyncioTestCase):
+    async def start_worker(self, index: int):
+        seen = []
+
+        async def handle(request: web.Request):
+            self.assertEqual(request.headers.get("X-Telegram-Bot-Api-Secret-Token"), "inner")
+            seen.append(await request.json())
+            return web.Response(status=200)
+
+        app = web.Application()
+        app.router.add_post("/webhook", handle)
+        server = TestServer(app)
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        return str(server.make_url("/webhook")), seen
+
+    async def test_routes_each_user_to_one_worker(self):
+        workers = [await self.start_worker(i) for i in range(3)]
+        router = ShardRouter([url for url, _ in workers], secret="outer", worker_secret="inner")
+        client = TestClient(TestServer(router.build_app()))
+        await client.start_server()
+        self.addAsyncCleanup(client.close)
+
+        for i in range(60):
+            resp = await client.post("/webhook", json=message_update(i, 100 + i % 12),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "outer"})
+            self.assertEqual(resp.status, 200)
+        self.assertEqual((await client.post("/webhook", json=message_update(99, 1))).status, 401)
+
+        for index, (_, seen) in enumerate(workers):
+            users = {update_user_id(u) for u in seen}
+            self.assertTrue(all(jump_hash(uid, 3) == index for uid in users))
+            # Порядок апдейтов одного пользователя сохраняется
+            ids = [u["update_id"] for u in seen]
+            self.assertEqual(ids, sorted(ids))
+        self.assertEqual(sum(router.stats.per_worker), 60)
+
+    async def test_unreachable_worker_is_503(self):
+        router = ShardRouter(["http://127.0.0.1:1/webhook"], timeout=1)
+        self.addAsyncCleanup(router.aclose)
+        self.assertEqual(await router.forward(message_update(1, 5)), 503)
+        self.assertEqual(router.stats.rejected, 1)
+
+    async def test_worker_rejects_foreign_users(self):
+        bot = Bot(token="123456:TEST-TOKEN-NOT-USED")
+        self.addAsyncCleanup(bot.session.close)
+        server = WebhookServer(Dispatcher(), bot, webhook_url="", shard=(0, 2))
+        client = TestClient(TestServer(server.build_app()))
+        await client.start_server()
+        self.addAsyncCleanup(client.close)
+
+        own = next(uid for uid in range(1, 100) if jump_hash(uid, 2) == 0)
+        foreign = next(uid for uid in range(1, 100) if jump_hash(uid, 2) == 1)
+        self.assertEqual((await client.post("/webhook", json=message_update(1, own))).status, 200)
+        self.assertEqual((await client.post("/webhook", json=message_update(2, foreign))).status, 421)
+        self.assertEqual(server.stats.misrouted, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-mock-key")
+
+import engine
+from token_budget import Tokenizer, TokenBudget, TRUNCATION_MARK
+
+
+class OfflineTokenizer(Tokenizer):
+    """Без словаря tiktoken — оценка по символам, как в офлайн-окружении."""
+
+    def __init__(self):
+        super().__init__()
+        self._failed = True
+
+
+class TestTokenBudget(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = OfflineTokenizer()
+
+    def test_short_input_untouched(self):
+        budget = TokenBudget(input_tokens=100, tokenizer=self.tokenizer, environ={})
+        data = {"input": "Как дела?", "n": 3}
+        self.assertEqual(budget.fit("TRIZ", data), data)
+        self.assertEqual(budget.stats.as_dict(), {})
+
+    def test_long_input_truncated_keeps_head_and_tail(self):
+        budget = TokenBudget(input_tokens=300, tokenizer=self.tokenizer, environ={})
+        long_text = "начало " + "слово " * 1000 + "вопрос?"  # кейс из stress_tester_v2
+        fitted = budget.fit("TRIZ", {"input": long_text})["input"]
+
+        self.assertIn(TRUNCATION_MARK, fitted)
+        self.assertTrue(fitted.startswith("начало"))
+        self.assertTrue(fitted.endswith("вопрос?"))
+        self.assertLessEqual(self.tokenizer.count(fitted), 300 + self.tokenizer.count(TRUNCATION_MARK) + 2)
+        self.assertEqual(budget.stats.roles["TRIZ"].truncated, 1)
+
+    def test_per_role_limit_from_env(self):
+        budget = TokenBudget(input_tokens=300, tokenizer=self.tokenizer,
+                             environ={"LLM_INPUT_TOKENS_SYNTHESIZER": "1000"})
+        self.assertEqual(budget.limit_for("SYNTHESIZER"), 1000)
+        self.assertEqual(budget.limit_for("TRIZ"), 300)
+
+
+class TestTokenizerWarm(unittest.IsolatedAsyncioTestCase):
+    async def test_slow_download_falls_back_without_blocking(self):
+        downloaded = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def slow_get_encoding(name):
+            time.sleep(0.3)   # requests.get без таймаута при закрытом egress
+            loop.call_soon_threadsafe(downloaded.set)
+            return "encoding"
+
+        with patch("token_budget.tiktoken", SimpleNamespace(get_encoding=slow_get_encoding)):
+            tokenizer = Tokenizer()
+            start = time.perf_counter()
+            self.assertFalse(await tokenizer.warm(timeout=0.05))
+            self.assertLess(time.perf_counter() - start, 0.2)
+            # Пока словаря нет — оценка по символам, без повторной загрузки в event loop
+            start = time.perf_counter()
+            self.assertEqual(tokenizer.count("абвгде"), 3)
+            self.assertLess(time.perf_counter() - start, 0.1)
+            await downloaded.wait()
+            await asyncio.sleep(0.01)
+        self.assertEqual(tokenizer._get(), "encoding")
+
+    async def test_warm_loads_encoding(self):
+        with patch("token_budget.tiktoken", SimpleNamespace(get_encoding=lambda name: "encoding")):
+            tokenizer = Tokenizer()
+            self.assertTrue(await tokenizer.warm())
+
+
+class TestEnginePromptAccounting(unittest.IsolatedAsyncioTestCase):
+    async def test_call_is_truncated_and_recorded(self):
+        seen = {}
+
+        async def fake_call(chain, input_data, role="", hedge_chain=None):
+            seen.update(input_data)
+            return "ok"
+
+        budget = TokenBudget(input_tokens=200, tokenizer=OfflineTokenizer(), environ={})
+        with patch.object(engine, "token_budget", budget), \
+                patch.object(engine, "_call_llm_with_retry", fake_call), \
+                self.assertLogs("engine", level="INFO") as logs:
+            await engine.call_llm_async("TRIZ", "", "слово " * 1000)
+
+        self.assertIn(TRUNCATION_MARK, seen["input"])
+        stats = budget.stats.roles["TRIZ"]
+        self.assertEqual(stats.calls, 1)
+        # Системный промпт роли тоже входит в счет
+        self.assertGreater(stats.prompt_tokens, 200)
+        self.assertIn("role=TRIZ", logs.output[0])
+        self.assertIn("max_tokens=200", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from user_tasks import UserTaskManager
+
+
+class Recorder:
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.max_running = 0
+
+    async def run(self, text: str):
+        self.started.append(text)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            self.finished.append(text)
+        finally:
+            self.running -= 1
+
+
+class TestUserTaskManager(unittest.IsolatedAsyncioTestCase):
+    async def test_cancel_policy_keeps_latest(self):
+        manager = UserTaskManager(policy="cancel")
+        rec = Recorder()
+        results = await asyncio.gather(*(
+            manager.submit("u1", text, rec.run) for text in ("a", "b", "c")
+        ))
+        self.assertEqual(rec.finished, ["c"])
+        self.assertEqual(results[-1], True)
+        self.assertLessEqual(rec.max_running, 1)
+        self.assertEqual(manager.active(), 0)
+
+    async def test_cancel_in_flight_run(self):
+        manager = UserTaskManager(policy="cancel")
+        rec = Recorder(delay=0.2)
+        first = asyncio.create_task(manager.submit("u1", "a", rec.run))
+        await asyncio.sleep(0.05)
+        second = await manager.submit("u1", "b", rec.run)
+        self.assertFalse(await first)
+        self.assertTrue(second)
+        self.assertEqual(rec.started, ["a", "b"])
+        self.assertEqual(rec.finished, ["b"])
+        self.assertEqual(manager.cancelled, 1)
+
+    async def test_cancel_counted_once_per_run(self):
+        """Третье сообщение, пока второе ждет лок: прогон "a" отменен один раз, "b" — вытеснен."""
+        manager = UserTaskManager(policy="cancel")
+        stopping = asyncio.Event()
+
+        async def slow_to_stop(text):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                await stopping.wait()   # прогон дописывает чекпоинт после отмены
+                raise
+
+        first = asyncio.create_task(manager.submit("u1", "a", slow_to_stop))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(manager.submit("u1", "b", slow_to_stop))
+        await asyncio.sleep(0.01)
+        third = asyncio.create_task(manager.submit("u1", "c", Recorder(delay=0).run))
+        await asyncio.sleep(0.01)
+        stopping.set()
+        self.assertEqual(await asyncio.gather(first, second, third), [False, False, True])
+        self.assertEqual(manager.cancelled, 1)
+        self.assertEqual(manager.superseded, 1)
+
+    async def test_coalesce_policy_merges_queued(self):
+        manager = UserTaskManager(policy="coalesce")
+        rec = Recorder()
+        first = asyncio.create_task(manager.submit("u1", "a", rec.run))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(*(manager.submit("u1", text, rec.run) for text in ("b", "c")))
+        await first
+        self.assertEqual(rec.finished, ["a", "b\nc"])
+        self.assertEqual(manager.coalesced, 1)
+        self.assertLessEqual(rec.max_running, 1)
+
+    async def test_users_are_independent(self):
+        manager = UserTaskManager(policy="cancel")
+        rec = Recorder()
+        await asyncio.gather(manager.submit("u1", "a", rec.run), manager.submit("u2", "b", rec.run))
+        self.assertEqual(sorted(rec.finished), ["a", "b"])
+        self.assertEqual(rec.max_running, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
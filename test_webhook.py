@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+
+from aiohttp.test_utils import TestServer, TestClient
+from aiogram import Bot, Dispatcher, types
+
+from webhook import WebhookServer
+
+# Апдейт в том виде, в каком его присылает Telegram
+RECORDED_UPDATE = {
+    "update_id": 100000001,
+    "message": {
+        "message_id": 42,
+        "date": 1760000000,
+        "chat": {"id": 555, "type": "private", "first_name": "Ivan", "username": "ivan"},
+        "from": {"id": 555, "is_bot": False, "first_name": "Ivan", "username": "ivan", "language_code": "ru"},
+        "text": "Как монетизировать телеграм бота?",
+    },
+}
+
+
+def update(update_id: int, text: str) -> dict:
+    return {**RECORDED_UPDATE, "update_id": update_id, "message": {**RECORDED_UPDATE["message"], "text": text}}
+
+
+class TestWebhookServer(unittest.IsolatedAsyncioTestCase):
+    async def start(self, handler_delay: float = 0.0, **options):
+        self.seen = []
+        self.release = asyncio.Event()
+        if not handler_delay:
+            self.release.set()
+        dp = Dispatcher()
+
+        @dp.message()
+        async def on_message(message: types.Message):
+            await self.release.wait()
+            self.seen.append(message.text)
+
+        bot = Bot(token="123456:TEST-TOKEN-NOT-USED")
+        self.server = WebhookServer(dp, bot, path="/webhook", webhook_url="", **options)
+        self.client = TestClient(TestServer(self.server.build_app()))
+        await self.client.start_server()
+        self.addAsyncCleanup(self.client.close)
+        self.addAsyncCleanup(bot.session.close)
+
+    async def wait_processed(self, n: int):
+        for _ in range(100):
+            if self.server.stats.processed >= n:
+                return
+            await asyncio.sleep(0.01)
+
+    async def test_recorded_update_reaches_handler(self):
+        await self.start()
+        resp = await self.client.post("/webhook", json=RECORDED_UPDATE)
+        self.assertEqual(resp.status, 200)
+        await self.wait_processed(1)
+        self.assertEqual(self.seen, ["Как монетизировать телеграм бота?"])
+
+    async def test_health_and_ready(self):
+        await self.start()
+        self.assertEqual((await self.client.get("/healthz")).status, 200)
+        ready = await self.client.get("/readyz")
+        self.assertEqual(ready.status, 200)
+        self.assertTrue((await ready.json())["ready"])
+        self.assertIn("epistemic_webhook_received", await (await self.client.get("/metrics")).text())
+
+    async def test_full_queue_rejects_with_503(self):
+        await self.start(handler_delay=1, workers=1, queue_size=2)
+        statuses = []
+        for i in range(5):
+            statuses.append((await self.client.post("/webhook", json=update(i, f"m{i}"))).status)
+            await asyncio.sleep(0.01)  # воркер успевает забрать первый апдейт
+        # 1 в работе + 2 в очереди, остальные — 503
+        self.assertEqual(statuses, [200, 200, 200, 503, 503])
+        self.assertEqual((await self.client.get("/readyz")).status, 503)
+
+        self.release.set()
+        await self.wait_processed(3)
+        self.assertEqual(self.seen, ["m0", "m1", "m2"])
+        self.assertEqual((await self.client.get("/readyz")).status, 200)
+
+    async def test_secret_token_required(self):
+        await self.start(secret="s3cret")
+        self.assertEqual((await self.client.post("/webhook", json=RECORDED_UPDATE)).status, 401)
+        resp = await self.client.post("/webhook", json=RECORDED_UPDATE,
+                                      headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+        self.assertEqual(resp.status, 200)
+
+    async def test_webhook_url_requires_secret(self):
+        bot = Bot(token="123456:TEST-TOKEN-NOT-USED")
+        self.addAsyncCleanup(bot.session.close)
+        with self.assertRaises(RuntimeError):
+            WebhookServer(Dispatcher(), bot, webhook_url="https://example.com", secret="")
+
+    async def test_shutdown_closes_bot_session(self):
+        await self.start()
+        closed = []
+        close = self.server.bot.session.close
+
+        async def spy_close():
+            closed.append(True)
+            await close()
+
+        self.server.bot.session.close = spy_close
+        await self.client.close()
+        self.assertEqual(closed, [True])
+
+    async def test_bad_payload(self):
+        await self.start()
+        self.assertEqual((await self.client.post("/webhook", data=b"not json")).status, 400)
+
+    async def test_shutdown_drains_queue(self):
+        await self.start(handler_delay=1, workers=1)
+        for i in range(3):
+            await self.client.post("/webhook", json=update(i, f"m{i}"))
+        asyncio.get_running_loop().call_later(0.05, self.release.set)
+        await self.client.close()
+        self.assertEqual(self.seen, ["m0", "m1", "m2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
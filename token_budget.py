@@ -0,0 +1,138 @@
+import os
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# tiktoken — опционально: без него (или без скачанных словарей) работает грубая оценка
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+# --- CONFIG ---
+LLM_INPUT_TOKENS = int(os.getenv("LLM_INPUT_TOKENS", "1500"))  # на одну переменную промпта (запрос, контекст, фидбек)
+TRUNCATION_MARK = "\n…[обрезано]…\n"
+# Символов на токен для оценки без токенизатора: для кириллицы ~3, для латиницы ~4
+FALLBACK_CHARS_PER_TOKEN = 3
+# Сколько ждать загрузку словаря tiktoken на старте (он качается requests.get без таймаута)
+TOKENIZER_WARM_TIMEOUT = float(os.getenv("TOKENIZER_WARM_TIMEOUT", "10"))
+
+
+class Tokenizer:
+    """Подсчет токенов через tiktoken с ленивой загрузкой кодировки и откатом на оценку по символам."""
+
+    def __init__(self, encoding_name: str = "o200k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._failed = tiktoken is None
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        return self._get() is not None
+
+    def _get(self):
+        if self._encoding is None and not self._failed:
+            with self._lock:
+                if self._encoding is None and not self._failed:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception:
+                        # Словарь не скачивается (офлайн) — больше не пытаемся
+                        self._failed = True
+        return self._encoding
+
+    async def warm(self, timeout: float = TOKENIZER_WARM_TIMEOUT) -> bool:
+        """
+        Загружает словарь в потоке на старте бота, чтобы первый count() не качал его
+        в event loop. Не успели за timeout — работаем на оценке по символам; если загрузка
+        все же завершится в фоне, точный подсчет включится сам. True — словарь загружен.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(self._get), timeout) is not None
+        except asyncio.TimeoutError:
+            self._failed = True
+            return False
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = self._get()
+        if encoding is None:
+            return len(text) // FALLBACK_CHARS_PER_TOKEN + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Оставляет начало и конец текста (в конце обычно сам вопрос), середину вырезает."""
+        if self.count(text) <= max_tokens:
+            return text
+        head_tokens = max_tokens * 2 // 3
+        tail_tokens = max_tokens - head_tokens
+        encoding = self._get()
+        if encoding is None:
+            head = text[:head_tokens * FALLBACK_CHARS_PER_TOKEN]
+            tail = text[-tail_tokens * FALLBACK_CHARS_PER_TOKEN:] if tail_tokens else ""
+        else:
+            tokens = encoding.encode(text, disallowed_special=())
+            head = encoding.decode(tokens[:head_tokens])
+            tail = encoding.decode(tokens[-tail_tokens:]) if tail_tokens else ""
+        return head + TRUNCATION_MARK + tail
+
+
+@dataclass
+class RoleTokenStats:
+    calls: int = 0
+    prompt_tokens: int = 0
+    max_prompt_tokens: int = 0
+    truncated: int = 0
+
+
+@dataclass
+class TokenStats:
+    roles: Dict[str, RoleTokenStats] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Dict[str, int]]:
+        return {role: vars(s).copy() for role, s in sorted(self.roles.items())}
+
+
+class TokenBudget:
+    """
+    Бюджет входа: каждая строковая переменная промпта обрезается до `input_tokens`
+    (LLM_INPUT_TOKENS или LLM_INPUT_TOKENS_<ROLE>). Считает размер промптов по ролям.
+    """
+
+    def __init__(self, input_tokens: int = LLM_INPUT_TOKENS, tokenizer: Optional[Tokenizer] = None,
+                 environ=os.environ):
+        self.input_tokens = input_tokens
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer()
+        self.stats = TokenStats()
+        self._environ = environ
+        self._lock = threading.Lock()
+
+    def limit_for(self, role: str) -> int:
+        value = self._environ.get(f"LLM_INPUT_TOKENS_{role}")
+        return int(value) if value else self.input_tokens
+
+    def fit(self, role: str, input_data: Dict[str, object]) -> Dict[str, object]:
+        limit = self.limit_for(role)
+        fitted = {}
+        truncated = 0
+        for name, value in input_data.items():
+            if isinstance(value, str) and len(value) > limit:  # короче limit символов — точно влезает
+                cut = self.tokenizer.truncate(value, limit)
+                if cut is not value:
+                    truncated += 1
+                value = cut
+            fitted[name] = value
+        if truncated:
+            with self._lock:
+                self.stats.roles.setdefault(role, RoleTokenStats()).truncated += truncated
+        return fitted
+
+    def record(self, role: str, prompt_tokens: int):
+        with self._lock:
+            s = self.stats.roles.setdefault(role, RoleTokenStats())
+            s.calls += 1
+            s.prompt_tokens += prompt_tokens
+            s.max_prompt_tokens = max(s.max_prompt_tokens, prompt_tokens)
@@ -0,0 +1,96 @@
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# --- CONFIG ---
+# cancel   — новое сообщение отменяет прогон, который еще идет
+# coalesce — сообщения, пришедшие во время прогона, склеиваются в один следующий запрос
+USER_QUEUE_POLICY = os.getenv("USER_QUEUE_POLICY", "cancel")
+
+POLICY_CANCEL = "cancel"
+POLICY_COALESCE = "coalesce"
+
+
+class _UserSlot:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.pending: List[str] = []
+        self.waiting = False   # coalesce: кто-то уже ждет лок, чтобы забрать pending
+        self.generation = 0    # cancel: номер последнего сообщения
+        self.users = 0         # сколько submit() сейчас держат слот
+
+
+class UserTaskManager:
+    """
+    Сериализует прогоны графа по thread_id: у одного пользователя в любой момент
+    не больше одного прогона, поэтому нет гонок записи в чекпоинт и лишних трат токенов.
+    """
+
+    def __init__(self, policy: str = USER_QUEUE_POLICY):
+        if policy not in (POLICY_CANCEL, POLICY_COALESCE):
+            raise ValueError(f"Unknown USER_QUEUE_POLICY: {policy}")
+        self.policy = policy
+        self._slots: Dict[str, _UserSlot] = {}
+        self.cancelled = 0     # прогоны, получившие cancel()
+        self.superseded = 0    # сообщения, не дождавшиеся своего прогона (пришло более новое)
+        self.coalesced = 0
+
+    async def submit(self, thread_id: str, text: str, run: Callable[[str], Awaitable]) -> bool:
+        """
+        Запускает run(text) в очереди пользователя. Возвращает False, если сообщение
+        не было обработано отдельным прогоном (отменено более новым или склеено с другими).
+        """
+        slot = self._slots.setdefault(thread_id, _UserSlot())
+        slot.users += 1
+        try:
+            if self.policy == POLICY_COALESCE:
+                return await self._submit_coalesce(slot, text, run)
+            return await self._submit_cancel(slot, text, run)
+        finally:
+            slot.users -= 1
+            if slot.users == 0:
+                self._slots.pop(thread_id, None)
+
+    async def _submit_cancel(self, slot: _UserSlot, text: str, run) -> bool:
+        slot.generation += 1
+        generation = slot.generation
+        # Прогон, уже получивший cancel() от прошлого сообщения, второй раз не считаем
+        if slot.task is not None and not slot.task.done() and not slot.task.cancelling():
+            slot.task.cancel()
+            self.cancelled += 1
+
+        async with slot.lock:
+            if generation != slot.generation:
+                # Пока ждали, пришло сообщение новее — этот запрос уже неактуален
+                self.superseded += 1
+                return False
+            return await self._run(slot, text, run)
+
+    async def _submit_coalesce(self, slot: _UserSlot, text: str, run) -> bool:
+        slot.pending.append(text)
+        if slot.waiting:
+            self.coalesced += 1
+            return False
+
+        slot.waiting = True
+        async with slot.lock:
+            slot.waiting = False
+            batch, slot.pending = slot.pending, []
+            return await self._run(slot, "\n".join(batch), run)
+
+    async def _run(self, slot: _UserSlot, text: str, run) -> bool:
+        slot.task = asyncio.create_task(run(text))
+        try:
+            await slot.task
+            return True
+        except asyncio.CancelledError:
+            # Отменили прогон (новое сообщение) — это штатно. Отмену самого хендлера пробрасываем.
+            if asyncio.current_task().cancelling():
+                raise
+            return False
+        finally:
+            slot.task = None
+
+    def active(self) -> int:
+        return len(self._slots)
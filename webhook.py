@@ -0,0 +1,189 @@
+import os
+import hmac
+import signal
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from sharding import BOT_WORKERS, BOT_WORKER_ID, SECRET_HEADER, shard_for_update
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIG ---
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")              # публичный https-адрес; пусто = setWebhook не вызываем
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")        # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))       # апдейтов в обработке одновременно
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "200"))  # принятых, но еще не взятых в работу
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))  # секунд на дообработку при остановке
+
+
+def check_webhook_secret(webhook_url: str, secret: str):
+    """
+    Без секрета любой, кто знает адрес, может прислать поддельный апдейт от имени
+    любого пользователя — регистрировать такой webhook у Telegram нельзя.
+    """
+    if webhook_url and not secret:
+        raise RuntimeError("WEBHOOK_URL is set but WEBHOOK_SECRET is empty: refusing to register "
+                           "an unauthenticated webhook (set WEBHOOK_SECRET, e.g. `openssl rand -hex 32`)")
+
+
+@dataclass
+class WebhookStats:
+    received: int = 0
+    processed: int = 0
+    rejected: int = 0       # очередь полна — Telegram повторит доставку
+    unauthorized: int = 0
+    bad_requests: int = 0
+    failed: int = 0
+    misrouted: int = 0      # апдейт чужого шарда (кластер с BOT_WORKERS > 1)
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class WebhookServer:
+    """
+    Webhook-режим бота на aiohttp: POST с апдейтом сразу получает 200, апдейт кладется
+    в ограниченную очередь, которую разбирают `workers` воркеров (FIFO). Полная очередь ->
+    503, Telegram доставит апдейт повторно. Порядок и отмену прогонов одного пользователя
+    по-прежнему обеспечивает UserTaskManager в хендлере.
+    В кластере (shard=(i, N)) принимаются только апдейты своих пользователей: состояние
+    пользователя никогда не трогают два воркера сразу, даже если роутер ошибся.
+    /healthz — процесс жив; /readyz — стартовал и не перегружен (для балансировщика);
+    /metrics — Prometheus (см. metrics.py).
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH,
+                 secret: str = WEBHOOK_SECRET, workers: int = WEBHOOK_WORKERS,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+                 webhook_url: str = WEBHOOK_URL, shard: Optional[Tuple[int, int]] = None):
+        check_webhook_secret(webhook_url, secret)
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.drain_timeout = drain_timeout
+        self.webhook_url = webhook_url
+        self.workers = max(1, workers)
+        if shard is None and BOT_WORKERS > 1:
+            shard = (BOT_WORKER_ID, BOT_WORKERS)
+        self.shard = shard
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = WebhookStats()
+        self.ready = False
+        self._workers: List[asyncio.Task] = []
+        metrics.register_stats("webhook", lambda: {**self.stats.as_dict(), "queue_depth": self.queue.qsize()},
+                               gauges=("queue_depth",))
+
+    # --- HTTP ---
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/readyz", self.handle_ready)
+        app.router.add_get("/metrics", metrics.metrics_handler)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.stats.unauthorized += 1
+            return web.Response(status=401)
+        if not self.ready:
+            return web.Response(status=503)
+        try:
+            payload = await request.json()
+            update = Update.model_validate(payload, context={"bot": self.bot})
+        except Exception as e:
+            self.stats.bad_requests += 1
+            logger.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+        if self.shard and shard_for_update(payload, self.shard[1]) != self.shard[0]:
+            self.stats.misrouted += 1
+            return web.Response(status=421)
+
+        self.stats.received += 1
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response(status=200)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        ok = self.ready and not self.queue.full()
+        return web.json_response({"ready": ok, "queue_depth": self.queue.qsize(), **self.stats.as_dict()},
+                                 status=200 if ok else 503)
+
+    # --- WORKERS ---
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.stats.processed += 1
+            except Exception as e:
+                self.stats.failed += 1
+                logger.error(f"Update {update.update_id} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _on_startup(self, app: web.Application):
+        await self.dispatcher.emit_startup(bot=self.bot, dispatcher=self.dispatcher)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.webhook_url:
+            await self.bot.set_webhook(self.webhook_url.rstrip("/") + self.path,
+                                       secret_token=self.secret,
+                                       allowed_updates=self.dispatcher.resolve_used_update_types())
+        self.ready = True
+        logger.info(f"Webhook server ready: {self.workers} workers on {self.path}")
+
+    async def _on_shutdown(self, app: web.Application):
+        # Новые апдейты не принимаем (503), принятые дообрабатываем не дольше drain_timeout
+        self.ready = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Webhook drain timed out, dropping {self.queue.qsize()} updates")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        try:
+            await self.dispatcher.emit_shutdown(bot=self.bot, dispatcher=self.dispatcher)
+        finally:
+            # Как start_polling: HTTP-сессия бота закрывается вместе с сервером
+            await self.bot.session.close()
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    server = WebhookServer(dispatcher, bot)
+    runner = web.AppRunner(server.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Webhook mode: listening on {host}:{port}{server.path}")
+    # SIGTERM (docker stop, cluster.py) — та же мягкая остановка с дообработкой очереди, что и Ctrl+C
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()